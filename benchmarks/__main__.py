@@ -0,0 +1,112 @@
+""" Run the benchmark suite, optionally saving or comparing against a baseline:
+
+        python -m benchmarks                        # run everything
+        python -m benchmarks tlv cap -k marshal     # filter by module and name
+        python -m benchmarks --save release-1.0     # save to baselines/release-1.0.json
+        python -m benchmarks --compare release-1.0  # report changes against it
+
+    When comparing, the exit status is 1 if any benchmark is slower than the baseline
+    by more than the threshold. Timings are only comparable on the same machine, so
+    baselines should be recorded on the machine used for the comparison.
+
+    baselines/reference.json holds results for the whole default suite, recorded when
+    the suite was added, for a rough idea of the expected timings. Record a fresh
+    baseline with --save before making a change, and compare against that.
+
+    The startup benchmarks launch a new interpreter for every run, so they are slow
+    and are only run when named explicitly. The bulk benchmarks, and the batch CAP
+    benchmark, need NumPy: they are skipped if it isn't installed (unless the bulk
+    module is named explicitly).
+"""
+import argparse
+import importlib
+import os
+import sys
+from .harness import available, run, save_results, load_results, compare
+
+MODULES = ["tlv", "bulk", "cap", "apdu", "card"]
+OPTIONAL_MODULES = ["startup"]
+# Modules which need a package which isn't a dependency of emv
+REQUIRES = {"bulk": "numpy"}
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+
+def baseline_path(name):
+    """Baselines can be given as a path to a JSON file, or by name."""
+    if name.endswith(".json"):
+        return name
+    return os.path.join(BASELINE_DIR, name + ".json")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument(
+        "modules",
+        nargs="*",
+        metavar="MODULE",
+        help="benchmark modules to run: %s (default: all but startup)"
+        % ", ".join(MODULES + OPTIONAL_MODULES),
+    )
+    parser.add_argument(
+        "-k", dest="keyword", help="only run benchmarks whose name contains KEYWORD"
+    )
+    parser.add_argument("--save", metavar="BASELINE", help="save results as a baseline")
+    parser.add_argument(
+        "--compare", metavar="BASELINE", help="compare results against a baseline"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=25,
+        metavar="PERCENT",
+        help="slowdown reported as a regression when comparing (default 25%%)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="number of timing runs (default 5)"
+    )
+    args = parser.parse_args(argv)
+    for module in args.modules:
+        if module not in MODULES + OPTIONAL_MODULES:
+            parser.error("unknown benchmark module: %s" % module)
+
+    baseline = None
+    if args.compare is not None:
+        # Fail early, rather than after running the benchmarks
+        baseline = load_results(baseline_path(args.compare))
+
+    benchmarks = {}
+    for module in args.modules or MODULES:
+        requires = REQUIRES.get(module)
+        if requires is not None and not args.modules:
+            if not available(requires):
+                print(
+                    "Skipping %s benchmarks: %s is not installed" % (module, requires)
+                )
+                continue
+        mod = importlib.import_module(".bench_" + module, __package__)
+        benchmarks.update(mod.benchmarks())
+    if args.keyword is not None:
+        benchmarks = {k: v for k, v in benchmarks.items() if args.keyword in k}
+
+    results = run(benchmarks, repeat=args.repeat)
+
+    if args.save is not None:
+        path = baseline_path(args.save)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        save_results(path, results)
+        print("\nSaved baseline to %s" % path)
+
+    if baseline is not None:
+        regressions = compare(baseline, results, threshold=args.threshold / 100)
+        if regressions:
+            print(
+                "\n%d benchmark(s) regressed: %s"
+                % (len(regressions), ", ".join(regressions))
+            )
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+""" APDU encoding benchmarks, run with:
+
+        python -m benchmarks.bench_apdu
+
+    Compares building and encoding the commands issued by a record scan against
+    the original list-based encoder, and times decoding a 100k exchange trace,
+    and scanning it from a binary trace file.
+"""
+import atexit
+import os
+import tempfile
+from emv.protocol.command import (
+    CAPDU,
+    SelectCommand,
+    ReadCommand,
+    assert_valid_byte,
+)
+from emv.trace import decode_trace, TraceWriter, TraceReader
+from emv.test.fixtures import APP_DATA
+from .harness import main
+
+
+def legacy_marshal(capdu):
+    """The original CAPDU.marshal, which validated and concatenated lists on every call."""
+    cla, ins = CAPDU.COMMANDS.get(capdu.__class__.__name__)
+    for val in [cla, ins, capdu.p1, capdu.p2]:
+        assert_valid_byte(val)
+    cmd = [cla, ins, capdu.p1, capdu.p2]
+    if capdu.data is not None:
+        cmd += [len(capdu.data)]
+        cmd += list(capdu.data)
+    if capdu.le is not None:
+        cmd += [capdu.le]
+    return cmd
+
+
+def scan_commands():
+    """The commands issued by a full record scan (as `emvtool info` does)."""
+    return [SelectCommand("1PAY.SYS.DDF01")] + [
+        ReadCommand(record, sfi=sfi) for sfi in range(1, 31) for record in range(1, 16)
+    ]
+
+
+def large_trace(exchanges=100000):
+    """A trace of repeated record scans, with a mix of hits and misses."""
+    trace = []
+    record = bytes(APP_DATA) + b"\x90\x00"
+    for command in scan_commands():
+        if type(command) is SelectCommand:
+            trace.append((command.marshal(), b"\x6a\x82"))
+        elif command.p1 == 1:
+            trace.append((command.marshal(), record))
+        else:
+            trace.append((command.marshal(), b"\x6a\x83"))
+    return (trace * (exchanges // len(trace) + 1))[:exchanges]
+
+
+def write_trace(trace):
+    """Write a trace to a temporary binary trace file, returning its path."""
+    fd, path = tempfile.mkstemp(suffix=".trace")
+    atexit.register(os.remove, path)
+    with os.fdopen(fd, "wb") as fp:
+        writer = TraceWriter(fp)
+        for command, response in trace:
+            writer.write_command(command)
+            writer.write_response(response[:-2], response[-2], response[-1])
+    return path
+
+
+def benchmarks():
+    commands = scan_commands()
+    trace = large_trace()
+    reader = TraceReader(write_trace(trace))
+    return {
+        "apdu.scan.build": scan_commands,
+        "apdu.scan.marshal.legacy": lambda: [legacy_marshal(c) for c in commands],
+        "apdu.scan.marshal": lambda: [c.marshal() for c in commands],
+        "apdu.scan.build_marshal": lambda: [c.marshal() for c in scan_commands()],
+        "trace.decode.100k": lambda: decode_trace(trace),
+        "trace.decode.100k.commands": lambda: [CAPDU.unmarshal(c) for c, _ in trace],
+        "trace.file.exchanges.100k": lambda: list(reader.exchanges()),
+        "trace.file.filter_success.100k": lambda: list(
+            reader.exchanges(sw=(0x90, 0x00))
+        ),
+    }
+
+
+if __name__ == "__main__":
+    main(benchmarks())
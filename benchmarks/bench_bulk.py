@@ -0,0 +1,34 @@
+""" Bulk record scanning benchmarks (requires NumPy), run with:
+
+        python -m benchmarks.bench_bulk
+
+    Compares scanning an archive of READ RECORD responses with `scan_records`
+    against parsing each record with the streaming parser.
+"""
+from emv.protocol.bulk import pack_records, scan_records
+from emv.protocol.stream import iter_events
+from emv.test.fixtures import APP_DATA
+from .bench_tlv import large_fci
+from .harness import main
+
+
+def scalar_scan(buffer, offsets):
+    return [
+        event
+        for start, end in zip(offsets[:-1], offsets[1:])
+        for event in iter_events([buffer[start:end]])
+    ]
+
+
+def benchmarks():
+    records = [APP_DATA, large_fci(4)] * 5000
+    buf, offsets = pack_records(records)
+    return {
+        "bulk.scan.10k.top_level": lambda: scan_records(buf, offsets),
+        "bulk.scan.10k.descend": lambda: scan_records(buf, offsets, descend=True),
+        "bulk.scan.10k.scalar": lambda: scalar_scan(buf, offsets),
+    }
+
+
+if __name__ == "__main__":
+    main(benchmarks())
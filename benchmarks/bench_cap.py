@@ -0,0 +1,91 @@
+""" CAP value calculation benchmarks, run with:
+
+        python -m benchmarks.bench_cap
+
+    Compares the compiled IPB extraction plan against the original implementation,
+    which built the result as a string one bit at a time, and batch calculation
+    with `get_cap_values` (which requires NumPy, and is skipped without it) against
+    a loop.
+"""
+from emv.cap import get_cap_value, get_cap_values, GAC_RESPONSE_DOL, VISA_STATIC_IPB
+from emv.protocol.data import Tag
+from emv.protocol.response import RAPDU
+from emv.util import unformat_bytes
+from .harness import available, main
+
+BARCLAYS_IPB = unformat_bytes("80 00 FF 00 00 00 00 00 01 FF FF 00 00 00 00 00 00 00")
+
+RMTF1_RESPONSE = RAPDU.unmarshal(
+    unformat_bytes("80 12 80 09 5F 0F 9D 37 98 E9 3F 12 9A 06 0A 0A 03 A4 90 00 90 00")
+)
+
+RMTF2_RESPONSE = RAPDU.unmarshal(
+    unformat_bytes(
+        """77 1E 9F 27 01 80 9F 36 02 00 16 9F 26 08 29 9C C8 F1 0B 9B C8
+           30 9F 10 07 06 0B 0A 03 A4 90 00"""
+    )
+)
+
+
+def legacy_get_cap_value(response, ipb, psn):
+    if Tag.RMTF1 in response.data:
+        data = GAC_RESPONSE_DOL.unserialise(response.data[Tag.RMTF1])
+    else:
+        data = response.data[Tag.RMTF2]
+
+    resp_data = [item for sublist in data.values() for item in sublist]
+    if psn is not None:
+        resp_data = psn + resp_data
+
+    binary_string = ""
+    for i in reversed(range(0, min(len(ipb), len(resp_data)))):
+        data_number = resp_data[i]
+        ipb_number = ipb[i]
+        while ipb_number > 0:
+            if ipb_number & 1:
+                binary_string = str(data_number & 1) + binary_string
+            ipb_number >>= 1
+            data_number >>= 1
+    return int(binary_string, 2)
+
+
+def batch_responses(count=10000):
+    rmtf1 = unformat_bytes(
+        "80 12 80 09 5F 0F 9D 37 98 E9 3F 12 9A 06 0A 0A 03 A4 90 00"
+    )
+    rmtf2 = unformat_bytes(
+        """77 1E 9F 27 01 80 9F 36 02 00 16 9F 26 08 29 9C C8 F1 0B 9B C8
+           30 9F 10 07 06 0B 0A 03 A4"""
+    )
+    return [bytes(rmtf1), bytes(rmtf2)] * (count // 2)
+
+
+def benchmarks():
+    batch = batch_responses()
+    benches = {
+        "cap.rmtf1.legacy": lambda: legacy_get_cap_value(
+            RMTF1_RESPONSE, BARCLAYS_IPB, None
+        ),
+        "cap.rmtf1": lambda: get_cap_value(RMTF1_RESPONSE, BARCLAYS_IPB, None),
+        "cap.rmtf2.legacy": lambda: legacy_get_cap_value(
+            RMTF2_RESPONSE, BARCLAYS_IPB, None
+        ),
+        "cap.rmtf2": lambda: get_cap_value(RMTF2_RESPONSE, BARCLAYS_IPB, None),
+        "cap.rmtf2.visa_ipb.legacy": lambda: legacy_get_cap_value(
+            RMTF2_RESPONSE, VISA_STATIC_IPB, [0x01]
+        ),
+        "cap.rmtf2.visa_ipb": lambda: get_cap_value(
+            RMTF2_RESPONSE, VISA_STATIC_IPB, [0x01]
+        ),
+        "cap.batch.10k.loop": lambda: [
+            get_cap_value(RAPDU.unmarshal(response + b"\x90\x00"), BARCLAYS_IPB, None)
+            for response in batch
+        ],
+    }
+    if available("numpy"):
+        benches["cap.batch.10k"] = lambda: get_cap_values(batch, BARCLAYS_IPB)
+    return benches
+
+
+if __name__ == "__main__":
+    main(benchmarks())
@@ -0,0 +1,47 @@
+""" Rendering and end-to-end card benchmarks, run with:
+
+        python -m benchmarks.bench_card
+
+    Card flows are run against the in-process simulator (`emv.simulator`), so these
+    measure the cost of this library rather than of a reader or card. They send
+    every command, except for the `.cached` variant, which uses Card's response
+    cache as it is by default.
+"""
+from emv.card import Card
+from emv.protocol.data import Tag, render_element
+from emv.protocol.structures import TLV
+from emv.simulator import SimulatedCard, SimulatedConnection
+from emv.test.fixtures import APP_DATA
+from .harness import main
+
+
+def benchmarks():
+    app_data = TLV.unmarshal(APP_DATA)
+    record = app_data[Tag.RECORD]
+    elements = list(record.items())
+    card = Card(SimulatedConnection(SimulatedCard()), cache=False)
+    cached_card = Card(SimulatedConnection(SimulatedCard()))
+    rmtf1_card = Card(
+        SimulatedConnection(SimulatedCard(response_format=1, get_response=True)),
+        cache=False,
+    )
+    return {
+        "render_element.app_data": lambda: [
+            render_element(tag, value) for tag, value in elements
+        ],
+        "render_element.app_data.redact": lambda: [
+            render_element(tag, value, redact=True) for tag, value in elements
+        ],
+        "tlv.repr.app_data": lambda: repr(app_data),
+        "card.list_applications.simulated": card.list_applications,
+        "card.list_applications.simulated.cached": cached_card.list_applications,
+        "card.get_metadata.simulated": card.get_metadata,
+        "card.generate_cap_value.simulated": lambda: card.generate_cap_value("1234"),
+        "card.generate_cap_value.simulated.t0_rmtf1": lambda: rmtf1_card.generate_cap_value(
+            "1234"
+        ),
+    }
+
+
+if __name__ == "__main__":
+    main(benchmarks())
@@ -0,0 +1,90 @@
+""" emvtool cold-start benchmarks, run with:
+
+        python -m benchmarks.bench_startup
+
+    Each benchmark starts a fresh interpreter, so this measures the cost of each
+    subcommand as seen from a shell script, including the imports it defers until it
+    runs. Commands which talk to a card replay a trace recorded from the simulated
+    card (with --replay), so they run in full without a reader. `python -c pass`
+    gives the baseline interpreter startup time.
+"""
+import atexit
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from .harness import main
+
+# Commands which run without a card
+COMMANDS = [
+    ["version"],
+    ["--help"],
+]
+
+# Commands run against a replayed trace, by name
+CARD_COMMANDS = {
+    "info": ["info"],
+    "cap": ["--pin", "1234", "cap"],
+    "listapps": ["listapps"],
+    "appdata": ["appdata", "0"],
+}
+
+RUN_CLI = "import sys; from emv.command.client import run; sys.argv[1:] = %r; run()"
+
+
+def record_trace(path, args):
+    """Run an emvtool command against the simulated card, recording its exchanges
+    to a trace file."""
+    from click.testing import CliRunner
+    from emv.card import Card
+    from emv.command import client
+    from emv.simulator import SimulatedConnection
+    from emv.trace import TraceWriter, RecordingConnection
+
+    with TraceWriter(path) as writer:
+
+        def get_reader(reader, record=None, redact=False):
+            return Card(RecordingConnection(SimulatedConnection(), writer))
+
+        original = client.get_reader
+        client.get_reader = get_reader
+        try:
+            result = CliRunner().invoke(client.cli, args, obj={})
+        finally:
+            client.get_reader = original
+    if result.exit_code != 0:
+        raise RuntimeError("emvtool %s failed: %s" % (" ".join(args), result.output))
+
+
+def cold_start(code):
+    return lambda: subprocess.run(
+        [sys.executable, "-c", code], check=True, stdout=subprocess.DEVNULL
+    )
+
+
+def benchmarks():
+    benches = {
+        "startup.python": cold_start("pass"),
+        "startup.import.emv.protocol.data": cold_start("import emv.protocol.data"),
+        "startup.import.emv.protocol.structures": cold_start(
+            "import emv.protocol.structures"
+        ),
+        "startup.import.emv.card": cold_start("import emv.card"),
+    }
+    for command in COMMANDS:
+        name = "startup.emvtool." + ".".join(arg.lstrip("-") for arg in command)
+        benches[name] = cold_start(RUN_CLI % command)
+
+    traces = tempfile.mkdtemp(prefix="emv-bench-")
+    atexit.register(shutil.rmtree, traces, ignore_errors=True)
+    for name, command in CARD_COMMANDS.items():
+        path = os.path.join(traces, name + ".trace")
+        record_trace(path, command)
+        args = ["--replay", path] + command
+        benches["startup.emvtool." + name] = cold_start(RUN_CLI % args)
+    return benches
+
+
+if __name__ == "__main__":
+    main(benchmarks())
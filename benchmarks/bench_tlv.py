@@ -0,0 +1,195 @@
+""" TLV parsing benchmarks, run with:
+
+        python -m benchmarks.bench_tlv
+
+    Compares the offset-based parser against the original slicing implementation
+    on large nested templates.
+"""
+from emv.protocol.data import read_tag, read_length, is_constructed, Tag, ELEMENT_FORMAT
+from emv.protocol.data_elements import Parse
+from emv.protocol.structures import (
+    TLV,
+    LazyTLV,
+    DOL,
+    TagList,
+    ASRPD,
+    CVMList,
+    AUC,
+    parse_element,
+    ELEMENT_DECODERS,
+)
+from emv.protocol.stream import iter_events
+from emv.protocol.path import compile_path
+from emv.test.fixtures import APP_DATA
+from .harness import main
+
+
+def encode(tag, value):
+    """Encode a single TLV element as a list of bytes."""
+    length = len(value)
+    if length < 0x80:
+        header = [length]
+    else:
+        length_bytes = list(length.to_bytes((length.bit_length() + 7) // 8, "big"))
+        header = [0x80 | len(length_bytes)] + length_bytes
+    return list(tag) + header + list(value)
+
+
+def large_record(copies=64):
+    """A 0x70 READ RECORD template containing many copies of a real record's contents."""
+    inner = APP_DATA[2:]
+    return encode([0x70], inner * copies)
+
+
+def large_fci(entries=64):
+    """A 0x6F FCI template with a deeply-nested, sizeable issuer discretionary template."""
+    discretionary = []
+    for i in range(entries):
+        discretionary += encode([0x9F, 0x0A], [0x00, 0x01, 0x01, 0x01])
+        discretionary += encode([0x73], encode([0x9F, 0x6E], list(range(i % 32))))
+    prop = (
+        encode([0x50], b"BARCLAYS")
+        + encode([0x87], [0x01])
+        + encode([0x5F, 0x2D], b"en")
+        + encode([0xBF, 0x0C], discretionary)
+    )
+    return encode(
+        [0x6F], encode([0x84], [0xA0, 0, 0, 0, 3, 0x80, 2]) + encode([0xA5], prop)
+    )
+
+
+def legacy_unmarshal(data):
+    """The original slice-based parser, kept as a baseline."""
+    tlv = TLV()
+    if len(data) < 3:
+        return data
+    i = 0
+    while i < len(data):
+        tag, tag_len = read_tag(data[i:])
+        i += tag_len
+        if len(data) <= i:
+            return tlv
+        length, length_len = read_length(data[i:])
+        i += length_len
+        value = data[i : i + length]
+        if is_constructed(tag[0]):
+            value = legacy_unmarshal(value)
+        tag = Tag(tag)
+        value = parse_element(tag, value)
+        if tag in tlv:
+            if type(tlv[tag]) is not list:
+                tlv[tag] = [tlv[tag]]
+            tlv[tag].append(value)
+        else:
+            tlv[tag] = value
+        i += length
+    return tlv
+
+
+def legacy_marshal(tlv):
+    """Naive list-concatenating encoder, for comparison with TLV.marshal."""
+    out = []
+    for tag, value in tlv.items():
+        values = value if type(value) is list and type(value[0]) is not int else [value]
+        for value in values:
+            if isinstance(value, TLV):
+                value = legacy_marshal(value)
+            elif hasattr(value, "marshal"):
+                value = list(value.marshal())
+            out += encode(tag.encoded, value)
+    return out
+
+
+def legacy_parse_element(tag, value):
+    """The original if-chain element dispatch, kept as a baseline."""
+    if ELEMENT_FORMAT.get(tag) == Parse.DOL:
+        value = DOL.unmarshal(value)
+    elif ELEMENT_FORMAT.get(tag) == Parse.TAG_LIST:
+        value = TagList.unmarshal(value)
+    elif ELEMENT_FORMAT.get(tag) == Parse.ASRPD:
+        value = ASRPD.unmarshal(value)
+    elif ELEMENT_FORMAT.get(tag) == Parse.CVM_LIST:
+        value = CVMList.unmarshal(value)
+    elif ELEMENT_FORMAT.get(tag) == Parse.AUC:
+        value = AUC.unmarshal(value)
+    return value
+
+
+def legacy_serialise(dol, data):
+    """The original DOL.serialise, which pads and concatenates lists."""
+    output = []
+    for tag, length in dol:
+        value = data.get(tag, [0x0] * length)
+        if len(value) < length:
+            value = [0x0] * (length - len(value)) + value
+        output += value
+    return output
+
+
+def app_data_elements():
+    """The primitive elements in the APP_DATA fixture, as (Tag, value) pairs."""
+    return [
+        (e.tag, list(e.value))
+        for e in iter_events([bytes(APP_DATA)])
+        if e.value is not None
+    ]
+
+
+def benchmarks():
+    record = large_record()
+    fci = large_fci()
+    record_bytes = bytes(record)
+    fci_bytes = bytes(fci)
+    record_tlv = TLV.unmarshal(record)
+    fci_tlv = TLV.unmarshal(fci)
+    fci_indexed = TLV.unmarshal(fci, index=True)
+    last_asrpd = compile_path("**/9F0A")
+    elements = app_data_elements()
+    # Elements with no decoder, to measure the cost of dispatch alone
+    plain = [(tag, value) for tag, value in elements if tag not in ELEMENT_DECODERS]
+    cdol1 = TLV.unmarshal(APP_DATA)[Tag.RECORD][Tag.CDOL1]
+    unpredictable_number = Tag(0x9F37)
+    terminal_data = {Tag(0x9A): [0x01, 0x01, 0x01], Tag(0x95): [0x80, 0, 0, 0, 0]}
+    return {
+        "parse_element.dispatch.legacy": lambda: [
+            legacy_parse_element(tag, value) for tag, value in plain
+        ],
+        "parse_element.dispatch": lambda: [
+            parse_element(tag, value) for tag, value in plain
+        ],
+        "parse_element.app_data.legacy": lambda: [
+            legacy_parse_element(tag, value) for tag, value in elements
+        ],
+        "parse_element.app_data": lambda: [
+            parse_element(tag, value) for tag, value in elements
+        ],
+        "tlv.unmarshal.record.legacy": lambda: legacy_unmarshal(record),
+        "tlv.unmarshal.record.list": lambda: TLV.unmarshal(record),
+        "tlv.unmarshal.record.bytes": lambda: TLV.unmarshal(record_bytes),
+        "tlv.unmarshal.fci.legacy": lambda: legacy_unmarshal(fci),
+        "tlv.unmarshal.fci.list": lambda: TLV.unmarshal(fci),
+        "tlv.unmarshal.fci.bytes": lambda: TLV.unmarshal(fci_bytes),
+        "tlv.unmarshal.app_data.list": lambda: TLV.unmarshal(APP_DATA),
+        "tlv.marshal.record": record_tlv.marshal,
+        "tlv.marshal.fci": fci_tlv.marshal,
+        "tlv.marshal.record.legacy_encode": lambda: encode(
+            [0x70], legacy_marshal(record_tlv[0x70])
+        ),
+        "dol.serialise.cdol1.legacy": lambda: legacy_serialise(cdol1, terminal_data),
+        "dol.serialise.cdol1": lambda: cdol1.serialise(terminal_data),
+        "dol.contains.cdol1": lambda: unpredictable_number in cdol1,
+        "tlv.unmarshal.fci.indexed": lambda: TLV.unmarshal(fci, index=True),
+        "path.find_all.fci.traverse": lambda: last_asrpd.find_all(fci_tlv),
+        "path.find_all.fci.indexed": lambda: last_asrpd.find_all(fci_indexed),
+        # Lazy parsing, only touching the elements needed (as Card does)
+        "lazytlv.fci_label.bytes": lambda: LazyTLV.unmarshal(fci_bytes)[Tag.FCI][
+            Tag.FCI_PROP
+        ][Tag.APP_LABEL],
+        "lazytlv.record_cdol1.bytes": lambda: LazyTLV.unmarshal(record_bytes)[
+            Tag.RECORD
+        ][Tag.CDOL1],
+    }
+
+
+if __name__ == "__main__":
+    main(benchmarks())
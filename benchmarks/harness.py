@@ -0,0 +1,103 @@
+""" Minimal timing harness for the benchmark scripts in this directory.
+
+    Each benchmark module exposes a `benchmarks()` function returning a dict of
+    name -> zero-argument callable, and can be run directly, e.g.:
+
+        python -m benchmarks.bench_tlv
+
+    Results can be saved as a JSON baseline and compared against later runs, see
+    `python -m benchmarks --help`.
+"""
+import importlib
+import json
+import platform
+import sys
+import timeit
+
+
+def available(module):
+    """Whether an optional module, such as numpy, can be imported."""
+    try:
+        importlib.import_module(module)
+    except ImportError:
+        return False
+    return True
+
+
+def measure(func, repeat=5, min_time=0.2):
+    """Time a zero-argument callable, returning the best time per call in seconds."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    # autorange aims for 0.2s per run, scale up if a longer run was requested.
+    number = max(1, int(number * min_time / 0.2))
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e3), ("us", 1e6)):
+        if seconds * scale >= 1:
+            return "%.2f %s" % (seconds * scale, unit)
+    return "%.0f ns" % (seconds * 1e9)
+
+
+def run(benchmarks, repeat=5, min_time=0.2):
+    results = {}
+    for name, func in benchmarks.items():
+        results[name] = measure(func, repeat=repeat, min_time=min_time)
+        print("%-50s %12s" % (name, format_time(results[name])))
+    return results
+
+
+def save_results(path, results):
+    """Save results to a JSON baseline file, along with details of the machine."""
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "machine": platform.machine(),
+                "results": results,
+            },
+            f,
+            indent=2,
+            sort_keys=True,
+        )
+        f.write("\n")
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+def compare(baseline, results, threshold=0.25):
+    """Print a comparison of results against a baseline, returning the names of
+    benchmarks which are more than `threshold` slower than the baseline."""
+    regressions = []
+    print("\n%-50s %12s %12s %8s" % ("Benchmark", "Baseline", "Current", "Change"))
+    for name, current in results.items():
+        if name not in baseline:
+            print("%-50s %12s %12s %8s" % (name, "-", format_time(current), "new"))
+            continue
+        change = current / baseline[name] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  SLOWER"
+            regressions.append(name)
+        elif change < -threshold:
+            flag = "  faster"
+        print(
+            "%-50s %12s %12s %+7.0f%%%s"
+            % (
+                name,
+                format_time(baseline[name]),
+                format_time(current),
+                change * 100,
+                flag,
+            )
+        )
+    return regressions
+
+
+def main(benchmarks):
+    run(benchmarks)
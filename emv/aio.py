@@ -0,0 +1,179 @@
+""" Asyncio interface to EMV cards.
+
+    pyscard is blocking, so each exchange with the card is run in an executor,
+    allowing a single event loop to drive many readers at once:
+
+        card = AsyncCard(connection, timeout=5)
+        apps = await card.list_applications()
+        value = await card.generate_cap_value("1234")
+
+    By default, each card gets its own single-thread executor, so all calls to a
+    connection are made from the same thread. Exchanges on a card are serialised.
+
+    A timeout (or cancellation) abandons the wait for an exchange, but the call to
+    the reader can't be interrupted: it continues in the executor, and the next
+    exchange waits for it to finish. After a timeout, the state of a transaction on
+    the card is unknown, and it should be restarted from the beginning.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from .transmission import TransmissionProtocol, CachingTransmissionProtocol
+from .protocol.response import ErrorResponse
+from .protocol.command import SelectCommand, ReadCommand, GetProcessingOptions
+from .card import (
+    processing_options,
+    list_applications_flow,
+    select_application_flow,
+    get_data_item_flow,
+    get_metadata_flow,
+    get_application_data_flow,
+    verify_pin_flow,
+    generate_cap_value_flow,
+)
+
+
+class AsyncTransmissionProtocol(object):
+    """Asynchronous transport layer, running a TransmissionProtocol in an executor.
+
+    - `connection`: a pyscard connection (connected on the first exchange).
+    - `executor`: a concurrent.futures executor. If None, a single-thread executor
+      is created, and shut down by `close()`.
+    - `timeout`: the default timeout for each exchange, in seconds.
+    - `cache`: use a CachingTransmissionProtocol (the default, as for Card).
+    """
+
+    def __init__(self, connection, executor=None, timeout=None, cache=True):
+        self.connection = connection
+        self.timeout = timeout
+        self.protocol = CachingTransmissionProtocol if cache else TransmissionProtocol
+        self.own_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="emv")
+        self.executor = executor
+        self.tp = None
+        self._lock = None
+        # An exchange which was abandoned, but may still be running in the executor
+        self._pending = None
+
+    async def _run(self, func, *args, timeout=None):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        if timeout is None:
+            timeout = self.timeout
+
+        async with self._lock:
+            if self._pending is not None:
+                await asyncio.wait([self._pending])
+                self._pending = None
+
+            future = asyncio.get_running_loop().run_in_executor(
+                self.executor, func, *args
+            )
+            try:
+                result = await asyncio.wait_for(asyncio.shield(future), timeout)
+            except BaseException:
+                if not future.done():
+                    self._pending = future
+                raise
+            return result
+
+    async def connect(self, timeout=None):
+        """Connect to the card, if not already connected."""
+        if self.tp is None:
+            await self._run(self._connect, timeout=timeout)
+
+    def _connect(self):
+        # Run under the lock, so a connection made while waiting for it is seen here
+        if self.tp is None:
+            self.tp = self.protocol(self.connection)
+
+    async def transmit(self, tx_data, timeout=None):
+        """Send raw data to the card, and receive the reply.
+        See TransmissionProtocol.transmit."""
+        await self.connect()
+        return await self._run(self.tp.transmit, tx_data, timeout=timeout)
+
+    async def exchange(self, capdu, timeout=None):
+        """Send a command to the card and return the response.
+        See TransmissionProtocol.exchange."""
+        await self.connect()
+        return await self._run(self.tp.exchange, capdu, timeout=timeout)
+
+    def close(self):
+        if self.own_executor:
+            self.executor.shutdown(wait=False)
+
+
+class AsyncCard(object):
+    """High-level card manipulation API, with coroutines in place of the
+    methods of `emv.card.Card`.
+
+    `executor`, `timeout` and `cache` are passed to AsyncTransmissionProtocol. As
+    with Card, responses are cached by default.
+    """
+
+    def __init__(self, connection, executor=None, timeout=None, cache=True):
+        self.tp = AsyncTransmissionProtocol(connection, executor, timeout, cache)
+
+    def close(self):
+        self.tp.close()
+
+    async def __aenter__(self):
+        await self.tp.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    async def run(self, flow):
+        """Run a flow from emv.card against the card, returning its result."""
+        try:
+            capdu = next(flow)
+            while True:
+                try:
+                    res = await self.tp.exchange(capdu)
+                except ErrorResponse as e:
+                    capdu = flow.throw(e)
+                else:
+                    capdu = flow.send(res)
+        except StopIteration as stop:
+            return stop.value
+
+    async def get_mf(self):
+        """Get the master file (MF)."""
+        return await self.tp.exchange(SelectCommand(file_identifier=[0x3F, 0x00]))
+
+    async def get_pse(self, pse="1PAY.SYS.DDF01"):
+        """Get the Payment System Environment (PSE) file"""
+        return await self.tp.exchange(SelectCommand(pse))
+
+    async def list_applications(self):
+        """List applications on the card"""
+        return await self.run(list_applications_flow())
+
+    async def read_record(self, record_number, sfi=None):
+        return await self.tp.exchange(ReadCommand(record_number, sfi))
+
+    async def select_application(self, app):
+        return await self.run(select_application_flow(app))
+
+    async def get_data_item(self, item, tag):
+        return await self.run(get_data_item_flow(item, tag))
+
+    async def get_metadata(self):
+        return await self.run(get_metadata_flow())
+
+    async def get_processing_options(self, pdol=None):
+        return processing_options(await self.tp.exchange(GetProcessingOptions(pdol)))
+
+    async def get_application_data(self, afl):
+        return await self.run(get_application_data_flow(afl))
+
+    async def verify_pin(self, pin):
+        """Verify the PIN, raising an exception if it fails."""
+        return await self.run(verify_pin_flow(pin))
+
+    async def generate_cap_value(self, pin, challenge=None, value=None):
+        """Perform a transaction to generate the EMV CAP (Pinsentry) value.
+        See Card.generate_cap_value."""
+        return await self.run(generate_cap_value_flow(pin, challenge, value))
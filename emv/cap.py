@@ -6,6 +6,7 @@
     I make no guarantees for non-UK cards as I'm aware that certain banks have
     made their own "customisations" to EMV CAP.
 """
+from functools import lru_cache
 from .protocol.data import Tag
 from .protocol.command import GenerateApplicationCryptogramCommand
 from .protocol.structures import DOL
@@ -24,6 +25,12 @@ GAC_RESPONSE_DOL = DOL(
     ]
 )
 
+# Terminal data sent in every ARQC request, from barclays_pinsentry.c.
+TERMINAL_DATA = {
+    Tag(0x9A): [0x01, 0x01, 0x01],  # Transaction Date
+    Tag(0x95): [0x80, 0x00, 0x00, 0x00, 0x00],  # Terminal Verification Results
+}
+
 # A static Issuer Proprietary Bitmap which is apparently the default for VISA cards.
 # Retrieved from the EMVCAP code:
 # https://github.com/zoobab/EMVCAP/blob/0e4877c30972475249e6a2b0253068bfda9e5cf3/EMV-CAP#L519
@@ -60,10 +67,7 @@ def get_arqc_req(app_data, value=None, challenge=None):
         raise CAPError("Application data doesn't include CDOL1 field: %r" % app_data)
 
     cdol1 = app_data[Tag.CDOL1]
-    data = {
-        Tag(0x9A): [0x01, 0x01, 0x01],  # Transaction Date
-        Tag(0x95): [0x80, 0x00, 0x00, 0x00, 0x00],  # Terminal Verification Results
-    }
+    data = dict(TERMINAL_DATA)
 
     if challenge is not None:
         # If an account number (or challenge) is provided, it goes in the
@@ -80,6 +84,31 @@ def get_arqc_req(app_data, value=None, challenge=None):
     )
 
 
+@lru_cache(maxsize=64)
+def compile_ipb(ipb):
+    """Compile an IPB (as bytes) into an extraction plan: a tuple of
+    (shift, mask, position) for each run of consecutive 1 bits in the IPB.
+
+    With the response as a big-endian integer, each run's bits are extracted with
+    `(response >> shift) & mask`, and placed in the result at `position`.
+    """
+    bitmap = int.from_bytes(ipb, "big")
+    plan = []
+    position = 0
+    shift = 0
+    while bitmap:
+        # Skip to the next run of 1s, and measure its length
+        zeros = (bitmap & -bitmap).bit_length() - 1
+        bitmap >>= zeros
+        shift += zeros
+        length = (~bitmap & (bitmap + 1)).bit_length() - 1
+        plan.append((shift, (1 << length) - 1, position))
+        bitmap >>= length
+        shift += length
+        position += length
+    return tuple(plan)
+
+
 def get_cap_value(response, ipb, psn):
     """Generate a CAP value from the ARQC response.
 
@@ -106,30 +135,159 @@ def get_cap_value(response, ipb, psn):
     # Concat'd: 101100101010
     # Decimal:  2858
 
-    # Get response data into single list, in the same format as IPB
-    resp_data = [item for sublist in data.values() for item in sublist]
+    # Get response data into a single byte string, in the same format as IPB
+    resp_data = b"".join(bytes(value) for value in data.values())
 
     # If the PAN Sequence Number is set, then prepend it to the response data
     if psn is not None:
-        resp_data = psn + resp_data
-
-    # Initialise empty string to hold binary result of masking process
-    binary_string = ""
-
-    # Iterate through the items in the IPB mask (in reverse)
-    for i in reversed(range(0, min(len(ipb), len(resp_data)))):
-        # Get the values of data and mask for the current iteration
-        data_number = resp_data[i]
-        ipb_number = ipb[i]
-        # If the mask has some 1s in it
-        while ipb_number > 0:
-            # Check if the last digit in the binary representation of the mask is '1'
-            if ipb_number & 1:
-                # And if it is, prepend the last binary digit of the data to the binary string
-                binary_string = str(data_number & 1) + binary_string
-            # Bitshift both the data and the mask to the right by one bit
-            ipb_number >>= 1
-            data_number >>= 1
-
-    # And return the binary string converted to a decimal number
-    return int(binary_string, 2)
+        resp_data = bytes(psn) + resp_data
+
+    return extract_cap_value(resp_data, ipb)
+
+
+def extract_cap_value(resp_data, ipb):
+    """Apply an IPB to the response data (as bytes), returning the CAP value."""
+    # Only the bytes covered by both the IPB and the response are used.
+    size = min(len(ipb), len(resp_data))
+    plan = compile_ipb(bytes(ipb[:size]))
+    if not plan:
+        raise CAPError("IPB doesn't select any bits from the response")
+
+    resp_int = int.from_bytes(resp_data[:size], "big")
+    result = 0
+    for shift, mask, position in plan:
+        result |= ((resp_int >> shift) & mask) << position
+    return result
+
+
+def _scatter(np, buf, starts, lengths, rows, columns, out):
+    """Copy each (start, length) range of `buf` into row `rows[i]` of `out`,
+    starting at column `columns[i]`."""
+    total = int(lengths.sum())
+    if total == 0:
+        return
+    # Offset of each copied byte within its range
+    within = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    out[np.repeat(rows, lengths), np.repeat(columns, lengths) + within] = buf[
+        np.repeat(starts, lengths) + within
+    ]
+
+
+def get_cap_values(responses, ipbs, psns=None, chunk_size=65536):
+    """Calculate CAP values for many GENERATE APPLICATION CRYPTOGRAM responses at once.
+    This requires NumPy.
+
+    `responses` is a sequence of response data (without the status words), in either
+    the RMTF1 or RMTF2 format. `ipbs` is either a single IPB applied to every
+    response, or a sequence of IPBs, one per response. `psns` is None, or a sequence
+    of PAN sequence numbers (each of which may be None).
+
+    Returns a list of CAP values, as calculated by `get_cap_value`.
+    """
+    import numpy as np
+    from .protocol.bulk import pack_records, scan_records
+
+    count = len(responses)
+    if len(ipbs) > 0 and isinstance(ipbs[0], int):
+        ipbs = [ipbs] * count
+    if psns is None:
+        psns = [None] * count
+    if len(ipbs) != count or len(psns) != count:
+        raise ValueError("responses, ipbs and psns must be the same length")
+
+    buf, offsets = pack_records(responses)
+    scan = scan_records(buf, offsets, descend=True)
+    buf = np.frombuffer(buf, dtype=np.uint8)
+
+    # The template (RMTF1 or RMTF2) of each response
+    top = np.flatnonzero(scan.depth == 0)
+    records, first = np.unique(scan.record[top], return_index=True)
+    template = np.zeros(count, dtype=np.uint64)
+    template[records] = scan.tag[top[first]]
+    unknown = np.flatnonzero((template != Tag.RMTF1.key) & (template != Tag.RMTF2.key))
+    if unknown.size:
+        raise CAPError("Unknown response type in ARQC response %s" % unknown[0])
+
+    # The response data is the RMTF1 value, or the concatenated values of the
+    # primitive elements in the RMTF2 template.
+    rmtf1 = template == Tag.RMTF1.key
+    rec_template = template[scan.record]
+    keep = np.flatnonzero(
+        ((scan.depth == 0) & (scan.tag == Tag.RMTF1.key))
+        | ((scan.depth == 1) & ~scan.constructed & (rec_template == Tag.RMTF2.key))
+    )
+    lengths = scan.length[keep]
+    rows = scan.record[keep]
+
+    psn_buf, psn_offsets = pack_records([psn or b"" for psn in psns])
+    psn_lengths = np.diff(psn_offsets)
+    response_lengths = np.bincount(rows, weights=lengths, minlength=count).astype(
+        np.int64
+    )
+    data_lengths = psn_lengths + response_lengths
+
+    bad_size = np.flatnonzero(rmtf1 & (response_lengths != GAC_RESPONSE_DOL.size()))
+    if bad_size.size:
+        raise CAPError("Incorrect RMTF1 response size in response %s" % bad_size[0])
+
+    # Position of each element within its response's data, after the PSN
+    response_starts = np.cumsum(response_lengths) - response_lengths
+    columns = psn_lengths[rows] + np.cumsum(lengths) - lengths - response_starts[rows]
+
+    width = int(data_lengths.max()) if count else 0
+    data = np.zeros((count, width), dtype=np.uint8)
+    _scatter(np, buf, scan.value_offset[keep], lengths, rows, columns, data)
+    _scatter(
+        np,
+        np.frombuffer(psn_buf, dtype=np.uint8),
+        psn_offsets[:-1],
+        psn_lengths,
+        np.arange(count),
+        np.zeros(count, dtype=np.int64),
+        data,
+    )
+
+    # IPBs are truncated to the length of the response data
+    mask = np.zeros((count, width), dtype=np.uint8)
+    ipb_buf, ipb_offsets = pack_records(ipb[:width] for ipb in ipbs)
+    _scatter(
+        np,
+        np.frombuffer(ipb_buf, dtype=np.uint8),
+        ipb_offsets[:-1],
+        np.diff(ipb_offsets),
+        np.arange(count),
+        np.zeros(count, dtype=np.int64),
+        mask,
+    )
+    mask[np.arange(width) >= data_lengths[:, None]] = 0
+
+    values = []
+    for start in range(0, count, chunk_size):
+        values.extend(
+            _extract_cap_values(
+                np, data[start : start + chunk_size], mask[start : start + chunk_size]
+            )
+        )
+    return values
+
+
+def _extract_cap_values(np, data, mask):
+    """Vectorised IPB extraction over rows of response data and IPB masks."""
+    data_bits = np.unpackbits(data, axis=1).astype(bool)
+    mask_bits = np.unpackbits(mask, axis=1).astype(bool)
+    selected = mask_bits.sum(axis=1)
+    if (selected == 0).any():
+        raise CAPError("IPB doesn't select any bits from the response")
+
+    # Each selected bit's position in the result is the number of selected bits after it
+    exponent = selected[:, None] - np.cumsum(mask_bits, axis=1)
+    wide = selected > 64
+    exponent[wide] = 0
+    weights = np.left_shift(np.uint64(1), exponent.astype(np.uint64))
+    weights[~(data_bits & mask_bits)] = 0
+    values = weights.sum(axis=1, dtype=np.uint64).tolist()
+
+    # Results wider than 64 bits are calculated with Python integers
+    for i in np.flatnonzero(wide):
+        values[i] = extract_cap_value(data[i].tobytes(), mask[i].tobytes())
+    return values
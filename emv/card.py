@@ -1,5 +1,5 @@
 import logging
-from .transmission import TransmissionProtocol
+from .transmission import TransmissionProtocol, CachingTransmissionProtocol
 from .protocol.structures import TLV
 from .protocol.data import Tag
 from .protocol.response import WarningResponse, ErrorResponse
@@ -16,12 +16,56 @@ from .cap import get_arqc_req, get_cap_value, VISA_STATIC_IPB
 
 log = logging.getLogger(__name__)
 
+# Static application IDs, for cards without a PSE
+STATIC_AIDS = [
+    [0xA0, 0x00, 0x00, 0x00, 0x25, 0x01],  # Amex
+    [0xA0, 0x00, 0x00, 0x00, 0x03, 0x10, 0x10],  # Visa
+    [0xA0, 0x00, 0x00, 0x00, 0x04, 0x10, 0x10],  # Mastercard
+]
+
+# Status words for READ RECORD after the last record in an SFI: file not found
+# (the SFI doesn't exist) and record not found.
+SW_END_OF_SFI = {(0x6A, 0x82), (0x6A, 0x83)}
+
+# (name, GET DATA item, decoder) for each item returned by get_metadata
+METADATA_ITEMS = [
+    ("pin_retries", GetDataCommand.PIN_TRY_COUNT, lambda res: res[0]),
+    ("atc", GetDataCommand.ATC, decode_int),
+    ("last_online_atc", GetDataCommand.LAST_ONLINE_ATC, decode_int),
+]
+
 
 class Card(object):
-    """High-level card manipulation API"""
+    """High-level card manipulation API
+
+    By default, responses to commands which don't change the card's state (SELECT,
+    READ RECORD and GET DATA for static items) are cached until a command which
+    might, see CachingTransmissionProtocol. Set `cache` to False to always send every command.
+    """
+
+    def __init__(self, connection, cache=True):
+        if cache:
+            self.tp = CachingTransmissionProtocol(connection)
+        else:
+            self.tp = TransmissionProtocol(connection)
+
+    def reset(self):
+        """Reset the card, ending any transaction in progress."""
+        self.tp.reset()
 
-    def __init__(self, connection):
-        self.tp = TransmissionProtocol(connection)
+    def run(self, flow):
+        """Run a flow (see below) against the card, returning its result."""
+        try:
+            capdu = next(flow)
+            while True:
+                try:
+                    res = self.tp.exchange(capdu)
+                except ErrorResponse as e:
+                    capdu = flow.throw(e)
+                else:
+                    capdu = flow.send(res)
+        except StopIteration as stop:
+            return stop.value
 
     def get_mf(self):
         """Get the master file (MF)."""
@@ -33,175 +77,250 @@ class Card(object):
 
     def list_applications(self):
         """List applications on the card"""
-        try:
-            return self._list_applications_sfi()
-        except ErrorResponse:
-            return self._list_applications_static_aid()
-
-    def _list_applications_static_aid(self):
-        """Try to find applications by trying to select a static application ID.
-        This is an older method of app discovery which is still used by some cards.
-        """
-        STATIC_AIDS = [
-            [0xA0, 0x00, 0x00, 0x00, 0x25, 0x01],  # Amex
-            [0xA0, 0x00, 0x00, 0x00, 0x03, 0x10, 0x10],  # Visa
-            [0xA0, 0x00, 0x00, 0x00, 0x04, 0x10, 0x10],  # Mastercard
-        ]
-        apps = []
-        for aid in STATIC_AIDS:
-            try:
-                res = self.tp.exchange(SelectCommand(aid))
-
-                # This is a bit of a hack, we transform this response into something which looks
-                # like the result from the SFI method, so that callers of list_applications get a
-                # consistent result.
-                apps.append(
-                    TLV(
-                        {
-                            Tag.ADF_NAME: res.data[Tag.FCI][Tag.DF],
-                            Tag.APP_LABEL: res.data[Tag.FCI][Tag.FCI_PROP][
-                                Tag.APP_LABEL
-                            ],
-                        }
-                    )
-                )
-            except ErrorResponse:
-                continue
-        return apps
+        return self.run(list_applications_flow())
 
-    def _list_applications_sfi(self):
-        """List applications on the card using the SFI method.
+    def read_record(self, record_number, sfi=None):
+        return self.tp.exchange(ReadCommand(record_number, sfi))
 
-        This fetches the SFI (short file identifier) from the PSE (Payment System Environment)
-        file, and uses it to locate all the apps on the card.
+    def discover_records(self, afl=None, exhaustive=False):
+        """Find the records in the currently-selected file, yielding
+        (SFI, record number, response) for each.
+
+        If an AFL is given, only the records it lists are read. Otherwise each SFI
+        from 1 to 30 is read from record 1 until the card reports that the file
+        doesn't exist (6A82) or that there are no more records (6A83), so an SFI
+        which doesn't exist costs a single command. Records which fail with any
+        other error are skipped. If `exhaustive` is set, every record from 1 to 15
+        in every SFI is tried instead, which finds records after gaps in the
+        numbering, at the cost of 450 commands.
         """
-        pse = self.get_pse()
-        sfi = pse.data[Tag.FCI][Tag.FCI_PROP][Tag.SFI][0]
-        apps = []
+        if afl is not None:
+            locations = afl_records(afl)
+        else:
+            locations = (
+                (sfi, record) for sfi in range(1, 31) for record in range(1, 16)
+            )
 
-        # Apps may be stored in different records, so iterate through records
-        # until we hit an error
-        for i in range(1, 31):
+        finished_sfi = None
+        for sfi, record in locations:
+            if sfi == finished_sfi:
+                continue
             try:
-                res = self.read_record(i, sfi)
-            except ErrorResponse:
-                break
-            new_apps = res.data[Tag.RECORD][Tag.APP]
-            if type(new_apps) is not list:
-                new_apps = [new_apps]
-            apps += new_apps
-        return apps
-
-    def read_record(self, record_number, sfi=None):
-        return self.tp.exchange(ReadCommand(record_number, sfi))
+                res = self.read_record(record, sfi=sfi)
+            except ErrorResponse as e:
+                if afl is None and not exhaustive and (e.sw1, e.sw2) in SW_END_OF_SFI:
+                    finished_sfi = sfi
+                continue
+            yield sfi, record, res
 
     def select_application(self, app):
-        try:
-            res = self.tp.exchange(SelectCommand(app))
-        except ErrorResponse as e:
-            raise MissingAppException(e)
-        return res
+        return self.run(select_application_flow(app))
 
     def get_data_item(self, item, tag):
-        try:
-            res = self.tp.exchange(GetDataCommand(item))
-            return res.data[tag]
-        except ErrorResponse:
-            return None
+        return self.run(get_data_item_flow(item, tag))
 
     def get_metadata(self):
-        data = {}
-        res = self.get_data_item(GetDataCommand.PIN_TRY_COUNT, (0x9F, 0x17))
-        if res:
-            data["pin_retries"] = res[0]
-
-        res = self.get_data_item(GetDataCommand.ATC, (0x9F, 0x36))
-        if res:
-            data["atc"] = decode_int(res)
-
-        res = self.get_data_item(GetDataCommand.LAST_ONLINE_ATC, (0x9F, 0x13))
-        if res:
-            data["last_online_atc"] = decode_int(res)
-
-        return data
+        return self.run(get_metadata_flow())
 
     def get_processing_options(self, pdol=None):
-        res = self.tp.exchange(GetProcessingOptions(pdol))
-        if Tag.RMTF1 in res.data:
-            # Response template format 1
-            return {"AIP": res.data[Tag.RMTF1][:2], "AFL": res.data[Tag.RMTF1][2:]}
-        elif Tag.RMTF2 in res.data:
-            # Response template format 2
-            return {"AIP": res.data[Tag.RMTF2][0x82], "AFL": res.data[Tag.RMTF2][0x94]}
+        return processing_options(self.tp.exchange(GetProcessingOptions(pdol)))
 
     def get_application_data(self, afl):
-        assert len(afl) % 4 == 0
-        data = TLV()
-        for i in range(0, len(afl), 4):
-            sfi = afl[i] >> 3
-            start_rec = afl[i + 1]
-            end_rec = afl[i + 2]
-            # dar = afl[i + 3]
-            for i in range(start_rec, end_rec + 1):
-                res = self.tp.exchange(ReadCommand(i, sfi))
-                data.update(res.data[Tag.RECORD])
-        return data
+        return self.run(get_application_data_flow(afl))
 
     def verify_pin(self, pin):
         """Verify the PIN, raising an exception if it fails."""
-        res = self.tp.exchange(VerifyCommand(pin))
-        if type(res) == WarningResponse:
-            raise InvalidPINException(str(res))
-
-        return res
+        return self.run(verify_pin_flow(pin))
 
     def generate_cap_value(self, pin, challenge=None, value=None):
         """Perform a transaction to generate the EMV CAP (Pinsentry) value."""
-        apps = self.list_applications()
+        return self.run(generate_cap_value_flow(pin, challenge, value))
 
-        if len(apps) == 0:
-            raise MissingAppException("No apps on card")
 
-        # We're selecting the last app on the card here, which seems be the correct
-        # (bank-specific) one. If this isn't always the case, it may be better to
-        # select the app with ADF [A0 00 00 00 03 80 02].
-        self.select_application(apps[-1][Tag.ADF_NAME])
+# Flows are the card operations, written as generators so that Card and
+# emv.aio.AsyncCard can share them. A flow yields each command to send, and is
+# sent the response, or has the ErrorResponse thrown into it. Its return value is
+# the result of the operation.
 
-        # Get Processing Options starts the transaction on the card and
-        # increments the transaction counter.
-        opts = self.get_processing_options()
 
-        # Fetch the application data referenced in the processing options.
-        # This includes the CDOL data structure which dictates the format
-        # of the data passed to the Get Application Cryptogram function.
-        app_data = self.get_application_data(opts["AFL"])
+def list_applications_flow(pse="1PAY.SYS.DDF01"):
+    """List applications on the card, using the PSE if there is one, or otherwise by
+    selecting each of the static application IDs."""
+    try:
+        return (yield from _list_applications_sfi_flow(pse))
+    except ErrorResponse:
+        return (yield from _list_applications_static_aid_flow())
 
-        self.verify_pin(pin)
 
-        resp = self.tp.exchange(
-            get_arqc_req(app_data, challenge=challenge, value=value)
-        )
+def _list_applications_static_aid_flow():
+    """Try to find applications by trying to select a static application ID.
+    This is an older method of app discovery which is still used by some cards.
+    """
+    apps = []
+    for aid in STATIC_AIDS:
+        try:
+            res = yield SelectCommand(aid)
+        except ErrorResponse:
+            continue
+        apps.append(static_aid_app(res))
+    return apps
 
-        # Set default: don't use PAN Sequence Number
-        psn = None
-
-        # If the third bit of Issuer Authentication Flags is set then use the PAN Sequence Number
-        if Tag.IAF in app_data and app_data[Tag.IAF][0] & 0x40:
-            psn = app_data[Tag.PAN_SN]
-
-        # Fetch the Issuer Proprietary Bitmap. In most UK cards this is provided in the application data file.
-        #
-        # In some cases the IPB may not be present. This static IPB is from the EMVCAP code.
-        #
-        # It appears that Belgian cards use their own silliness.
-        # https://github.com/zoobab/EMVCAP/blob/master/EMV-CAP#L512
-        if Tag.IPB in app_data:
-            ipb = app_data[Tag.IPB]
-        else:
-            log.warn(
-                "Issuer Proprietary Bitmap not found on card - using static VISA IPB. "
-                "The resulting code may not work!"
-            )
-            ipb = VISA_STATIC_IPB
 
-        return get_cap_value(resp, ipb, psn)
+def _list_applications_sfi_flow(pse):
+    """List applications on the card using the SFI method.
+
+    This fetches the SFI (short file identifier) from the PSE (Payment System Environment)
+    file, and uses it to locate all the apps on the card.
+    """
+    res = yield SelectCommand(pse)
+    sfi = res.data[Tag.FCI][Tag.FCI_PROP][Tag.SFI][0]
+    apps = []
+
+    # Apps may be stored in different records, so iterate through records
+    # until we hit an error
+    for i in range(1, 31):
+        try:
+            res = yield ReadCommand(i, sfi)
+        except ErrorResponse:
+            break
+        apps += directory_apps(res)
+    return apps
+
+
+def select_application_flow(app):
+    try:
+        return (yield SelectCommand(app))
+    except ErrorResponse as e:
+        raise MissingAppException(e)
+
+
+def get_data_item_flow(item, tag):
+    try:
+        res = yield GetDataCommand(item)
+    except ErrorResponse:
+        return None
+    return res.data[tag]
+
+
+def get_metadata_flow():
+    data = {}
+    for name, item, decode in METADATA_ITEMS:
+        res = yield from get_data_item_flow(item, item)
+        if res:
+            data[name] = decode(res)
+    return data
+
+
+def get_application_data_flow(afl):
+    data = TLV()
+    for sfi, record in afl_records(afl):
+        res = yield ReadCommand(record, sfi)
+        data.update(res.data[Tag.RECORD])
+    return data
+
+
+def verify_pin_flow(pin):
+    res = yield VerifyCommand(pin)
+    if isinstance(res, WarningResponse):
+        raise InvalidPINException(str(res))
+    return res
+
+
+def generate_cap_value_flow(pin, challenge=None, value=None):
+    apps = yield from list_applications_flow()
+
+    if len(apps) == 0:
+        raise MissingAppException("No apps on card")
+
+    # We're selecting the last app on the card here, which seems be the correct
+    # (bank-specific) one. If this isn't always the case, it may be better to
+    # select the app with ADF [A0 00 00 00 03 80 02].
+    yield from select_application_flow(apps[-1][Tag.ADF_NAME])
+
+    # Get Processing Options starts the transaction on the card and
+    # increments the transaction counter.
+    opts = processing_options((yield GetProcessingOptions()))
+
+    # Fetch the application data referenced in the processing options.
+    # This includes the CDOL data structure which dictates the format
+    # of the data passed to the Get Application Cryptogram function.
+    app_data = yield from get_application_data_flow(opts["AFL"])
+
+    yield from verify_pin_flow(pin)
+
+    resp = yield get_arqc_req(app_data, challenge=challenge, value=value)
+
+    ipb, psn = cap_parameters(app_data)
+    return get_cap_value(resp, ipb, psn)
+
+
+def static_aid_app(res):
+    """Convert the response to selecting a static AID into an application entry.
+
+    This is a bit of a hack, we transform this response into something which looks
+    like the result from the SFI method, so that callers of list_applications get a
+    consistent result.
+    """
+    return TLV(
+        {
+            Tag.ADF_NAME: res.data[Tag.FCI][Tag.DF],
+            Tag.APP_LABEL: res.data[Tag.FCI][Tag.FCI_PROP][Tag.APP_LABEL],
+        }
+    )
+
+
+def directory_apps(res):
+    """Return the application entries in a PSE directory record."""
+    apps = res.data[Tag.RECORD][Tag.APP]
+    if type(apps) is not list:
+        apps = [apps]
+    return apps
+
+
+def processing_options(res):
+    """Extract the AIP and AFL from a GET PROCESSING OPTIONS response."""
+    if Tag.RMTF1 in res.data:
+        # Response template format 1
+        return {"AIP": res.data[Tag.RMTF1][:2], "AFL": res.data[Tag.RMTF1][2:]}
+    elif Tag.RMTF2 in res.data:
+        # Response template format 2
+        return {"AIP": res.data[Tag.RMTF2][0x82], "AFL": res.data[Tag.RMTF2][0x94]}
+
+
+def afl_records(afl):
+    """Yield the (SFI, record number) of each record listed in an AFL."""
+    assert len(afl) % 4 == 0
+    for i in range(0, len(afl), 4):
+        sfi = afl[i] >> 3
+        start_rec = afl[i + 1]
+        end_rec = afl[i + 2]
+        # dar = afl[i + 3]
+        for j in range(start_rec, end_rec + 1):
+            yield sfi, j
+
+
+def cap_parameters(app_data):
+    """Return the (IPB, PSN) to use to calculate a CAP value from a card's application data."""
+    # Set default: don't use PAN Sequence Number
+    psn = None
+
+    # If the third bit of Issuer Authentication Flags is set then use the PAN Sequence Number
+    if Tag.IAF in app_data and app_data[Tag.IAF][0] & 0x40:
+        psn = app_data[Tag.PAN_SN]
+
+    # Fetch the Issuer Proprietary Bitmap. In most UK cards this is provided in the application data file.
+    #
+    # In some cases the IPB may not be present. This static IPB is from the EMVCAP code.
+    #
+    # It appears that Belgian cards use their own silliness.
+    # https://github.com/zoobab/EMVCAP/blob/master/EMV-CAP#L512
+    if Tag.IPB in app_data:
+        ipb = app_data[Tag.IPB]
+    else:
+        log.warn(
+            "Issuer Proprietary Bitmap not found on card - using static VISA IPB. "
+            "The resulting code may not work!"
+        )
+        ipb = VISA_STATIC_IPB
+
+    return ipb, psn
@@ -1,14 +1,14 @@
+""" The emvtool command line interface.
+
+    This is run many times from scripts, so the card and protocol modules, the
+    smartcard library and terminaltables are imported only by the commands which
+    need them, keeping startup fast.
+"""
 import sys
 import logging
-import smartcard
 import textwrap
 import click
-from terminaltables import SingleTable
 import emv
-from emv.card import Card
-from emv.protocol.data import Tag, render_element
-from emv.protocol.structures import TLV
-from emv.protocol.response import ErrorResponse
 from emv.exc import InvalidPINException, MissingAppException, CAPError
 from emv.util import format_bytes
 
@@ -16,8 +16,12 @@ LOG_LEVELS = {"info": logging.INFO, "debug": logging.DEBUG, "warn": logging.WARN
 
 
 def as_table(tlv, title=None, redact=False):
+    from terminaltables import SingleTable
+    from emv.protocol.data import render_element
+    from emv.protocol.structures import TLV
+
     res = [["Tag", "Name", "Value"]]
-    if type(tlv) is not TLV:
+    if not isinstance(tlv, TLV):
         return ""
     for tag, value in tlv.items():
         res.append(
@@ -33,13 +37,39 @@ def as_table(tlv, title=None, redact=False):
     return table.table
 
 
-def get_reader(reader):
+def get_reader(reader, record=None, redact=False):
+    """Return a Card on the given reader. If `record` is a path, every exchange
+    with the card is recorded to a trace file there, with PIN blocks masked if
+    `redact` is set."""
+    import smartcard
+    from emv.card import Card
+
     try:
-        return Card(smartcard.System.readers()[reader].createConnection())
+        connection = smartcard.System.readers()[reader].createConnection()
     except IndexError:
         click.echo("Reader or card not found")
         sys.exit(2)
 
+    if record is not None:
+        from emv.trace import TraceWriter, RecordingConnection
+
+        writer = TraceWriter(record)
+        click.get_current_context().call_on_close(writer.close)
+        connection = RecordingConnection(connection, writer, redact=redact)
+    return Card(connection)
+
+
+def get_card(ctx):
+    """Return a Card, according to the command line options."""
+    if ctx.obj.get("replay") is not None:
+        from emv.card import Card
+        from emv.trace import ReplayConnection
+
+        return Card(ReplayConnection.from_file(ctx.obj["replay"]))
+    return get_reader(
+        ctx.obj["reader"], record=ctx.obj.get("record"), redact=ctx.obj.get("redact")
+    )
+
 
 def run():
     "Command line entrypoint"
@@ -77,6 +107,19 @@ you initiate many transactions.
 @click.option(
     "--loglevel", "-l", type=str, metavar="LOGLEVEL", default="warn", help="log level"
 )
+@click.option(
+    "--record",
+    type=click.Path(dir_okay=False, writable=True),
+    metavar="FILE",
+    help="record all exchanges with the card to a binary trace file. This includes "
+    + "the PIN, unless --redact is given",
+)
+@click.option(
+    "--replay",
+    type=click.Path(exists=True, dir_okay=False),
+    metavar="FILE",
+    help="replay responses from a recorded trace file instead of using a reader",
+)
 @click.option(
     "--redact/--no-redact",
     default=False,
@@ -84,10 +127,12 @@ you initiate many transactions.
     + """- your card may send sensitive data in tags we don't know about!""",
 )
 @click.pass_context
-def cli(ctx, reader, pin, loglevel, redact):
+def cli(ctx, reader, pin, loglevel, record, replay, redact):
     logging.basicConfig(level=LOG_LEVELS[loglevel])
     ctx.obj["pin"] = pin
     ctx.obj["reader"] = reader
+    ctx.obj["record"] = record
+    ctx.obj["replay"] = replay
     ctx.obj["redact"] = redact
 
 
@@ -98,40 +143,48 @@ def version():
 
 @cli.command(help="List available card readers.")
 def readers():
+    import smartcard
+
     click.echo("Available card readers:\n")
     readers = smartcard.System.readers()
     for i in range(0, len(readers)):
         click.echo("%i: %s" % (i, readers[i]))
 
 
-def render_app(card, df, redact):
+def render_app(card, df, redact, exhaustive=False):
+    from emv.protocol.data import Tag
+
     data = card.select_application(df).data
 
     click.echo(
         as_table(data[Tag.FCI][Tag.FCI_PROP], "FCI Proprietary Data", redact=redact)
     )
-    for i in range(1, 31):
-        for j in range(1, 16):
-            try:
-                rec = card.read_record(j, sfi=i).data
-            except ErrorResponse:
-                continue
-            if Tag.RECORD in rec:
-                click.echo(
-                    as_table(rec[Tag.RECORD], "File: %s,%s" % (i, j), redact=redact)
-                )
+    for i, j, res in card.discover_records(exhaustive=exhaustive):
+        rec = res.data
+        if Tag.RECORD in rec:
+            click.echo(as_table(rec[Tag.RECORD], "File: %s,%s" % (i, j), redact=redact))
 
 
 @cli.command(help="Dump card information.")
+@click.option(
+    "--exhaustive",
+    is_flag=True,
+    help="try to read every record in every file, rather than stopping at the "
+    + "first missing record in each file (slow)",
+)
 @click.pass_context
-def info(ctx):
+def info(ctx, exhaustive):
+    from terminaltables import SingleTable
+    from emv.protocol.data import Tag, render_element
+    from emv.protocol.response import ErrorResponse
+
     redact = ctx.obj["redact"]
-    card = get_reader(ctx.obj["reader"])
+    card = get_card(ctx)
     apps = card.list_applications()
 
     click.secho("\n1PAY.SYS.DDF01 (Index of apps for chip payments)", bold=True)
     try:
-        render_app(card, "1PAY.SYS.DDF01", redact)
+        render_app(card, "1PAY.SYS.DDF01", redact, exhaustive)
     except MissingAppException:
         click.secho(
             "1PAY.SYS.DDF01 not available (this is normal on some cards)", fg="yellow"
@@ -141,7 +194,7 @@ def info(ctx):
 
     click.secho("\n2PAY.SYS.DDF01 (Index of apps for contactless payments)", bold=True)
     try:
-        render_app(card, "2PAY.SYS.DDF01", redact)
+        render_app(card, "2PAY.SYS.DDF01", redact, exhaustive)
     except MissingAppException:
         click.secho(
             "2PAY.SYS.DDF01 not available (this is normal on some cards)", fg="yellow"
@@ -158,7 +211,7 @@ def info(ctx):
             ),
             bold=True,
         )
-        render_app(card, app[Tag.ADF_NAME], redact)
+        render_app(card, app[Tag.ADF_NAME], redact, exhaustive)
 
     click.echo("\nFetching card metadata...")
     try:
@@ -188,7 +241,7 @@ def cap(ctx, challenge, amount):
         click.secho("Challenge (account number) must be supplied with amount", fg="red")
         sys.exit(3)
 
-    card = get_reader(ctx.obj["reader"])
+    card = get_card(ctx)
     try:
         click.echo(card.generate_cap_value(pin, challenge=challenge, value=amount))
     except InvalidPINException:
@@ -202,7 +255,10 @@ def cap(ctx, challenge, amount):
 @cli.command(help="List named applications on the card.")
 @click.pass_context
 def listapps(ctx):
-    card = get_reader(ctx.obj["reader"])
+    from terminaltables import SingleTable
+    from emv.protocol.data import Tag, render_element
+
+    card = get_card(ctx)
     apps = card.list_applications()
     res = [["Index", "Label", "ADF"]]
     i = 0
@@ -228,8 +284,11 @@ This will initiate a transaction on the card."""
 @click.argument("app_index", type=int)
 @click.pass_context
 def appdata(ctx, app_index):
+    from terminaltables import SingleTable
+    from emv.protocol.data import Tag, render_element
+
     redact = ctx.obj["redact"]
-    card = get_reader(ctx.obj["reader"])
+    card = get_card(ctx)
     apps = card.list_applications()
     app = apps[app_index]
     card.select_application(app[Tag.ADF_NAME])
@@ -261,12 +320,14 @@ This will initiate a transaction on the card."""
 @click.argument("app_index", type=int)
 @click.pass_context
 def verifypin(ctx, app_index):
+    from emv.protocol.data import Tag
+
     pin = ctx.obj.get("pin", None)
     if not pin:
         click.secho("PIN is required", fg="red")
         sys.exit(2)
 
-    card = get_reader(ctx.obj["reader"])
+    card = get_card(ctx)
     apps = card.list_applications()
     app = apps[app_index]
     card.select_application(app[Tag.ADF_NAME])
@@ -12,3 +12,7 @@ class MissingAppException(EMVProtocolError):
 
 class CAPError(EMVProtocolError):
     pass
+
+
+class ReplayError(EMVProtocolError):
+    pass
@@ -0,0 +1,123 @@
+""" Running operations across many readers in parallel.
+
+    A ReaderPool keeps a Card for each reader, and runs a callable on every card
+    at once using a thread pool, for example to audit PIN retry counters across a
+    rack of readers:
+
+        pool = ReaderPool.from_readers()
+        report = pool.run(Card.get_metadata)
+        for result in report:
+            print(result.reader, result.result or result.error)
+        print("%.1f cards/s" % report.throughput)
+"""
+import logging
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from .card import Card
+
+log = logging.getLogger(__name__)
+
+# The outcome of running a job on one reader: either `result` is the return value,
+# or `error` is the exception raised. `duration` is in seconds.
+PoolResult = namedtuple("PoolResult", ["reader", "result", "error", "duration"])
+
+
+class PoolReport(object):
+    """The results of running a job across a ReaderPool, in reader order."""
+
+    def __init__(self, results, duration):
+        self.results = results
+        self.duration = duration
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+    @property
+    def succeeded(self):
+        return [r for r in self.results if r.error is None]
+
+    @property
+    def failed(self):
+        return [r for r in self.results if r.error is not None]
+
+    @property
+    def throughput(self):
+        """Cards successfully processed per second."""
+        if self.duration == 0:
+            return 0.0
+        return len(self.succeeded) / self.duration
+
+    def __repr__(self):
+        return "<PoolReport: %s succeeded, %s failed in %.2fs (%.1f cards/s)>" % (
+            len(self.succeeded),
+            len(self.failed),
+            self.duration,
+            self.throughput,
+        )
+
+
+class ReaderPool(object):
+    """A pool of readers, with a Card for each.
+
+    `connections` is a dict of reader name -> pyscard-style connection. Cards are
+    connected when first used; if connecting fails (for example if there's no card
+    in the reader) it's retried on the next run.
+    """
+
+    def __init__(self, connections, max_workers=None):
+        self.connections = dict(connections)
+        self.max_workers = max_workers or max(len(self.connections), 1)
+        self.cards = {}
+
+    @classmethod
+    def from_readers(cls, readers=None, max_workers=None):
+        """Create a pool from PC/SC readers, by default every reader on the system."""
+        if readers is None:
+            import smartcard
+
+            readers = smartcard.System.readers()
+        return cls(
+            {str(reader): reader.createConnection() for reader in readers},
+            max_workers=max_workers,
+        )
+
+    def card(self, reader):
+        """Return the Card in a reader, connecting to it if necessary."""
+        if reader not in self.cards:
+            self.cards[reader] = Card(self.connections[reader])
+        return self.cards[reader]
+
+    def _run_one(self, reader, func, args, kwargs):
+        start = time.monotonic()
+        try:
+            card = self.card(reader)
+        except Exception as e:
+            log.info("Unable to connect to %s: %s", reader, e)
+            return PoolResult(reader, None, e, time.monotonic() - start)
+
+        try:
+            result = func(card, *args, **kwargs)
+        except Exception as e:
+            log.info("Error on %s: %s", reader, e)
+            return PoolResult(reader, None, e, time.monotonic() - start)
+        return PoolResult(reader, result, None, time.monotonic() - start)
+
+    def run(self, func, *args, readers=None, **kwargs):
+        """Call `func(card, *args, **kwargs)` on the card in each reader in parallel,
+        returning a PoolReport. Exceptions are collected in the report rather than
+        raised. `readers` limits the job to a subset of readers."""
+        if readers is None:
+            readers = list(self.connections)
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(self._run_one, reader, func, args, kwargs)
+                for reader in readers
+            ]
+            results = [future.result() for future in futures]
+        return PoolReport(results, time.monotonic() - start)
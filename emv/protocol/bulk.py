@@ -0,0 +1,176 @@
+""" Bulk TLV boundary scanning with NumPy.
+
+    This decodes the structure (tags, lengths and value offsets) of a large number of
+    TLV records at once, for example READ RECORD responses stored for analytics.
+    Records are packed into one contiguous buffer, with an array of offsets marking
+    where each record starts and ends.
+
+    Rather than parsing each record in turn, every record is stepped through in
+    parallel: each iteration decodes the next element of all records using vectorised
+    operations, so the number of Python-level operations depends on the number of
+    elements per record rather than the number of records. Single and two-byte tags,
+    and one to three-byte lengths are decoded in NumPy; anything more exotic falls back
+    to the scalar `read_tag`/`read_length` functions.
+
+    This module requires NumPy (`pip install emv[numpy]`).
+"""
+from collections import namedtuple
+import numpy as np
+from .data import read_tag, read_length
+
+# Each field is an array with one item per element found:
+#   record: index of the record containing the element
+#   offset: offset of the element's tag in the buffer
+#   tag: the tag as an integer (its bytes in big-endian order, as in Tag.key). This
+#        is a uint64 array, or an object array of Python ints if any tag is too
+#        long to fit in an int64 (which is only possible for tags of eight or more bytes).
+#   length: length of the element's value
+#   value_offset: offset of the element's value in the buffer
+#   constructed: whether the element is constructed
+#   depth: nesting depth of the element within its record (always 0 unless descending)
+ScanResult = namedtuple(
+    "ScanResult",
+    ["record", "offset", "tag", "length", "value_offset", "constructed", "depth"],
+)
+
+
+# Largest tag which fits in the int64 array used while scanning
+MAX_TAG = 2**63 - 1
+
+
+def pack_records(records):
+    """Pack a sequence of records (each a bytes-like object or list of bytes) into
+    one buffer. Returns the buffer, and an array of n + 1 offsets, where record i
+    occupies buffer[offsets[i]:offsets[i + 1]]."""
+    records = [bytes(r) for r in records]
+    offsets = np.zeros(len(records) + 1, dtype=np.int64)
+    np.cumsum([len(r) for r in records], out=offsets[1:])
+    return b"".join(records), offsets
+
+
+def _scalar_element(data, pos):
+    """Decode an element header with the scalar functions, returning
+    (tag key, tag length, length, length length)."""
+    tag, tag_len = read_tag(data, pos)
+    length, length_len = read_length(data, pos + tag_len)
+    return int.from_bytes(bytes(tag), "big"), tag_len, length, length_len
+
+
+def scan_records(buffer, offsets, descend=False):
+    """Scan the TLV structure of every record in a buffer.
+
+    `offsets` is an array of n + 1 offsets delimiting n records, as returned by
+    `pack_records`. If `descend` is True, the children of constructed elements are
+    scanned too, otherwise only top-level elements are returned.
+
+    Returns a ScanResult of arrays, ordered by offset. As with TLV.unmarshal, a
+    record which ends part-way through an element header stops at that element, and
+    values running past the end of their record are truncated.
+    """
+    buf = np.frombuffer(buffer, dtype=np.uint8)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    ends = offsets[1:]
+    cursor = offsets[:-1].copy()
+    last = max(len(buf) - 1, 0)
+
+    results = []
+    # Parent (start, end) value ranges descended into, used to calculate depth
+    parents = []
+
+    active = np.flatnonzero(cursor < ends)
+    while active.size:
+        pos = cursor[active]
+        end = ends[active]
+
+        b0 = buf[pos].astype(np.int64)
+        b1 = buf[np.minimum(pos + 1, last)].astype(np.int64)
+        multi = (b0 & 0x1F) == 0x1F
+        tag = np.where(multi, (b0 << 8) | b1, b0)
+        tag_len = np.where(multi, 2, 1)
+
+        lpos = pos + tag_len
+        l0 = buf[np.minimum(lpos, last)].astype(np.int64)
+        l1 = buf[np.minimum(lpos + 1, last)].astype(np.int64)
+        l2 = buf[np.minimum(lpos + 2, last)].astype(np.int64)
+        length = np.select([l0 == 0x81, l0 == 0x82], [l1, (l1 << 8) | l2], l0)
+        length_len = np.select([l0 == 0x81, l0 == 0x82], [2, 3], 1)
+
+        # Tags longer than two bytes, and any long-form length other than 0x81 and
+        # 0x82 (including 0x80, which the scalar read_length reads as zero), are
+        # decoded with the scalar functions.
+        exotic = np.flatnonzero(
+            (multi & ((b1 & 0x80) != 0)) | (l0 == 0x80) | (l0 > 0x82)
+        )
+        if exotic.size:
+            data = memoryview(buffer)
+            for i in exotic:
+                p = int(pos[i])
+                try:
+                    element = _scalar_element(data, p)
+                except IndexError:
+                    # Truncated at the end of the buffer, mark as invalid
+                    tag_len[i] = end[i] - p
+                    length_len[i] = 0
+                    continue
+                key, t_len, value_len, l_len = element
+                if key > MAX_TAG and tag.dtype != object:
+                    # Very long tags don't fit in an integer array
+                    tag = tag.astype(object)
+                # Values are truncated at the end of the record anyway, and clamping
+                # keeps very long lengths within the integer array.
+                value_len = min(value_len, max(0, int(end[i]) - (p + t_len + l_len)))
+                tag[i], tag_len[i], length[i], length_len[i] = (
+                    key,
+                    t_len,
+                    value_len,
+                    l_len,
+                )
+
+        value_offset = pos + tag_len + length_len
+        # The tag and length must fit within the record
+        valid = (pos + tag_len < end) & (value_offset <= end)
+        value_end = np.minimum(value_offset + length, end)
+        constructed = (b0 & 0x20) != 0
+
+        results.append(
+            (
+                active[valid],
+                pos[valid],
+                tag[valid],
+                (value_end - value_offset)[valid],
+                value_offset[valid],
+                constructed[valid],
+            )
+        )
+
+        if descend:
+            # As in TLV.unmarshal, only descend into values long enough to hold an element
+            into = valid & constructed & (value_end - value_offset >= 3)
+            parents.append((value_offset[into], value_end[into]))
+            next_pos = np.where(into, value_offset, value_offset + length)
+        else:
+            next_pos = value_offset + length
+
+        cursor[active] = np.where(valid, next_pos, end)
+        active = active[cursor[active] < end]
+
+    if results:
+        fields = [np.concatenate(f) for f in zip(*results)]
+    else:
+        fields = [np.zeros(0, dtype=np.int64)] * 5 + [np.zeros(0, dtype=bool)]
+
+    order = np.argsort(fields[1], kind="stable")
+    record, offset, tag, length, value_offset, constructed = [f[order] for f in fields]
+
+    if parents:
+        opens = np.sort(np.concatenate([p[0] for p in parents]))
+        closes = np.sort(np.concatenate([p[1] for p in parents]))
+        depth = np.searchsorted(opens, offset, "right") - np.searchsorted(
+            closes, offset, "right"
+        )
+    else:
+        depth = np.zeros(len(offset), dtype=np.int64)
+
+    if tag.dtype != object:
+        tag = tag.astype(np.uint64)
+    return ScanResult(record, offset, tag, length, value_offset, constructed, depth)
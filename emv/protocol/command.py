@@ -1,71 +1,132 @@
+from functools import lru_cache
 from ..util import format_bytes
+from ..exc import EMVProtocolError
 import codecs
 
 
 def assert_valid_byte(val):
     assert type(val) == int
-    assert val < 0xFF
+    assert val <= 0xFF
     assert val >= 0x00
 
 
+@lru_cache(maxsize=1024)
+def encode_apdu(header, p1, p2, data, le):
+    """Encode a command APDU as bytes, given its CLA/INS header (as bytes), P1, P2,
+    data (bytes or None) and Le (or None).
+
+    Encodings are cached, so repeated commands (such as SELECTs of the same
+    application, or READ RECORDs of the same record) are only built once. Commands
+    with secret or one-off data are encoded with `encode_apdu.__wrapped__`, which
+    bypasses the cache, see CAPDU.CACHE_ENCODING.
+    """
+    # Mandatory header:
+    apdu = bytearray(header)
+    apdu.append(p1)
+    apdu.append(p2)
+
+    # Conditional body:
+    if data is not None:
+        apdu.append(len(data))  # Lc
+        apdu += data
+
+    # Bytes expected:
+    if le is not None:
+        apdu.append(le)  # Le
+    return bytes(apdu)
+
+
 class CAPDU(object):
     """Command APDU.
 
+    Commands are validated when they're constructed, and encode to immutable bytes.
+
     Defined in: EMV 4.3 Book 1 sections:
         - 9.4.1
         - 11.1
     """
 
-    # Map the class name of the command to the CLA,INS bytes.
+    # CLA, INS bytes of the command, set on each subclass.
     # This is derived from EMV 4.3 Book 3 section 6.3.2.
-    COMMANDS = {
-        "SelectCommand": [0x00, 0xA4],
-        "VerifyCommand": [0x00, 0x20],
-        "ReadCommand": [0x00, 0xB2],
-        "GetDataCommand": [0x80, 0xCA],
-        "GenerateApplicationCryptogramCommand": [0x80, 0xAE],
-        "GetProcessingOptions": [0x80, 0xA8],
-    }
-
-    def marshal(self):
-        cla, ins = self.COMMANDS.get(self.__class__.__name__)
-
-        for val in [cla, ins, self.p1, self.p2]:
-            assert_valid_byte(val)
+    HEADER = None
+    _data = None
+    # Whether to cache the encoding. Commands carrying secrets (PIN blocks) or data
+    # which is different every time (cryptogram requests) aren't cached.
+    CACHE_ENCODING = True
+
+    def __init__(self, p1, p2, data=None, le=None):
+        assert_valid_byte(p1)
+        assert_valid_byte(p2)
+        if le is not None:
+            assert_valid_byte(le)
+        self.p1 = p1
+        self.p2 = p2
+        self.data = data
+        self.le = le
 
-        # Mandatory header:
-        cmd = [cla, ins, self.p1, self.p2]
+    @property
+    def data(self):
+        return self._data
 
-        # Conditional body:
-        if self.data is not None:
-            cmd += [len(self.data)]  # Lc
-            cmd += self.data
+    @data.setter
+    def data(self, data):
+        if data is not None:
+            data = bytes(data)
+            assert len(data) <= 0xFF
+        self._data = data
 
-        # Bytes expected:
-        if self.le is not None:
-            cmd += [self.le]  # Le
-        return cmd
+    def marshal(self):
+        """Encode the command as bytes."""
+        if self.CACHE_ENCODING:
+            return encode_apdu(self.HEADER, self.p1, self.p2, self._data, self.le)
+        return encode_apdu.__wrapped__(
+            self.HEADER, self.p1, self.p2, self._data, self.le
+        )
 
     @classmethod
     def get_class(cls, pdu_bytes):
-        for clsname, b in cls.COMMANDS.items():
-            if pdu_bytes == b:
-                return globals()[clsname]
-        return None
+        """Return the command class for a CLA, INS pair, or None if it's unknown.
+
+        The low bits of the CLA byte (logical channel and secure messaging) are ignored.
+        """
+        return COMMAND_CLASSES.get((pdu_bytes[0] & 0xF0, pdu_bytes[1]))
 
     @classmethod
     def unmarshal(cls, data):
-        pcls = cls.get_class(data[:2])
-        obj = object.__new__(pcls)
+        """Decode a command APDU from its binary representation. Commands which
+        aren't known are returned as UnknownCommand objects."""
+        length = len(data)
+        if length < 4:
+            raise EMVProtocolError("Command APDU too short (%s bytes)" % length)
+
+        pcls = COMMAND_CLASSES.get((data[0] & 0xF0, data[1]))
+        obj = object.__new__(pcls or UnknownCommand)
+        if pcls is None:
+            obj.HEADER = bytes(data[:2])
         obj.p1 = data[2]
         obj.p2 = data[3]
-        if len(data) > 5:
-            obj.lc = data[4]
-            obj.data = data[5 : obj.lc + 5]
-        if len(data) > obj.lc + 5:
-            obj.le = data[-1]
-        else:
+
+        # The four cases of ISO 7816-4 section 5.1
+        if length == 4:
+            # Case 1: no data, no Le
             obj.le = None
+        elif length == 5:
+            # Case 2: Le only
+            obj.le = data[4]
+        else:
+            lc = data[4]
+            if length == lc + 5:
+                # Case 3: data only
+                obj.le = None
+            elif length == lc + 6:
+                # Case 4: data and Le
+                obj.le = data[-1]
+            else:
+                raise EMVProtocolError(
+                    "Command APDU length (%s bytes) inconsistent with Lc (%s)"
+                    % (length, lc)
+                )
+            obj.data = data[5 : lc + 5]
         return obj
 
     def __repr__(self):
@@ -73,11 +134,37 @@ class CAPDU(object):
             self.name,
             self.p1,
             self.p2,
-            format_bytes(self.data),
+            "None" if self.data is None else format_bytes(self.data),
             self.le or 0,
         )
 
 
+class UnknownCommand(CAPDU):
+    """A command which we don't know about, as returned by CAPDU.unmarshal."""
+
+    name = "Unknown"
+
+    def __init__(self, cla, ins, p1, p2, data=None, le=None):
+        assert_valid_byte(cla)
+        assert_valid_byte(ins)
+        self.HEADER = bytes([cla, ins])
+        super().__init__(p1, p2, data, le)
+
+    def __repr__(self):
+        return (
+            "<Command[%s] CLA: %02x, INS: %02x, P1: %02x, P2: %02x, data: %s, Le: %02x>"
+            % (
+                self.name,
+                self.HEADER[0],
+                self.HEADER[1],
+                self.p1,
+                self.p2,
+                "None" if self.data is None else format_bytes(self.data),
+                self.le or 0,
+            )
+        )
+
+
 class SelectCommand(CAPDU):
     """Select an application or file on the card.
 
@@ -85,24 +172,25 @@ class SelectCommand(CAPDU):
     """
 
     name = "Select"
+    HEADER = bytes([0x00, 0xA4])
 
     def __init__(self, file_path=None, file_identifier=None, next_occurrence=False):
         if file_path is not None:
             if isinstance(file_path, str):
-                self.data = [ord(c) for c in file_path]
+                data = file_path.encode("latin-1")
             else:
-                self.data = file_path
-            self.p1 = 0x04  # Select by path
+                data = file_path
+            p1 = 0x04  # Select by path
         else:
-            self.data = file_identifier
-            self.p1 = 0x00
+            data = file_identifier
+            p1 = 0x00
 
         if next_occurrence:
-            self.p2 = 0x02  # Next occurrence
+            p2 = 0x02  # Next occurrence
         else:
-            self.p2 = 0x00  # First or only occurrence
+            p2 = 0x00  # First or only occurrence
 
-        self.le = 0x00
+        super().__init__(p1, p2, data, 0x00)
 
     def __repr__(self):
         data = " ".join(["%02x" % i for i in self.data])
@@ -122,6 +210,7 @@ class ReadCommand(CAPDU):
     """
 
     name = "Read"
+    HEADER = bytes([0x00, 0xB2])
 
     P2_RECORD_NUMBER = 0x04  # P1 is a record number
 
@@ -129,14 +218,12 @@ class ReadCommand(CAPDU):
         assert type(sfi) == int or sfi is None
         assert type(record_number) == int
 
-        self.p1 = record_number
         if sfi is not None:
-            self.p2 = (sfi << 3) + self.P2_RECORD_NUMBER
+            p2 = (sfi << 3) + self.P2_RECORD_NUMBER
         else:
-            self.p2 = 0x04
+            p2 = 0x04
 
-        self.data = None
-        self.le = 0x00
+        super().__init__(record_number, p2, None, 0x00)
 
 
 class GetDataCommand(CAPDU):
@@ -146,6 +233,7 @@ class GetDataCommand(CAPDU):
     """
 
     name = "Get Data"
+    HEADER = bytes([0x80, 0xCA])
 
     ATC = (0x9F, 0x36)
     LAST_ONLINE_ATC = (0x9F, 0x13)
@@ -154,10 +242,7 @@ class GetDataCommand(CAPDU):
 
     def __init__(self, obj):
         assert type(obj) == tuple
-        self.p1 = obj[0]
-        self.p2 = obj[1]
-        self.data = None
-        self.le = 0x00
+        super().__init__(obj[0], obj[1], None, 0x00)
 
 
 class VerifyCommand(CAPDU):
@@ -167,6 +252,8 @@ class VerifyCommand(CAPDU):
     """
 
     name = "Verify"
+    HEADER = bytes([0x00, 0x20])
+    CACHE_ENCODING = False
 
     PIN_PLAINTEXT = 0b10000000
     PIN_ENCIPHERED = 0b10001000
@@ -174,23 +261,21 @@ class VerifyCommand(CAPDU):
     def __init__(self, pin):
         assert 4 <= len(str(pin)) <= 12
 
-        self.p1 = 0x00
-        self.p2 = self.PIN_PLAINTEXT
-
         # Fields in this data structure are split on a nibble boundary,
         # so assemble as a hex string and decode
         data = ("2%x%s" % (len(str(pin)), pin)).encode("ascii")
         while len(data) < 16:
             data += b"f"
-        self.data = codecs.decode(data, "hex")
 
-        self.le = None
+        super().__init__(0x00, self.PIN_PLAINTEXT, codecs.decode(data, "hex"), None)
 
 
 class GenerateApplicationCryptogramCommand(CAPDU):
     """Defined in: EMV 4.3 Book 3 section 6.5.5"""
 
     name = "Generate Application Cryptogram"
+    HEADER = bytes([0x80, 0xAE])
+    CACHE_ENCODING = False
 
     # Table 12
     AAC = 0b00000000
@@ -199,28 +284,52 @@ class GenerateApplicationCryptogramCommand(CAPDU):
     CDA_SIG = 0b00010000
 
     def __init__(self, crypto_type, data, cda_sig=False):
-
-        self.p1 = crypto_type
+        p1 = crypto_type
         if cda_sig:
-            self.p1 |= self.CDA_SIG
+            p1 |= self.CDA_SIG
 
-        self.data = data
-
-        self.p2 = 0x00
-        self.le = 0x00
+        super().__init__(p1, 0x00, data, 0x00)
 
 
 class GetProcessingOptions(CAPDU):
     """Defined in: EMV 4.3 Book 3 section 6.5.8"""
 
     name = "Get Processing Opts"
+    HEADER = bytes([0x80, 0xA8])
 
     def __init__(self, pdol=None):
-        self.p1 = 0x00
-        self.p2 = 0x00
         if pdol is None:
-            self.data = [0x83, 0x00]
+            data = b"\x83\x00"
         else:
-            self.data = [0x83, len(pdol)]
-            self.data.extend(pdol)
-        self.le = 0x00
+            data = bytes([0x83, len(pdol)]) + bytes(pdol)
+        super().__init__(0x00, 0x00, data, 0x00)
+
+
+class GetResponseCommand(CAPDU):
+    """Retrieve response data which the card has indicated is available (SW1 0x61).
+
+    Defined in: EMV 4.3 Book 1 section 9.3.1.3
+    """
+
+    name = "Get Response"
+    HEADER = bytes([0x00, 0xC0])
+
+    def __init__(self, le):
+        super().__init__(0x00, 0x00, None, le)
+
+
+COMMAND_TYPES = (
+    SelectCommand,
+    VerifyCommand,
+    ReadCommand,
+    GetDataCommand,
+    GenerateApplicationCryptogramCommand,
+    GetProcessingOptions,
+    GetResponseCommand,
+)
+
+# Map the class name of each command to its CLA,INS bytes.
+CAPDU.COMMANDS = {cls.__name__: list(cls.HEADER) for cls in COMMAND_TYPES}
+
+# Map (CLA, INS) to command class, for decoding.
+COMMAND_CLASSES = {(cls.HEADER[0], cls.HEADER[1]): cls for cls in COMMAND_TYPES}
@@ -4,8 +4,8 @@
     Tag coding is described in:
         EMV Version 4.3 Book 3 Annex B1
 """
-from functools import total_ordering
-import pycountry
+import threading
+from functools import total_ordering, lru_cache
 from .data_elements import ELEMENT_TABLE, SENSITIVE_TAGS, Parse
 from ..util import format_bytes, from_hex_int, from_hex_date, decode_int
 
@@ -33,34 +33,32 @@ def is_constructed(val):
     return val & 0b00100000 == 0b00100000
 
 
-def read_tag(data):
-    """Read a variable-length tag from a list of bytes, starting at the
-    first byte. Returns the tag, plus the number of bytes read from
-    the list.
+def read_tag(data, offset=0):
+    """Read a variable-length tag from a sequence of bytes, starting at
+    `offset`. Returns the tag, plus the number of bytes read from
+    the sequence.
 
     EMV 4.3 Book 3 Annex B1
     """
-    i = 0
+    i = offset
     tag = [data[i]]
     if is_two_byte(data[i]):
         i += 1
-        tag += [data[i]]
+        tag.append(data[i])
         while len(data) > i and is_continuation(data[i]):
             i += 1
-            tag += [data[i]]
-        i += 1
-    else:
-        i += 1
-    return tag, i
+            tag.append(data[i])
+    i += 1
+    return tag, i - offset
 
 
-def read_length(data):
-    """Read length from a list of bytes, starting at the first byte.
-    Returns the length, plus the number of bytes read from the list.
+def read_length(data, offset=0):
+    """Read length from a sequence of bytes, starting at `offset`.
+    Returns the length, plus the number of bytes read from the sequence.
 
     EMV 4.3 Book 3 Annex B2
     """
-    i = 0
+    i = offset
     length = data[i]
     i += 1
     if length & 0x80:
@@ -69,59 +67,127 @@ def read_length(data):
         for j in range(length_bytes_count):
             length = (length << 8) + data[i + j]
         i += length_bytes_count
-    return length, i
+    return length, i - offset
+
+
+def length_size(length):
+    """Number of bytes needed to encode a length.
+
+    EMV 4.3 Book 3 Annex B2
+    """
+    if length < 0x80:
+        return 1
+    return 1 + (length.bit_length() + 7) // 8
+
+
+def write_length(buf, offset, length):
+    """Write an encoded length into a bytearray at `offset`, returning the offset
+    of the next byte after it.
+
+    EMV 4.3 Book 3 Annex B2
+    """
+    if length < 0x80:
+        buf[offset] = length
+        return offset + 1
+    size = length_size(length) - 1
+    buf[offset] = 0x80 | size
+    buf[offset + 1 : offset + 1 + size] = length.to_bytes(size, "big")
+    return offset + 1 + size
 
 
 @total_ordering
 class Tag(object):
-    """Represents a data tag. Provides ordering and pretty rendering."""
+    """Represents a data tag. Provides ordering and pretty rendering.
+
+    Tags are interned, so there is only one Tag instance for each tag value.
+    Tags can be constructed from:
+        - an integer: either a single-byte tag (0x5A), or the big-endian value
+          of a multi-byte tag (0x9F37)
+        - a list, tuple or bytes of the tag's bytes ([0x9F, 0x37])
+        - another Tag, which returns the same instance
+    """
 
-    def __init__(self, value):
-        if type(value) in (list, tuple) and len(value) == 1:
-            self.value = value[0]
-        elif type(value) == int:
-            self.value = value
-        else:
-            self.value = list(value)
+    __slots__ = ("key", "id", "encoded", "name", "_hash")
 
-    @property
-    def id(self):
-        if type(self.value) == list:
-            return tuple(self.value)
+    # Interned instances, keyed by every form a tag can be constructed from.
+    _interned = {}
+    # Held while creating a tag, so that it is only created once.
+    _intern_lock = threading.Lock()
+
+    def __new__(cls, value):
+        if type(value) is Tag:
+            return value
+        try:
+            return cls._interned[value]
+        except KeyError:
+            pass
+        except TypeError:
+            # Unhashable, most likely a list from read_tag
+            value = tuple(value)
+            tag = cls._interned.get(value)
+            if tag is not None:
+                return tag
+
+        if type(value) is int:
+            encoded = value.to_bytes(max(1, (value.bit_length() + 7) // 8), "big")
         else:
-            return self.value
+            encoded = bytes(value)
+        if len(encoded) == 0:
+            raise ValueError("Empty tag")
+        with cls._intern_lock:
+            # Another thread may have created the tag since the lookup above.
+            tag = cls._interned.get(tuple(encoded))
+            if tag is not None:
+                return tag
+
+            tag = object.__new__(cls)
+            # Canonical integer representation, used for ordering
+            tag.key = int.from_bytes(encoded, "big")
+            # The form used in DATA_ELEMENTS and friends: an int for single-byte
+            # tags, and a tuple for multi-byte tags.
+            tag.id = encoded[0] if len(encoded) == 1 else tuple(encoded)
+            tag.encoded = encoded
+            tag.name = DATA_ELEMENTS.get(tag.id)
+            # Tags hash the same as their id, so they can be looked up by id in dicts.
+            tag._hash = hash(tag.id)
+
+            cls._interned[tag.id] = tag
+            cls._interned[tag.key] = tag
+            cls._interned[tuple(encoded)] = tag
+        return tag
 
     @property
-    def name(self):
-        if type(self.value) == list:
-            return DATA_ELEMENTS.get(tuple(self.value))
-        else:
-            return DATA_ELEMENTS.get(self.value)
+    def value(self):
+        if type(self.id) is tuple:
+            return list(self.id)
+        return self.id
 
     def __hash__(self):
-        if type(self.value) == list:
-            return hash(tuple(self.value))
-        return hash(self.value)
+        return self._hash
 
     def __eq__(self, other):
-        if type(other) == Tag:
-            return self.value == other.value
-        if type(other) in (tuple, list) and type(self.value) == list:
-            return tuple(other) == tuple(self.value)
-
-        return self.name == other or self.value == other
+        if other is self:
+            return True
+        if type(other) is Tag:
+            # Tags are interned, so a different instance is a different tag.
+            return False
+        if type(other) is str:
+            return self.name == other
+        if type(other) in (tuple, list):
+            return type(self.id) is tuple and tuple(other) == self.id
+        return self.id == other
 
     def __lt__(self, other):
-        if type(other) == Tag:
-            return self.value < other.value
+        return self.key < Tag(other).key
 
-        return self.value < other
+    def __reduce__(self):
+        return (Tag, (self.id,))
 
     def __repr__(self):
-        if type(self.value) == list:
-            val = format_bytes(self.value)
+        if type(self.id) is tuple:
+            val = format_bytes(self.id)
         else:
-            val = "%02X" % self.value
+            val = "%02X" % self.id
 
         if self.name:
             return "(%s) %s" % (val, self.name)
@@ -132,7 +198,55 @@ class Tag(object):
 # Set element shortnames as static attributes on the Tag object.
 for tag, _, _, shortname in ELEMENT_TABLE:
     if shortname is not None:
-        setattr(Tag, shortname, tag)
+        setattr(Tag, shortname, Tag(tag))
+
+
+def _pycountry_lookup(database, numeric, attribute):
+    """Fall back to pycountry for codes missing from the precomputed tables,
+    importing it only when needed."""
+    try:
+        import pycountry
+    except ImportError:
+        return None
+    entry = getattr(pycountry, database).get(numeric="%03d" % numeric)
+    if entry is None:
+        return None
+    return getattr(entry, attribute)
+
+
+@lru_cache(maxsize=None)
+def country_code(numeric):
+    """Return the ISO 3166 alpha-2 code for a numeric country code, or None if unknown."""
+    from .iso_codes import COUNTRIES
+
+    code = COUNTRIES.get(numeric)
+    if code is None:
+        code = _pycountry_lookup("countries", numeric, "alpha_2")
+    return code
+
+
+@lru_cache(maxsize=None)
+def currency_code(numeric):
+    """Return the ISO 4217 alpha-3 code for a numeric currency code, or None if unknown."""
+    from .iso_codes import CURRENCIES
+
+    code = CURRENCIES.get(numeric)
+    if code is None:
+        code = _pycountry_lookup("currencies", numeric, "alpha_3")
+    return code
+
+
+@lru_cache(maxsize=1024)
+def _render_iso_code(parse, value):
+    try:
+        numeric = from_hex_int(value)
+    except ValueError:
+        numeric = None
+    if parse == Parse.COUNTRY:
+        code = None if numeric is None else country_code(numeric)
+        return code or "<Invalid country: %s>" % list(value)
+    code = None if numeric is None else currency_code(numeric)
+    return code or "<Invalid currency: %s>" % list(value)
 
 
 def render_element(tag, value, redact=False):
@@ -142,7 +256,15 @@ def render_element(tag, value, redact=False):
     if redact and tag in SENSITIVE_TAGS:
         return "[REDACTED]"
 
-    if type(value).__name__ in ("TLV", "DOL", "TagList", "ASRPD", "CVMList", "AUC"):
+    if type(value).__name__ in (
+        "TLV",
+        "LazyTLV",
+        "DOL",
+        "TagList",
+        "ASRPD",
+        "CVMList",
+        "AUC",
+    ):
         return repr(value)
 
     if value is None:
@@ -162,11 +284,6 @@ def render_element(tag, value, redact=False):
         return from_hex_date(value)
     if parse == Parse.INT:
         return str(decode_int(value))
-    if parse == Parse.COUNTRY:
-        try:
-            return pycountry.countries.get(numeric=str(from_hex_int(value))).alpha_2
-        except ValueError:
-            return "<Invalid country: %s>" % value
-    if parse == Parse.CURRENCY:
-        return pycountry.currencies.get(numeric=str(from_hex_int(value))).alpha_3
+    if parse == Parse.COUNTRY or parse == Parse.CURRENCY:
+        return _render_iso_code(parse, bytes(value))
     return format_bytes(value)
@@ -0,0 +1,178 @@
+""" Path queries over TLV structures.
+
+    A path is a list of tags separated by slashes, each of which may be given as
+    a hex tag value or as a tag shortname. A segment which is a complete, well-formed
+    tag in hex is read as hex, otherwise it must be a shortname (so "DF" is the DF
+    shortname, as DF on its own isn't a complete tag). For example:
+
+        "6F/A5/50"              Application label in an FCI template
+        "FCI/FCI_PROP/SFI"      SFI in an FCI template
+        "**/8C"                 CDOL1, wherever it appears
+        "70/*"                  Every element in a record template
+
+    "*" matches any single tag, and "**" matches any number of levels (including none).
+    Paths can also be given as a sequence of segments, each a Tag, anything a Tag
+    can be constructed from, or a string as above, e.g. (Tag.FCI, Tag.FCI_PROP, "*").
+
+    Paths are compiled once (and cached), and use the flattened index on a TLV if
+    it was unmarshalled with `index=True`.
+"""
+import re
+from functools import lru_cache
+from .data import Tag, read_tag
+from .structures import TLV, occurrences
+
+ANY = "*"
+ANY_DEPTH = "**"
+
+HEX_SEGMENT = re.compile(r"^([0-9A-Fa-f]{2})+$")
+
+
+def hex_tag(segment):
+    """Return the Tag for a segment which is a complete tag in hex, or None."""
+    if not HEX_SEGMENT.match(segment):
+        return None
+    encoded = bytes.fromhex(segment)
+    try:
+        _, length = read_tag(encoded)
+    except IndexError:
+        # The tag continues past the end of the segment
+        return None
+    if length != len(encoded):
+        return None
+    return Tag(encoded)
+
+
+def parse_segment(segment):
+    if isinstance(segment, str):
+        if segment == ANY:
+            return ANY
+        if segment == ANY_DEPTH:
+            return ANY_DEPTH
+        tag = hex_tag(segment)
+        if tag is not None:
+            return tag
+        shortname = getattr(Tag, segment, None)
+        if type(shortname) is Tag:
+            return shortname
+        raise ValueError("Invalid tag in path: %r" % segment)
+    return Tag(segment)
+
+
+class TLVPath(object):
+    """A compiled path query. Use `compile_path` to construct one."""
+
+    def __init__(self, path):
+        if isinstance(path, str):
+            path = [s for s in path.split("/") if s != ""]
+        self.segments = tuple(parse_segment(s) for s in path)
+        if len(self.segments) == 0:
+            raise ValueError("Empty path")
+
+        wildcards = [s for s in self.segments if s in (ANY, ANY_DEPTH)]
+        if len(wildcards) == 0:
+            # Exact path: a single lookup in the index
+            self._find_indexed = self._find_exact
+        elif len(self.segments) == 2 and self.segments[0] == ANY_DEPTH:
+            # A tag anywhere in the tree: a single lookup in the index
+            self._find_indexed = self._find_tag
+        else:
+            self._find_indexed = self._find_matching
+
+    def find_all(self, tlv):
+        """Return a list of every value matching this path, in document order
+        if the TLV is indexed."""
+        if isinstance(tlv, TLV) and tlv.index is not None:
+            return self._find_indexed(tlv.index)
+        return list(self._traverse(tlv))
+
+    def find(self, tlv, default=None):
+        """Return the first value matching this path, or `default`."""
+        if isinstance(tlv, TLV) and tlv.index is not None:
+            values = self._find_indexed(tlv.index)
+            return values[0] if values else default
+        for value in self._traverse(tlv):
+            return value
+        return default
+
+    def _find_exact(self, index):
+        return index.get_path(self.segments)
+
+    def _find_tag(self, index):
+        return index.get_tag(self.segments[1])
+
+    def _find_matching(self, index):
+        matches = []
+        for path, entries in index.by_path.items():
+            if self._match(path, 0, 0):
+                matches.extend(entries)
+        # Entries are grouped by path, so restore document order
+        matches.sort(key=lambda entry: entry[1])
+        return [entry[0] for entry in matches]
+
+    def _match(self, path, i, j):
+        """Check whether path[j:] matches self.segments[i:]"""
+        if i == len(self.segments):
+            return j == len(path)
+        segment = self.segments[i]
+        if segment is ANY_DEPTH:
+            return any(self._match(path, i + 1, k) for k in range(j, len(path) + 1))
+        if j == len(path):
+            return False
+        if segment is ANY or segment is path[j]:
+            return self._match(path, i + 1, j + 1)
+        return False
+
+    def _traverse(self, tlv):
+        if self._find_indexed == self._find_exact:
+            return self._lookup(tlv, 0)
+        return (value for path, value in walk(tlv) if self._match(path, 0, 0))
+
+    def _lookup(self, value, i):
+        """Follow an exact path by looking up each tag in turn."""
+        if i == len(self.segments):
+            yield value
+            return
+        if not isinstance(value, TLV) or self.segments[i] not in value:
+            return
+        for occurrence in occurrences(value[self.segments[i]]):
+            for match in self._lookup(occurrence, i + 1):
+                yield match
+
+    def __repr__(self):
+        return "<TLVPath %s>" % "/".join(
+            s if isinstance(s, str) else s.encoded.hex().upper() for s in self.segments
+        )
+
+
+def walk(tlv, path=()):
+    """Yield a (path, value) pair for every element in a TLV structure, in document order."""
+    for tag, value in tlv.items():
+        for occurrence in occurrences(value):
+            yield path + (tag,), occurrence
+            if isinstance(occurrence, TLV):
+                for item in walk(occurrence, path + (tag,)):
+                    yield item
+
+
+def compile_path(path):
+    """Compile a path (a string, or a sequence of segments), caching the result."""
+    if not isinstance(path, str):
+        # Make the path hashable, for the cache
+        path = tuple(s if isinstance(s, (str, Tag)) else Tag(s) for s in path)
+    return _compile_path(path)
+
+
+@lru_cache(maxsize=256)
+def _compile_path(path):
+    return TLVPath(path)
+
+
+def find(tlv, path, default=None):
+    """Return the first value in `tlv` matching `path`, or `default`."""
+    return compile_path(path).find(tlv, default)
+
+
+def find_all(tlv, path):
+    """Return a list of every value in `tlv` matching `path`."""
+    return compile_path(path).find_all(tlv)
@@ -1,4 +1,4 @@
-from .structures import TLV
+from .structures import LazyTLV
 
 
 class RAPDU(object):
@@ -10,11 +10,22 @@ class RAPDU(object):
     @classmethod
     def unmarshal(cls, data):
         assert len(data) > 1
+        assert data[-2] not in (0x61, 0x6C)  # should be handled by the transport layer.
+
+        obj = cls.build(data)
+        if type(obj) == ErrorResponse:
+            raise obj
+
+        return obj
+
+    @classmethod
+    def build(cls, data):
+        """Construct a response object from its binary representation (data followed
+        by the two status bytes), without raising ErrorResponses. This is used for
+        decoding recorded traces."""
         sw1 = data[-2]
         sw2 = data[-1]
 
-        assert sw1 not in (0x61, 0x6C)  # should be handled by the transport layer.
-
         if sw1 == 0x90 and sw2 == 0x00:
             obj = SuccessResponse()
         elif sw1 in (0x62, 0x63):
@@ -24,13 +35,9 @@ class RAPDU(object):
         obj.sw1 = sw1
         obj.sw2 = sw2
         if len(data) > 2:
-            obj.data = TLV.unmarshal(data[:-2])
+            obj.data = LazyTLV.unmarshal(data[:-2])
         else:
             obj.data = None
-
-        if type(obj) == ErrorResponse:
-            raise obj
-
         return obj
 
     def get_status(self):
@@ -0,0 +1,135 @@
+""" Incremental (push-based) BER-TLV parsing.
+
+    Rather than building a tree, the parser emits a flat stream of events as soon
+    as each element has been received, so arbitrarily large inputs can be scanned
+    in constant memory. Data can be fed in chunks of any size, for example as it is
+    read from a file or received from the card.
+"""
+import re
+from collections import namedtuple
+from .data import read_tag, read_length, is_constructed, Tag
+from ..exc import EMVProtocolError
+
+# depth: nesting level of the element (0 for top-level elements)
+# tag: the element's Tag
+# offset: offset of the start of the element (its tag) in the input stream
+# length: length of the element's value
+# value: the value as bytes for primitive elements, or None for constructed elements,
+#        whose children follow as separate events.
+TLVEvent = namedtuple("TLVEvent", ["depth", "tag", "offset", "length", "value"])
+
+
+class TLVStreamParser(object):
+    """Push-based TLV event parser.
+
+    >>> parser = TLVStreamParser()
+    >>> parser.feed(bytes([0x6F, 0x03, 0x87]))
+    [TLVEvent(depth=0, tag=(6F) FCI Template, offset=0, length=3, value=None)]
+    >>> parser.feed(bytes([0x01, 0x00]))
+    [TLVEvent(depth=1, tag=(87) Application Priority Indicator, offset=2, length=1, value=b'\\x00')]
+    >>> parser.close()
+    """
+
+    def __init__(self):
+        # Bytes received but not yet consumed. This only ever holds (at most) one
+        # incomplete element header or primitive value.
+        self._buffer = bytearray()
+        # Stream offset of the start of the buffer
+        self._offset = 0
+        # Stream offsets at which each currently open constructed element ends
+        self._stack = []
+
+    @property
+    def offset(self):
+        """Stream offset of the next unconsumed byte."""
+        return self._offset
+
+    @property
+    def depth(self):
+        """Current nesting depth."""
+        return len(self._stack)
+
+    def feed(self, data):
+        """Add a chunk of data to the stream, returning a list of the events it completes."""
+        buf = self._buffer
+        buf += data
+        events = []
+        pos = 0
+        while pos < len(buf):
+            offset = self._offset + pos
+            # Close any constructed elements which end here
+            while self._stack and self._stack[-1] <= offset:
+                self._stack.pop()
+
+            try:
+                tag, tag_len = read_tag(buf, pos)
+                length, length_len = read_length(buf, pos + tag_len)
+            except IndexError:
+                # Header is split across chunks, wait for more data.
+                break
+
+            header_len = tag_len + length_len
+            if is_constructed(tag[0]):
+                events.append(
+                    TLVEvent(len(self._stack), Tag(tag), offset, length, None)
+                )
+                self._stack.append(offset + header_len + length)
+                pos += header_len
+            else:
+                end = pos + header_len + length
+                if end > len(buf):
+                    break
+                value = bytes(buf[pos + header_len : end])
+                events.append(
+                    TLVEvent(len(self._stack), Tag(tag), offset, length, value)
+                )
+                pos = end
+
+        del buf[:pos]
+        self._offset += pos
+        return events
+
+    def close(self):
+        """Signal the end of the stream, raising an exception if it ends part-way
+        through an element."""
+        while self._stack and self._stack[-1] <= self._offset:
+            self._stack.pop()
+        if len(self._buffer) > 0 or len(self._stack) > 0:
+            raise EMVProtocolError(
+                "TLV stream truncated at offset %s (%s bytes pending, depth %s)"
+                % (self._offset, len(self._buffer), len(self._stack))
+            )
+
+
+def iter_events(chunks):
+    """Parse an iterable of data chunks, yielding TLVEvents as they become available."""
+    parser = TLVStreamParser()
+    for chunk in chunks:
+        for event in parser.feed(chunk):
+            yield event
+    parser.close()
+
+
+def read_chunks(fp, chunk_size=65536):
+    """Read a binary file in chunks."""
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def read_hex_chunks(fp, chunk_size=65536):
+    """Read a text file containing a hex dump (pairs of hex digits, optionally
+    separated by whitespace or colons) in chunks, yielding the decoded bytes."""
+    carry = ""
+    while True:
+        text = fp.read(chunk_size)
+        if not text:
+            break
+        digits = carry + re.sub(r"[\s:]+", "", text)
+        split = len(digits) - (len(digits) % 2)
+        carry = digits[split:]
+        yield bytes.fromhex(digits[:split])
+    if carry:
+        raise EMVProtocolError("Hex dump has an odd number of digits")
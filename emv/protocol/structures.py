@@ -1,9 +1,12 @@
 from collections import OrderedDict
+from functools import lru_cache
 from .data import (
     ELEMENT_FORMAT,
     render_element,
     read_tag,
     read_length,
+    length_size,
+    write_length,
     is_constructed,
     Tag,
 )
@@ -15,17 +18,66 @@ log = logging.getLogger(__name__)
 
 
 def parse_element(tag, value):
-    if ELEMENT_FORMAT.get(tag) == Parse.DOL:
-        value = DOL.unmarshal(value)
-    elif ELEMENT_FORMAT.get(tag) == Parse.TAG_LIST:
-        value = TagList.unmarshal(value)
-    elif ELEMENT_FORMAT.get(tag) == Parse.ASRPD:
-        value = ASRPD.unmarshal(value)
-    elif ELEMENT_FORMAT.get(tag) == Parse.CVM_LIST:
-        value = CVMList.unmarshal(value)
-    elif ELEMENT_FORMAT.get(tag) == Parse.AUC:
-        value = AUC.unmarshal(value)
-    return value
+    """Decode an element's value into a structure, if its tag has a decoder."""
+    decoder = ELEMENT_DECODERS.get(tag)
+    if decoder is None:
+        return value
+    return decoder(value)
+
+
+def register_decoder(tag, decoder):
+    """Set the decoder used by parse_element for a tag, for example to decode
+    issuer-specific tags.
+
+    `decoder` may be a Parse value (e.g. Parse.DOL), or a callable which is passed
+    the raw value and returns the decoded value. A decoder of None removes any
+    existing decoder.
+    """
+    tag = Tag(tag)
+    decoder = PARSE_DECODERS.get(decoder, decoder)
+    if decoder is None:
+        ELEMENT_DECODERS.pop(tag, None)
+    else:
+        ELEMENT_DECODERS[tag] = decoder
+
+
+def occurrences(value):
+    """Elements with duplicate tags are stored as a list of values. Return a list
+    of each occurrence of an element's value."""
+    if type(value) is list and len(value) > 0 and type(value[0]) is not int:
+        return value
+    return [value]
+
+
+class TLVIndex(object):
+    """A flattened index of every element in a TLV structure.
+
+    Each element's value can be looked up by its full path (a tuple of Tags
+    from the top level), or by its tag alone. Values are in document order.
+
+    Entries are [value, position] lists, where position is the element's place
+    in document order, so that entries from different paths can be merged.
+    """
+
+    def __init__(self):
+        self.by_path = {}
+        self.by_tag = {}
+        self.count = 0
+
+    def add(self, path):
+        """Add an entry for an element, returning an entry list in which its
+        value should be stored (as the first item)."""
+        entry = [None, self.count]
+        self.count += 1
+        self.by_path.setdefault(path, []).append(entry)
+        self.by_tag.setdefault(path[-1], []).append(entry)
+        return entry
+
+    def get_path(self, path):
+        return [entry[0] for entry in self.by_path.get(path, ())]
+
+    def get_tag(self, tag):
+        return [entry[0] for entry in self.by_tag.get(tag, ())]
 
 
 class TLV(OrderedDict):
@@ -35,54 +87,150 @@ class TLV(OrderedDict):
     Documented in EMV 4.3 Book 3 Annex B
     """
 
+    # A TLVIndex, if one was requested when unmarshalling
+    index = None
+
     @classmethod
-    def unmarshal(cls, data):
-        tlv = cls()
-        i = 0
+    def unmarshal(cls, data, index=False):
+        """Parse a TLV structure.
+
+        `data` may be a list of bytes, in which case values are returned as lists,
+        or a bytes-like object (bytes, bytearray or memoryview), in which case values
+        are returned as memoryview slices of the original buffer without copying.
 
+        If `index` is True, a flattened TLVIndex of every element is built while
+        parsing and stored in the `index` attribute of the result.
+        """
         if len(data) < 3:
             # A valid TLV record is at least three bytes, anything less is probably a bug.
             # I've seen some cards present this (with a TLV of simply [0x61]), so silently ignore.
             log.info("Invalid TLV - too short: %s", data)
+            if index:
+                tlv = cls()
+                tlv.index = TLVIndex()
+                return tlv
             return data
 
-        while i < len(data):
-            tag, tag_len = read_tag(data[i:])
+        if not isinstance(data, list):
+            data = memoryview(data)
+            if data.format != "B":
+                data = data.cast("B")
+
+        if not index:
+            return cls._unmarshal(data, 0, len(data))
+
+        tlv_index = TLVIndex()
+        tlv = cls._unmarshal(data, 0, len(data), tlv_index)
+        tlv.index = tlv_index
+        return tlv
+
+    @classmethod
+    def _unmarshal(cls, data, start, end, index=None, path=()):
+        """Parse the TLV structure held in data[start:end], walking the
+        buffer by offset rather than slicing it."""
+        tlv = cls()
+        duplicates = set()
+        i = start
+
+        while i < end:
+            tag, tag_len = read_tag(data, i)
             i += tag_len
-            if len(data) <= i:
-                log.info("Invalid TLV - read beyond end of buffer at %s: %s", tag, data)
+            if end <= i:
+                log.info(
+                    "Invalid TLV - read beyond end of buffer at %s: %s",
+                    tag,
+                    data[start:end],
+                )
                 return tlv
 
-            length, length_len = read_length(data[i:])
+            length, length_len = read_length(data, i)
             i += length_len
 
-            value = data[i : i + length]
+            constructed = is_constructed(tag[0])
+            tag = Tag(tag)
+            if index is not None:
+                entry = index.add(path + (tag,))
 
-            if is_constructed(tag[0]):
-                value = TLV.unmarshal(value)
+            value_end = min(i + length, end)
+            if constructed and value_end - i >= 3:
+                value = cls._unmarshal(data, i, value_end, index, path + (tag,))
+            else:
+                value = data[i:value_end]
 
-            tag = Tag(tag)
             value = parse_element(tag, value)
+            if index is not None:
+                entry[0] = value
 
-            # If we have duplicate tags, make them into a list
+            # If we have duplicate tags, make them into a list. Keep track of which
+            # tags these are, as list input produces primitive values which are lists.
             if tag in tlv:
-                if type(tlv[tag]) is not list:
+                if tag not in duplicates:
                     tlv[tag] = [tlv[tag]]
+                    duplicates.add(tag)
                 tlv[tag].append(value)
             else:
                 tlv[tag] = value
             i += length
         return tlv
 
+    def marshal(self):
+        """Encode this TLV structure, returning a bytearray.
+
+        Element lengths are computed in a single pass over the tree, and the
+        output is then written into one preallocated buffer.
+        """
+        chunks = []
+        buf = bytearray(self._plan(chunks))
+        i = 0
+        for tag, length, value in chunks:
+            buf[i : i + len(tag)] = tag
+            i = write_length(buf, i + len(tag), length)
+            if value is not None:
+                buf[i : i + length] = value
+                i += length
+        return buf
+
+    def _plan(self, chunks):
+        """Append a (tag bytes, length, value) chunk to `chunks` for each element in
+        this structure, in output order, and return its total encoded size.
+
+        Constructed elements have a value of None, and are followed by the chunks for
+        their children.
+        """
+        size = 0
+        for tag, value in self.items():
+            size += self._plan_value(tag, value, chunks)
+        return size
+
+    @staticmethod
+    def _plan_value(tag, value, chunks):
+        tag = Tag(tag)
+
+        # Duplicate tags are stored as a list of values
+        if type(value) is list and len(value) > 0 and type(value[0]) is not int:
+            return sum(TLV._plan_value(tag, v, chunks) for v in value)
+
+        index = len(chunks)
+        if isinstance(value, TLV):
+            chunks.append(None)
+            length = value._plan(chunks)
+            chunks[index] = (tag.encoded, length, None)
+        else:
+            if hasattr(value, "marshal"):
+                value = value.marshal()
+            length = len(value)
+            chunks.append((tag.encoded, length, value))
+        return len(chunks[index][0]) + length_size(length) + length
+
     def __repr__(self):
         vals = []
         for key, val in self.items():
             out = "\n%s: " % str(key)
             if (
-                type(val) in (TLV, DOL)
+                isinstance(val, (TLV, DOL))
                 or type(val) is list
                 and len(val) > 0
-                and type(val[0]) in (TLV, DOL)
+                and isinstance(val[0], (TLV, DOL))
             ):
                 out += str(val)
             else:
@@ -91,6 +239,138 @@ class TLV(OrderedDict):
         return "{" + (", ".join(vals)) + "}"
 
 
+class LazyTLV(TLV):
+    """A TLV which only scans the top level of the structure when unmarshalled.
+
+    The offsets of each element are recorded, and constructed values (nested
+    templates) and parsed elements (DOLs, CVM lists etc.) are only decoded when
+    they are first accessed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        # tag -> (constructed, [(start, end), ...]) for elements not yet decoded
+        self._pending = {}
+        self._data = None
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    def _unmarshal(cls, data, start, end, index=None, path=()):
+        if index is not None:
+            raise ValueError("LazyTLV can't be indexed when unmarshalling")
+        tlv = cls()
+        tlv._data = data
+        i = start
+
+        while i < end:
+            tag, tag_len = read_tag(data, i)
+            i += tag_len
+            if end <= i:
+                log.info(
+                    "Invalid TLV - read beyond end of buffer at %s: %s",
+                    tag,
+                    data[start:end],
+                )
+                return tlv
+
+            length, length_len = read_length(data, i)
+            i += length_len
+
+            constructed = is_constructed(tag[0])
+            tag = Tag(tag)
+            pending = tlv._pending.get(tag)
+            if pending is None:
+                tlv._pending[tag] = (constructed, [(i, min(i + length, end))])
+                OrderedDict.__setitem__(tlv, tag, None)
+            else:
+                pending[1].append((i, min(i + length, end)))
+            i += length
+        return tlv
+
+    def _decode(self, tag, constructed, start, end):
+        if constructed and end - start >= 3:
+            value = type(self)._unmarshal(self._data, start, end)
+        else:
+            value = self._data[start:end]
+        return parse_element(tag, value)
+
+    def _materialise(self, key):
+        tag = Tag(key)
+        constructed, offsets = self._pending.pop(tag)
+        values = [self._decode(tag, constructed, start, end) for start, end in offsets]
+        if len(values) == 1:
+            values = values[0]
+        OrderedDict.__setitem__(self, tag, values)
+        if not self._pending:
+            # Everything has been decoded, so we no longer need the source buffer.
+            self._data = None
+
+    def _plan(self, chunks):
+        # Elements which haven't been decoded are copied through untouched.
+        size = 0
+        for tag, value in OrderedDict.items(self):
+            pending = self._pending.get(tag)
+            if pending is None:
+                size += self._plan_value(tag, value, chunks)
+                continue
+            for start, end in pending[1]:
+                size += self._plan_value(tag, self._data[start:end], chunks)
+        return size
+
+    def _materialise_all(self):
+        while self._pending:
+            self._materialise(next(iter(self._pending)))
+
+    def __getitem__(self, key):
+        if self._pending and key in self._pending:
+            self._materialise(key)
+        return OrderedDict.__getitem__(self, key)
+
+    def __setitem__(self, key, value):
+        self._pending.pop(key, None)
+        OrderedDict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._pending.pop(key, None)
+        OrderedDict.__delitem__(self, key)
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def pop(self, key, *args):
+        if self._pending and key in self._pending:
+            self._materialise(key)
+        return OrderedDict.pop(self, key, *args)
+
+    def popitem(self, last=True):
+        self._materialise_all()
+        return OrderedDict.popitem(self, last)
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def items(self):
+        self._materialise_all()
+        return OrderedDict.items(self)
+
+    def values(self):
+        self._materialise_all()
+        return OrderedDict.values(self)
+
+    def __eq__(self, other):
+        self._materialise_all()
+        if isinstance(other, LazyTLV):
+            other._materialise_all()
+        return OrderedDict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+
 class ASRPD(dict):
     """Application Selection Registered Proprietary Data list.
 
@@ -119,6 +399,17 @@ class ASRPD(dict):
 
         return asrpd
 
+    def marshal(self):
+        buf = bytearray(sum(3 + len(value) for value in self.values()))
+        i = 0
+        for pdi, value in self.items():
+            buf[i] = int(pdi[:2])
+            buf[i + 1] = int(pdi[2:])
+            buf[i + 2] = len(value)
+            buf[i + 3 : i + 3 + len(value)] = value
+            i += 3 + len(value)
+        return buf
+
     def __repr__(self):
         ret = "<ASRPD: "
         for pdi, value in self.items():
@@ -144,55 +435,140 @@ class DOL(list):
         dol = cls()
         i = 0
         while i < len(data):
-            tag, tag_len = read_tag(data[i:])
+            tag, tag_len = read_tag(data, i)
             i += tag_len
             length = data[i]
             i += 1
             dol.append((Tag(tag), length))
         return dol
 
+    def marshal(self):
+        """Encode the DOL back into its binary representation, as a bytearray."""
+        buf = bytearray()
+        for tag, length in self:
+            buf += Tag(tag).encoded
+            buf.append(length)
+        return buf
+
+    # Compiled layout, cleared whenever the list is modified.
+    _layout = None
+
+    def layout(self):
+        """The compiled layout of this DOL. Layouts are cached, so this is cheap
+        to call for each transaction."""
+        layout = self._layout
+        if layout is None:
+            layout = self._layout = compile_dol(tuple(self))
+        return layout
+
     def size(self):
         """Total size of the resulting structure in bytes."""
-        return sum([val[1] for val in self])
+        return self.layout().size
 
     def unserialise(self, data):
         """Parse an input stream of bytes and return a TLV object."""
-        if self.size() != len(data):
+        return self.layout().unserialise(data)
+
+    def __contains__(self, val):
+        index = self.layout().index
+        if type(val) is not str:
+            try:
+                return val in index
+            except TypeError:
+                pass
+        # Names and lists compare equal to tags, but don't hash like them.
+        return any(tag == val for tag in index)
+
+    def serialise(self, data):
+        """Given a dictionary of tag -> value, write this data out
+        according to the DOL, as a list of bytes. Missing data will be null.
+        """
+        return list(self.layout().serialise(data))
+
+
+def _invalidate_layout(method):
+    def wrapper(self, *args, **kwargs):
+        self._layout = None
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+for name in (
+    "__setitem__",
+    "__delitem__",
+    "__iadd__",
+    "__imul__",
+    "append",
+    "extend",
+    "insert",
+    "pop",
+    "remove",
+    "clear",
+    "sort",
+    "reverse",
+):
+    setattr(DOL, name, _invalidate_layout(getattr(list, name)))
+
+
+class DOLLayout(object):
+    """A DOL compiled into a fixed layout, with the offset of each element
+    in the serialised data, and an index of tag -> slot numbers.
+    Use `compile_dol` to construct one."""
+
+    __slots__ = ("slots", "size", "index")
+
+    def __init__(self, entries):
+        slots = []
+        index = {}
+        offset = 0
+        for i, (tag, length) in enumerate(entries):
+            tag = Tag(tag)
+            slots.append((tag, offset, length))
+            index.setdefault(tag, []).append(i)
+            offset += length
+        # (Tag, offset, length) for each element
+        self.slots = tuple(slots)
+        self.size = offset
+        self.index = {tag: tuple(i) for tag, i in index.items()}
+
+    def unserialise(self, data):
+        """Parse an input stream of bytes and return a TLV object."""
+        if self.size != len(data):
             raise Exception(
                 "Incorrect input size (expecting %s bytes, got %s)"
-                % (self.size(), len(data))
+                % (self.size, len(data))
             )
 
         tlv = TLV()
-        i = 0
-        for tag, length in self:
-            tlv[tag] = data[i : i + length]
-            i += length
-
+        for tag, offset, length in self.slots:
+            tlv[tag] = data[offset : offset + length]
         return tlv
 
-    def __contains__(self, val):
-        for v in self:
-            if v[0] == val:
-                return True
-        return False
-
     def serialise(self, data):
         """Given a dictionary of tag -> value, write this data out
-        according to the DOL. Missing data will be null.
+        according to the layout, returning a bytearray. Missing data will be null.
         """
-        output = []
-        for tag, length in self:
-            value = data.get(tag, [0x0] * length)
-            if len(value) < length:
-                # If the length is shorter than required, left-pad it.
-                value = [0x0] * (length - len(value)) + value
-            elif len(value) > length:
-                raise Exception("Data for tag %s is too long" % tag)
-            output += value
-
-        assert len(output) == self.size()
-        return output
+        buf = bytearray(self.size)
+        slots = self.slots
+        index = self.index
+        for tag, value in data.items():
+            for i in index.get(tag, ()):
+                _, offset, length = slots[i]
+                if len(value) > length:
+                    raise Exception("Data for tag %s is too long" % slots[i][0])
+                # If the value is shorter than required, it's left-padded.
+                buf[offset + length - len(value) : offset + length] = value
+        return buf
+
+
+@lru_cache(maxsize=256)
+def compile_dol(entries):
+    """Compile a DOL, given as a tuple of (tag, length) pairs, into a DOLLayout,
+    caching the result."""
+    return DOLLayout(entries)
 
 
 class TagList(list):
@@ -203,11 +579,14 @@ class TagList(list):
         tag_list = cls()
         i = 0
         while i < len(data):
-            tag, tag_len = read_tag(data[i:])
+            tag, tag_len = read_tag(data, i)
             i += tag_len
             tag_list.append(Tag(tag))
         return tag_list
 
+    def marshal(self):
+        return bytearray(b"".join(Tag(tag).encoded for tag in self))
+
 
 class CVMRule(object):
     """EMV 4.3 book 3 appendix C3"""
@@ -295,6 +674,17 @@ class CVMList(object):
 
         return cvm_list
 
+    def marshal(self):
+        if self.x is None:
+            return bytearray()
+        buf = bytearray(8 + 2 * len(self.rules))
+        buf[0:4] = self.x.to_bytes(4, "big")
+        buf[4:8] = self.y.to_bytes(4, "big")
+        for i, rule in enumerate(self.rules):
+            buf[8 + 2 * i] = rule.b1
+            buf[9 + 2 * i] = rule.b2
+        return buf
+
     def __repr__(self):
         return "<CVM List x: %s, y: %s, rules: %s>" % (
             self.x,
@@ -328,6 +718,11 @@ class AUC(object):
         auc.b2 = data[1]
         return auc
 
+    def marshal(self):
+        if not hasattr(self, "b1"):
+            return bytearray()
+        return bytearray([self.b1, self.b2])
+
     def get_uses(self):
         uses = []
         for i in range(0, len(self.B1_FIELDS)):
@@ -341,3 +736,21 @@ class AUC(object):
 
     def __repr__(self):
         return "<AUC: %s>" % ", ".join(self.get_uses())
+
+
+# Decoders for the Parse types which are decoded into a structure when unmarshalling.
+PARSE_DECODERS = {
+    Parse.DOL: DOL.unmarshal,
+    Parse.TAG_LIST: TagList.unmarshal,
+    Parse.ASRPD: ASRPD.unmarshal,
+    Parse.CVM_LIST: CVMList.unmarshal,
+    Parse.AUC: AUC.unmarshal,
+}
+
+# The element table, compiled into a map of Tag -> decoder for every element which
+# needs decoding, so parse_element is a single lookup.
+ELEMENT_DECODERS = {
+    Tag(tag): PARSE_DECODERS[parse]
+    for tag, parse in ELEMENT_FORMAT.items()
+    if parse in PARSE_DECODERS
+}
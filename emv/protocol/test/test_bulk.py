@@ -0,0 +1,134 @@
+import pytest
+from emv.util import unformat_bytes
+from emv.test.fixtures import APP_DATA
+from emv.protocol.data import Tag, read_tag, read_length
+from emv.protocol.stream import iter_events
+
+np = pytest.importorskip("numpy")
+from emv.protocol.bulk import pack_records, scan_records  # noqa: E402
+
+FCI = unformat_bytes(
+    """6F 1D 84 07 A0 00 00 00 03 80 02 A5 12 50 08 42 41 52 43 4C
+                         41 59 53 87 01 00 5F 2D 02 65 6E"""
+)
+
+
+def test_pack_records():
+    buf, offsets = pack_records([[1, 2], b"", b"\x03"])
+    assert buf == b"\x01\x02\x03"
+    assert list(offsets) == [0, 2, 2, 3]
+
+
+def test_scan_top_level():
+    buf, offsets = pack_records([FCI, APP_DATA])
+    result = scan_records(buf, offsets)
+
+    assert list(result.record) == [0, 1]
+    assert list(result.tag) == [0x6F, 0x70]
+    assert list(result.offset) == [0, len(FCI)]
+    assert list(result.length) == [0x1D, len(APP_DATA) - 2]
+    assert list(result.value_offset) == [2, len(FCI) + 2]
+    assert list(result.constructed) == [True, True]
+    assert list(result.depth) == [0, 0]
+
+
+def test_scan_descend_matches_stream_parser():
+    records = [FCI, APP_DATA, FCI]
+    buf, offsets = pack_records(records)
+    result = scan_records(buf, offsets, descend=True)
+
+    expected = []
+    for i, record in enumerate(records):
+        for event in iter_events([bytes(record)]):
+            expected.append(
+                (i, event.offset + offsets[i], event.tag.key, event.length, event.depth)
+            )
+
+    assert [
+        (r, o, t, l, d)
+        for r, o, t, l, d in zip(
+            result.record, result.offset, result.tag, result.length, result.depth
+        )
+    ] == expected
+
+    label = list(result.tag).index(Tag.APP_LABEL.key)
+    start = result.value_offset[label]
+    assert buf[start : start + result.length[label]] == b"BARCLAYS"
+
+
+def test_scan_exotic_elements():
+    # Three-byte tag, and a four-byte length, which use the scalar fallback
+    records = [
+        [0xDF, 0x81, 0x01, 0x01, 0xAA, 0x5A, 0x84, 0x00, 0x00, 0x00, 0x01, 0xBB],
+        [0x9F, 0x37, 0x81, 0x02, 0x01, 0x02],
+    ]
+    buf, offsets = pack_records(records)
+    result = scan_records(buf, offsets)
+
+    assert list(result.tag) == [0xDF8101, 0x5A, 0x9F37]
+    assert list(result.length) == [1, 1, 2]
+    assert list(result.value_offset) == [4, 11, 16]
+
+
+def test_scan_truncated():
+    records = [
+        # Value runs past the end of the record
+        [0x5A, 0x05, 0x01, 0x02],
+        # Record ends part-way through a header
+        [0x87, 0x01, 0x00, 0x9F],
+        [0x87, 0x01, 0x01],
+    ]
+    buf, offsets = pack_records(records)
+    result = scan_records(buf, offsets)
+
+    assert list(result.record) == [0, 1, 2]
+    assert list(result.length) == [2, 1, 1]
+
+
+def test_scan_empty():
+    buf, offsets = pack_records([])
+    result = scan_records(buf, offsets)
+    assert len(result.tag) == 0
+
+
+def scalar_scan(record):
+    """Top-level (tag, length, value offset) of each element, using the scalar functions."""
+    elements = []
+    i = 0
+    while i < len(record):
+        tag, tag_len = read_tag(record, i)
+        length, length_len = read_length(record, i + tag_len)
+        value_offset = i + tag_len + length_len
+        elements.append(
+            (
+                int.from_bytes(bytes(tag), "big"),
+                min(length, len(record) - value_offset),
+                value_offset,
+            )
+        )
+        i = value_offset + length
+    return elements
+
+
+def test_scan_matches_scalar():
+    records = [
+        # 0x80 length byte, which read_length reads as zero
+        [0x5A, 0x80, 0x9F, 0x37, 0x01, 0x02],
+        # Eight-byte and nine-byte tags
+        [0xDF] + [0x81] * 6 + [0x01, 0x01, 0xAA, 0x87, 0x01, 0x00],
+        [0xDF] + [0x81] * 7 + [0x01, 0x01, 0xAA],
+        [0x9F, 0x37, 0x81, 0x02, 0x01, 0x02, 0x5A, 0x82, 0x00, 0x01, 0x05],
+        # Lengths too large for an int64, running past the end of the record
+        [0x5A, 0x88] + [0xFF] * 8 + [0x01, 0x02],
+        [0x5A, 0x89] + [0xFF] * 9 + [0x01],
+    ]
+    buf, offsets = pack_records(records)
+    result = scan_records(buf, offsets)
+
+    expected = []
+    for record, start in zip(records, offsets):
+        expected += [(t, n, int(start) + v) for t, n, v in scalar_scan(record)]
+    assert [
+        (int(t), int(n), int(v))
+        for t, n, v in zip(result.tag, result.length, result.value_offset)
+    ] == expected
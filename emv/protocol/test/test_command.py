@@ -1,8 +1,17 @@
+import pytest
 from emv.protocol.command import (
     CAPDU,
     SelectCommand,
+    ReadCommand,
+    GetDataCommand,
+    VerifyCommand,
+    GetProcessingOptions,
     GenerateApplicationCryptogramCommand,
+    GetResponseCommand,
+    UnknownCommand,
+    encode_apdu,
 )
+from emv.exc import EMVProtocolError
 from emv.util import unformat_bytes
 
 
@@ -25,3 +34,107 @@ def test_unmarshal():
     assert pdu.p2 == 0x00
     assert len(pdu.data) == 0x1D
     assert pdu.le is None
+
+
+def test_unmarshal_cases():
+    # Case 1: no data or Le
+    pdu = CAPDU.unmarshal(unformat_bytes("00 B2 01 0C"))
+    assert type(pdu) is ReadCommand
+    assert pdu.data is None
+    assert pdu.le is None
+
+    # Case 2: Le only
+    pdu = CAPDU.unmarshal(unformat_bytes("80 CA 9F 36 00"))
+    assert type(pdu) is GetDataCommand
+    assert (pdu.p1, pdu.p2) == (0x9F, 0x36)
+    assert pdu.data is None
+    assert pdu.le == 0x00
+
+    # Case 4: data and Le
+    pdu = CAPDU.unmarshal(unformat_bytes("80 A8 00 00 02 83 00 00"))
+    assert type(pdu) is GetProcessingOptions
+    assert pdu.data == b"\x83\x00"
+    assert pdu.le == 0x00
+
+    pdu = CAPDU.unmarshal(unformat_bytes("00 C0 00 00 1F"))
+    assert type(pdu) is GetResponseCommand
+    assert pdu.le == 0x1F
+
+    # Logical channel bits in CLA are ignored
+    assert type(CAPDU.unmarshal(unformat_bytes("01 B2 01 0C 00"))) is ReadCommand
+
+    # Round trip
+    for pdu in (SelectCommand("1PAY.SYS.DDF01"), VerifyCommand("1234")):
+        assert CAPDU.unmarshal(pdu.marshal()).marshal() == pdu.marshal()
+
+
+def test_unmarshal_unknown():
+    pdu = CAPDU.unmarshal(unformat_bytes("00 84 00 00 08"))
+    assert type(pdu) is UnknownCommand
+    assert pdu.HEADER == b"\x00\x84"
+    assert pdu.le == 0x08
+    assert pdu.marshal() == bytes(unformat_bytes("00 84 00 00 08"))
+    assert "INS: 84" in repr(pdu)
+    assert CAPDU.get_class([0x00, 0x84]) is None
+
+    assert UnknownCommand(0x00, 0x84, 0x00, 0x00, le=8).marshal() == pdu.marshal()
+
+
+def test_unmarshal_invalid():
+    with pytest.raises(EMVProtocolError):
+        CAPDU.unmarshal(unformat_bytes("00 B2 01"))
+    with pytest.raises(EMVProtocolError):
+        CAPDU.unmarshal(unformat_bytes("00 A4 04 00 07 A0 00"))
+
+
+def test_marshal():
+    assert SelectCommand("1PAY.SYS.DDF01").marshal() == bytes(
+        unformat_bytes("00 A4 04 00 0E 31 50 41 59 2E 53 59 53 2E 44 44 46 30 31 00")
+    )
+    assert SelectCommand(file_identifier=[0x3F, 0x00]).marshal() == bytes(
+        unformat_bytes("00 A4 00 00 02 3F 00 00")
+    )
+    assert ReadCommand(1, sfi=2).marshal() == bytes(unformat_bytes("00 B2 01 14 00"))
+    assert GetDataCommand(GetDataCommand.ATC).marshal() == bytes(
+        unformat_bytes("80 CA 9F 36 00")
+    )
+    assert VerifyCommand("1234").marshal() == bytes(
+        unformat_bytes("00 20 00 80 08 24 12 34 FF FF FF FF FF")
+    )
+    assert GetProcessingOptions().marshal() == bytes(
+        unformat_bytes("80 A8 00 00 02 83 00 00")
+    )
+    assert GetProcessingOptions([0x01, 0x02]).marshal() == bytes(
+        unformat_bytes("80 A8 00 00 04 83 02 01 02 00")
+    )
+
+    # Encodings are built once
+    assert ReadCommand(1, sfi=2).marshal() is ReadCommand(1, sfi=2).marshal()
+
+
+def test_marshal_not_cached():
+    # PIN blocks and cryptogram requests must not be kept in the encoding cache
+    encode_apdu.cache_clear()
+    assert VerifyCommand("9876").marshal() == bytes(
+        unformat_bytes("00 20 00 80 08 24 98 76 FF FF FF FF FF")
+    )
+    GenerateApplicationCryptogramCommand(
+        GenerateApplicationCryptogramCommand.ARQC, [0x98, 0x76, 0x54]
+    ).marshal()
+    assert encode_apdu.cache_info().currsize == 0
+
+    ReadCommand(1, sfi=2).marshal()
+    assert encode_apdu.cache_info().currsize == 1
+
+
+def test_validation():
+    with pytest.raises(AssertionError):
+        ReadCommand(256, sfi=1)
+    with pytest.raises(AssertionError):
+        GetDataCommand((0x9F, -1))
+    with pytest.raises(AssertionError):
+        GenerateApplicationCryptogramCommand(
+            GenerateApplicationCryptogramCommand.ARQC, [0] * 256
+        )
+    # P1 and P2 can take any byte value
+    assert ReadCommand(0xFF).marshal() == bytes([0x00, 0xB2, 0xFF, 0x04, 0x00])
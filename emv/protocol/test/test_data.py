@@ -0,0 +1,133 @@
+import copy
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pickle
+import pytest
+from emv.protocol.data import Tag, read_tag, render_element, country_code, currency_code
+
+
+def test_tag_interning():
+    assert Tag(0x9A) is Tag([0x9A])
+    assert Tag((0x9F, 0x37)) is Tag([0x9F, 0x37])
+    assert Tag((0x9F, 0x37)) is Tag(0x9F37)
+    assert Tag(b"\x9f\x37") is Tag(0x9F37)
+    assert Tag(b"\x6f") is Tag.FCI
+    assert Tag(0xBF0C) is Tag(b"\xbf\x0c") is Tag([0xBF, 0x0C])
+    assert Tag(Tag.CDOL1) is Tag.CDOL1
+    assert Tag(read_tag([0xDF, 0xDF, 0x39])[0]) is Tag(0xDFDF39)
+    assert copy.copy(Tag.PAN_SN) is Tag.PAN_SN
+    assert pickle.loads(pickle.dumps(Tag.PAN_SN)) is Tag.PAN_SN
+
+
+def test_tag_interning_first_form():
+    # Each tag here is first constructed from a different form, and must be the
+    # same instance whichever form is used afterwards.
+    for first, value in (
+        (0xDF7A, [0xDF, 0x7A]),
+        ([0xDF, 0x7B], [0xDF, 0x7B]),
+        (b"\xdf\x7c", [0xDF, 0x7C]),
+        ((0xDF, 0x7D), [0xDF, 0x7D]),
+        (b"\x5b", [0x5B]),
+    ):
+        tag = Tag(first)
+        forms = [
+            int.from_bytes(bytes(value), "big"),
+            list(value),
+            bytes(value),
+            tuple(value),
+        ]
+        assert all(Tag(form) is tag for form in forms)
+
+
+def test_tag_interning_threads():
+    # Threads building the same new tags at once must all get the same instances
+    values = [(0xDF, 0xE0, i) for i in range(0x80)]
+    barrier = threading.Barrier(8)
+
+    def build(form):
+        barrier.wait()
+        return [Tag(form(value)) for value in values]
+
+    forms = [tuple, list, bytes, lambda value: int.from_bytes(bytes(value), "big")]
+    # Switch threads as often as possible, to make a race likely
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(build, forms * 2))
+    finally:
+        sys.setswitchinterval(interval)
+    for tags in results[1:]:
+        assert all(tag is first for tag, first in zip(tags, results[0]))
+
+
+def test_tag_attributes():
+    tag = Tag((0x9F, 0x37))
+    assert tag.id == (0x9F, 0x37)
+    assert tag.value == [0x9F, 0x37]
+    assert tag.key == 0x9F37
+    assert tag.encoded == b"\x9f\x37"
+    assert tag.name == "Unpredictable Number"
+    assert repr(tag) == "([9F 37]) Unpredictable Number"
+
+    assert Tag.CDOL1.id == 0x8C
+    assert Tag.CDOL1.value == 0x8C
+    assert repr(Tag(0x01)) == "01"
+
+
+def test_tag_equality():
+    assert Tag.CDOL1 == 0x8C
+    assert Tag.CDOL1 == Tag(0x8C)
+    assert Tag.CDOL1 == "Card Risk Management Data Object List 1 (CDOL1)"
+    assert Tag.CDOL1 != Tag.CDOL2
+    assert Tag.PAN_SN == (0x5F, 0x34)
+    assert Tag.PAN_SN == [0x5F, 0x34]
+    assert Tag.PAN_SN != 0x5F
+
+    # Tags can be used interchangeably with their ids as dict keys
+    d = {Tag.PAN_SN: 1, Tag.CDOL1: 2}
+    assert d[(0x5F, 0x34)] == 1
+    assert d[0x8C] == 2
+    assert {0x8C: 3}[Tag.CDOL1] == 3
+
+
+def test_tag_ordering():
+    assert Tag(0x82) < Tag(0x9A)
+    assert Tag(0x9A) < Tag((0x9F, 0x02))
+    assert Tag((0x9F, 0x02)) < (0x9F, 0x37)
+    assert sorted([Tag(0xBF0C), Tag(0x5A), Tag(0x5F34)]) == [
+        0x5A,
+        (0x5F, 0x34),
+        (0xBF, 0x0C),
+    ]
+
+
+def test_render_iso_codes():
+    assert render_element(Tag((0x5F, 0x28)), [0x08, 0x26]) == "GB"
+    assert render_element(Tag((0x9F, 0x1A)), [0x00, 0x08]) == "AL"
+    assert render_element(Tag((0x9F, 0x42)), [0x09, 0x78]) == "EUR"
+    assert render_element(Tag(0xC9), b"\x08\x26") == "GBP"
+    assert (
+        render_element(Tag((0x5F, 0x28)), [0x09, 0x99]) == "<Invalid country: [9, 153]>"
+    )
+    assert (
+        render_element(Tag((0x5F, 0x28)), [0x0A, 0xBC])
+        == "<Invalid country: [10, 188]>"
+    )
+    assert (
+        render_element(Tag((0x9F, 0x42)), [0x00, 0x01]) == "<Invalid currency: [0, 1]>"
+    )
+
+
+def test_iso_code_lookup():
+    assert country_code(826) == "GB"
+    assert currency_code(840) == "USD"
+    assert country_code(999) is None
+
+
+def test_tag_shortnames():
+    assert Tag.CDOL1 is Tag(0x8C)
+    assert Tag.FCI is Tag(0x6F)
+    with pytest.raises(AttributeError):
+        Tag.NOT_A_SHORTNAME
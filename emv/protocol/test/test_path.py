@@ -0,0 +1,99 @@
+import pytest
+from emv.util import unformat_bytes
+from emv.test.fixtures import APP_DATA
+from emv.protocol.data import Tag
+from emv.protocol.structures import TLV, LazyTLV, DOL
+from emv.protocol.path import compile_path, find, find_all, walk
+
+FCI = unformat_bytes(
+    """6F 1D 84 07 A0 00 00 00 03 80 02 A5 12 50 08 42 41 52 43 4C
+                         41 59 53 87 01 00 5F 2D 02 65 6E"""
+)
+
+APPS = unformat_bytes(
+    """70 4A 61 16 4F 07 A0 00 00 00 29 10 10 50 08 4C 49 4E 4B 20
+                                41 54 4D 87 01 01
+                           61 18 4F 07 A0 00 00 00 03 10 10 50 0A 56 49 53 41 20
+                                44 45 42 49 54 87 01 02
+                           61 16 4F 07 A0 00 00 00 03 80 02 50 08 42 41 52 43 4C
+                                41 59 53 87 01 00"""
+)
+
+
+@pytest.mark.parametrize("index", [False, True])
+def test_find(index):
+    tlv = TLV.unmarshal(FCI, index=index)
+    assert find(tlv, "6F/A5/50") == list(b"BARCLAYS")
+    assert find(tlv, "FCI/FCI_PROP/APP_LABEL") == list(b"BARCLAYS")
+    assert find(tlv, (Tag.FCI, Tag.FCI_PROP, Tag.APP_LABEL)) == list(b"BARCLAYS")
+    assert find(tlv, "**/5F2D") == list(b"en")
+    assert find(tlv, "6F/**/87") == [0x00]
+    assert find(tlv, "6F/*/87") == [0x00]
+    assert find(tlv, "6F/87") is None
+    assert find(tlv, "**/8C", default=[]) == []
+
+
+@pytest.mark.parametrize("index", [False, True])
+def test_find_all(index):
+    tlv = TLV.unmarshal(APPS, index=index)
+    assert find_all(tlv, "70/61/50") == [
+        list(b"LINK ATM"),
+        list(b"VISA DEBIT"),
+        list(b"BARCLAYS"),
+    ]
+    assert find_all(tlv, "**/87") == [[0x01], [0x02], [0x00]]
+    assert len(find_all(tlv, "70/61")) == 3
+    assert [Tag(t) for t in (0x4F, 0x50, 0x87) * 3] == [
+        path[-1] for path, _ in walk(tlv) if len(path) == 3
+    ]
+    assert find_all(tlv, "70/*/*") == [
+        value for path, value in walk(tlv) if len(path) == 3
+    ]
+    assert find_all(tlv, "**/8C") == []
+
+
+def test_find_lazy():
+    tlv = LazyTLV.unmarshal(APP_DATA)
+    assert type(find(tlv, "**/CDOL1")) is DOL
+    assert find(tlv, "RECORD/PAN_SN") == [0x00]
+
+
+def test_index():
+    tlv = TLV.unmarshal(APP_DATA, index=True)
+    assert tlv.index.get_tag(Tag.CDOL1) == [tlv[Tag.RECORD][Tag.CDOL1]]
+    assert tlv.index.get_path((Tag.RECORD,)) == [tlv[Tag.RECORD]]
+    assert [path for path, _ in walk(tlv)] == [
+        path for path, entries in tlv.index.by_path.items() for _ in entries
+    ]
+
+    with pytest.raises(ValueError):
+        LazyTLV.unmarshal(APP_DATA, index=True)
+
+    # Too short to hold an element
+    short = TLV.unmarshal([0x61], index=True)
+    assert short == {} and short.index.by_path == {}
+    assert find_all(short, "**/61") == []
+
+
+def test_compile():
+    assert compile_path("6F/A5/50") is compile_path("6F/A5/50")
+    # Complete tags in hex are read as hex, anything else as a shortname
+    assert compile_path("df01").segments == (Tag(0xDF01),)
+    assert compile_path("BF0C").segments == (Tag(0xBF0C),)
+    assert compile_path("DF8101").segments == (Tag(0xDF8101),)
+    assert compile_path("DF").segments == (Tag.DF,)
+    assert compile_path("DDF").segments == (Tag.DDF,)
+    assert compile_path("FCI/DF").segments == (Tag.FCI, Tag.DF)
+    for invalid in ("9F", "9F3", "5A5A", "DF81"):
+        with pytest.raises(ValueError):
+            compile_path(invalid)
+
+    # Sequences of segments
+    assert compile_path((Tag.FCI, Tag.DF)).segments == (Tag.FCI, Tag.DF)
+    assert compile_path([Tag.FCI, [0xA5], "*"]).segments == (Tag.FCI, Tag(0xA5), "*")
+    assert compile_path([0x6F, 0xA5]) is compile_path((Tag.FCI, Tag.FCI_PROP))
+    assert repr(compile_path("**/9F38")) == "<TLVPath **/9F38>"
+    with pytest.raises(ValueError):
+        compile_path("6F/XYZ")
+    with pytest.raises(ValueError):
+        compile_path("")
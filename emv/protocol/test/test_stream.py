@@ -0,0 +1,63 @@
+import io
+import pytest
+from emv.exc import EMVProtocolError
+from emv.util import unformat_bytes
+from emv.test.fixtures import APP_DATA
+from emv.protocol.data import Tag
+from emv.protocol.stream import TLVStreamParser, iter_events, read_hex_chunks
+
+FCI = unformat_bytes(
+    """6F 1D 84 07 A0 00 00 00 03 80 02 A5 12 50 08 42 41 52 43 4C
+                         41 59 53 87 01 00 5F 2D 02 65 6E"""
+)
+
+
+def test_events():
+    parser = TLVStreamParser()
+    events = parser.feed(bytes(FCI))
+    parser.close()
+
+    assert [(e.depth, e.tag, e.offset, e.length) for e in events] == [
+        (0, Tag.FCI, 0, 0x1D),
+        (1, Tag.DF, 2, 7),
+        (1, Tag.FCI_PROP, 11, 0x12),
+        (2, Tag.APP_LABEL, 13, 8),
+        (2, Tag(0x87), 23, 1),
+        (2, Tag((0x5F, 0x2D)), 26, 2),
+    ]
+    assert events[0].value is None
+    assert events[3].value == b"BARCLAYS"
+
+
+def test_chunked():
+    # Feeding a byte at a time produces the same events as feeding it all at once.
+    expected = list(iter_events([bytes(APP_DATA)]))
+    parser = TLVStreamParser()
+    events = []
+    for b in APP_DATA:
+        events += parser.feed(bytes([b]))
+    parser.close()
+    assert events == expected
+    assert parser.offset == len(APP_DATA)
+
+    # The parser holds no more than one element's worth of data.
+    assert len(parser._buffer) == 0
+
+
+def test_multiple_records():
+    events = list(iter_events([bytes(FCI) * 3]))
+    assert [e.offset for e in events if e.depth == 0] == [0, 31, 62]
+
+
+def test_truncated():
+    parser = TLVStreamParser()
+    parser.feed(bytes(FCI[:-1]))
+    with pytest.raises(EMVProtocolError):
+        parser.close()
+
+
+def test_hex_chunks():
+    dump = io.StringIO(
+        "6F 1D 84 07 A0 00 00 00 03 80 02 A5 12 50 08 42 41 52 43 4C\n41:59:53"
+    )
+    assert b"".join(read_hex_chunks(dump, chunk_size=7)) == bytes(FCI[:23])
@@ -2,7 +2,18 @@ import pytest
 from emv.util import unformat_bytes
 from emv.test.fixtures import APP_DATA
 from emv.protocol.data import Tag
-from emv.protocol.structures import TLV, DOL, TagList, read_tag, CVMList
+from emv.protocol.data_elements import Parse
+from emv.protocol.structures import (
+    TLV,
+    LazyTLV,
+    DOL,
+    TagList,
+    read_tag,
+    CVMList,
+    parse_element,
+    register_decoder,
+)
+from emv.protocol.data import read_length, write_length
 
 
 def test_tlv():
@@ -31,6 +42,114 @@ def test_tlv():
     assert tlv[(0xDF, 0xDF, 0x39)][0] == 7
 
 
+def test_tlv_bytes():
+    data = unformat_bytes(
+        """6F 1D 84 07 A0 00 00 00 03 80 02 A5 12 50 08 42 41 52 43 4C
+                             41 59 53 87 01 00 5F 2D 02 65 6E"""
+    )
+    buf = bytes(data)
+    tlv = TLV.unmarshal(buf)
+    label = tlv[Tag.FCI][Tag.FCI_PROP][Tag.APP_LABEL]
+    # Values are views onto the original buffer rather than copies
+    assert type(label) is memoryview
+    assert label.obj is buf
+    assert bytes(label) == b"BARCLAYS"
+    assert bytes(tlv[Tag.FCI][Tag.DF]) == bytes(data[4:11])
+
+    tlv = TLV.unmarshal(memoryview(bytearray(APP_DATA)))
+    assert type(tlv[Tag.RECORD][Tag.CDOL1]) is DOL
+    assert tlv[Tag.RECORD][Tag.CDOL1] == TLV.unmarshal(APP_DATA)[Tag.RECORD][Tag.CDOL1]
+    repr(tlv)
+
+
+def test_tlv_bytes_duplicate_tags():
+    data = bytes(unformat_bytes("70 0A 61 03 87 01 01 61 03 87 01 02"))
+    tlv = TLV.unmarshal(data)
+    apps = tlv[Tag.RECORD][Tag.APP]
+    assert type(apps) is list
+    assert [bytes(app[0x87]) for app in apps] == [b"\x01", b"\x02"]
+
+
+def test_lazy_tlv():
+    data = unformat_bytes(
+        """6F 1D 84 07 A0 00 00 00 03 80 02 A5 12 50 08 42 41 52 43 4C
+                             41 59 53 87 01 00 5F 2D 02 65 6E"""
+    )
+    tlv = LazyTLV.unmarshal(data)
+    # Only the top level has been scanned
+    assert Tag.FCI in tlv._pending
+    fci = tlv[Tag.FCI]
+    assert type(fci) is LazyTLV
+    assert Tag.FCI not in tlv._pending
+    assert Tag.FCI_PROP in fci._pending
+    assert fci[Tag.FCI_PROP][Tag.APP_LABEL] == list(b"BARCLAYS")
+    assert fci.get(Tag.DF) == [0xA0, 0x00, 0x00, 0x00, 0x03, 0x80, 0x02]
+    assert fci.get(0x99) is None
+
+    assert tlv == TLV.unmarshal(data)
+    assert repr(tlv) == repr(TLV.unmarshal(data))
+
+
+def test_lazy_tlv_nested_parsing():
+    tlv = LazyTLV.unmarshal(bytes(APP_DATA))
+    record = tlv[Tag.RECORD]
+    assert (0x9F, 0x56) in record
+    assert type(record[Tag.CDOL1]) is DOL
+    assert record[Tag.CDOL1] == TLV.unmarshal(APP_DATA)[Tag.RECORD][Tag.CDOL1]
+    assert type(record[0x8E]) is CVMList
+
+    merged = TLV()
+    merged.update(LazyTLV.unmarshal(APP_DATA)[Tag.RECORD])
+    assert list(merged.keys()) == list(record.keys())
+    assert type(merged[Tag.CDOL1]) is DOL
+
+
+def test_lazy_tlv_duplicate_tags():
+    data = unformat_bytes("70 0A 61 03 87 01 01 61 03 87 01 02")
+    apps = LazyTLV.unmarshal(data)[Tag.RECORD][Tag.APP]
+    assert type(apps) is list
+    assert [app[0x87] for app in apps] == [[0x01], [0x02]]
+
+
+def test_marshal():
+    data = unformat_bytes(
+        """70 4A 61 16 4F 07 A0 00 00 00 29 10 10 50 08 4C 49 4E 4B 20
+                                        41 54 4D 87 01 01
+                                   61 18 4F 07 A0 00 00 00 03 10 10 50 0A 56 49 53 41 20
+                                        44 45 42 49 54 87 01 02
+                                   61 16 4F 07 A0 00 00 00 03 80 02 50 08 42 41 52 43 4C
+                                        41 59 53 87 01 00"""
+    )
+    for source in (data, APP_DATA):
+        assert TLV.unmarshal(source).marshal() == bytes(source)
+        assert TLV.unmarshal(bytes(source)).marshal() == bytes(source)
+        assert LazyTLV.unmarshal(source).marshal() == bytes(source)
+
+    tlv = TLV()
+    tlv[Tag(0x6F)] = TLV({Tag(0x84): [0xA0, 0x00], Tag((0x9F, 0x4B)): [0x00] * 200})
+    encoded = tlv.marshal()
+    assert type(encoded) is bytearray
+    assert encoded[:7] == bytes([0x6F, 0x81, 0xD0, 0x84, 0x02, 0xA0, 0x00])
+    assert encoded[7:10] == bytes([0x9F, 0x4B, 0x81])
+    assert TLV.unmarshal(list(encoded)) == tlv
+
+
+def test_marshal_structures():
+    record = TLV.unmarshal(APP_DATA)[Tag.RECORD]
+    assert record[Tag.CDOL1].marshal() == bytes(APP_DATA[4:25])
+    assert record[0x8E].marshal() == bytes(APP_DATA[52:62])
+
+    taglist = TagList.unmarshal(unformat_bytes("82 9F 42"))
+    assert taglist.marshal() == bytes([0x82, 0x9F, 0x42])
+
+
+def test_write_length():
+    for length in (0, 0x7F, 0x80, 0xFF, 0x100, 0x10000):
+        buf = bytearray(5)
+        end = write_length(buf, 0, length)
+        assert read_length(buf) == (length, end)
+
+
 def test_length_parsing():
     data = unformat_bytes("42 01 03")
     tlv = TLV.unmarshal(data)
@@ -95,6 +214,14 @@ def test_dol():
     assert (0x9F, 0x37) in dol
     assert dol.size() == 29
 
+    # Anything a Tag compares equal to can be looked up
+    assert Tag((0x9F, 0x37)) in dol
+    assert [0x9F, 0x37] in dol
+    assert "Unpredictable Number" in dol
+    assert b"\x9f\x37" not in dol
+    assert [0x9F, 0x4E] not in dol
+    assert "Not an element" not in dol
+
     # This DOL has a repeated 0x9A entry, for some reason. Apparently this is allowed.
     data = unformat_bytes(
         "9F 66 04 9F 02 06 9F 03 06 9F 1A 02 95 05 5F 2A 02 9A 03 9C 01 9F 37 04 9A 03"
@@ -142,6 +269,28 @@ def test_serialise_long_data():
         dol.serialise(source)
 
 
+def test_dol_layout():
+    dol = DOL.unmarshal(dol_data)
+    layout = dol.layout()
+    assert layout is DOL.unmarshal(dol_data).layout()
+    assert layout.size == 29
+    assert layout.slots[1] == (Tag((0x9F, 0x03)), 6, 6)
+    assert layout.index[Tag(0x9A)] == (5,)
+    assert 0x9C in dol
+    assert (0x9F, 0x66) not in dol
+
+    # Values are left-padded into a single buffer
+    buf = layout.serialise({Tag((0x9F, 0x02)): [0x12, 0x34], Tag(0x9C): b"\x01"})
+    assert type(buf) is bytearray
+    assert buf[:6] == b"\x00\x00\x00\x00\x12\x34"
+    assert buf[24] == 0x01
+
+    # Layouts follow changes to the DOL
+    dol.append((Tag(0x5A), 8))
+    assert dol.size() == 37
+    assert 0x5A in dol
+
+
 def test_unserialise():
     dol = DOL.unmarshal(dol_data)
 
@@ -158,6 +307,14 @@ def test_unserialise():
 def test_read_tag():
     assert read_tag(unformat_bytes("82"))[0] == [0x82]
     assert read_tag(unformat_bytes("9F 42"))[0] == [0x9F, 0x42]
+    assert read_tag(unformat_bytes("82 9F 42"), 1) == ([0x9F, 0x42], 2)
+    assert read_tag(bytes([0x82, 0xDF, 0xDF, 0x39]), 1) == ([0xDF, 0xDF, 0x39], 3)
+
+
+def test_read_length():
+    assert read_length(unformat_bytes("42 01"), 1) == (1, 1)
+    assert read_length(unformat_bytes("42 82 01 00"), 1) == (256, 3)
+    assert read_length(bytes([0x81, 0xFF])) == (255, 2)
 
 
 def test_taglist():
@@ -173,3 +330,25 @@ def test_taglist():
 def test_cvmlist():
     data = unformat_bytes("00 00 00 00 00 00 00 00 41 03 1E 03 02 03 1F 03")
     CVMList.unmarshal(data)
+
+
+def test_parse_element():
+    assert type(parse_element(Tag.CDOL1, dol_data)) is DOL
+    assert type(parse_element(0x8C, dol_data)) is DOL
+    assert parse_element(Tag.APP_LABEL, [0x41]) == [0x41]
+
+
+def test_register_decoder():
+    # An issuer-specific DOL
+    tag = (0xDF, 0x71)
+    data = unformat_bytes("DF 71 03 9F 37 04")
+    assert type(TLV.unmarshal(data)[tag]) is list
+
+    register_decoder(tag, Parse.DOL)
+    try:
+        assert type(TLV.unmarshal(data)[tag]) is DOL
+        register_decoder(tag, bytes)
+        assert TLV.unmarshal(data)[tag] == b"\x9f\x37\x04"
+    finally:
+        register_decoder(tag, None)
+    assert type(TLV.unmarshal(data)[tag]) is list
@@ -0,0 +1,121 @@
+""" Sharing a reader between threads.
+
+    A Card can't safely be used from several threads at once: interleaved commands
+    would break GET RESPONSE chaining, and one thread's SELECT would change the
+    application another thread is working with. A ReaderSession owns the Card, and
+    runs jobs submitted from any thread one at a time on its own worker thread.
+
+    Each job is a callable taking the Card, and runs without any other commands
+    being interleaved, so a multi-command transaction is atomic:
+
+        session = ReaderSession(connection)
+        future = session.submit(lambda card: card.generate_cap_value("1234"))
+        value = future.result()
+
+        res = session.exchange(GetDataCommand(GetDataCommand.ATC), priority=HIGH)
+
+    Queued jobs run in priority order (lowest value first), and in the order they
+    were submitted within a priority.
+"""
+import itertools
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from .card import Card
+
+log = logging.getLogger(__name__)
+
+HIGH = 0
+NORMAL = 10
+LOW = 20
+
+
+class ReaderSession(object):
+    """Serialises access to a card from many threads.
+
+    `connection` is a pyscard-style connection, which is connected (and only ever
+    used) from the session's worker thread.
+    """
+
+    def __init__(self, connection, name=None):
+        self.connection = connection
+        self.card = None
+        self.queue = queue.PriorityQueue()
+        # Tie-breaker, so jobs with the same priority run in order of submission
+        self._counter = itertools.count()
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self.thread = threading.Thread(
+            target=self._worker, name=name or "ReaderSession", daemon=True
+        )
+        self.thread.start()
+
+    def submit(self, func, *args, priority=NORMAL, **kwargs):
+        """Queue `func(card, *args, **kwargs)` to run on the worker thread, returning
+        a Future for its result. No other job runs while it's running."""
+        future = Future()
+        with self._close_lock:
+            if self._closed:
+                raise RuntimeError("Session is closed")
+            self.queue.put(
+                (priority, next(self._counter), (future, func, args, kwargs))
+            )
+        return future
+
+    def submit_exchange(self, capdu, priority=NORMAL):
+        """Queue a single command, returning a Future for the response."""
+        return self.submit(lambda card: card.tp.exchange(capdu), priority=priority)
+
+    def exchange(self, capdu, priority=NORMAL, timeout=None):
+        """Send a command to the card and wait for the response.
+
+        This can't be called from a job, which would wait for itself to finish: use
+        the card passed to the job instead."""
+        if threading.current_thread() is self.thread:
+            raise RuntimeError("exchange() called from a job, use the job's card")
+        return self.submit_exchange(capdu, priority).result(timeout)
+
+    def _worker(self):
+        while True:
+            _, _, job = self.queue.get()
+            if job is None:
+                break
+            future, func, args, kwargs = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if self.card is None:
+                    self.card = Card(self.connection)
+                result = func(self.card, *args, **kwargs)
+            except BaseException as e:
+                log.debug("Job failed: %s", e)
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def close(self, cancel_pending=False, wait=True):
+        """Stop accepting jobs, and wait for the worker to finish unless `wait` is
+        False. Jobs already queued are run first, unless `cancel_pending` is set, in
+        which case they're cancelled."""
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            if cancel_pending:
+                while True:
+                    try:
+                        _, _, job = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    job[0].cancel()
+            # Queued after every job, whatever its priority
+            self.queue.put((float("inf"), next(self._counter), None))
+        if wait:
+            self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
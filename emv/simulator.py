@@ -0,0 +1,378 @@
+""" A simulated EMV card, for testing and benchmarking without a reader.
+
+    SimulatedCard implements enough of a payment card to run the operations in
+    `emv.card.Card`: SELECT (of the PSE and of applications), READ RECORD,
+    GET DATA, GET PROCESSING OPTIONS, VERIFY (plaintext PIN) and GENERATE AC.
+    SimulatedConnection plugs it into TransmissionProtocol in place of a pyscard
+    connection:
+
+        card = Card(SimulatedConnection(SimulatedCard()))
+        card.generate_cap_value("1234")
+
+    Cryptograms are HMACs of the transaction data, not real EMV cryptograms.
+"""
+import hashlib
+import hmac
+import threading
+import time
+from itertools import chain
+from .protocol.data import Tag
+from .protocol.structures import TLV
+from .protocol.command import (
+    SelectCommand,
+    ReadCommand,
+    GetDataCommand,
+    GetProcessingOptions,
+    VerifyCommand,
+    GenerateApplicationCryptogramCommand,
+    GetResponseCommand,
+)
+from .util import unformat_bytes
+
+PSE = b"1PAY.SYS.DDF01"
+
+# Status words
+SW_OK = (0x90, 0x00)
+SW_WRONG_LENGTH = (0x67, 0x00)
+SW_PIN_BLOCKED = (0x69, 0x83)
+SW_CONDITIONS_NOT_SATISFIED = (0x69, 0x85)
+SW_FILE_NOT_FOUND = (0x6A, 0x82)
+SW_RECORD_NOT_FOUND = (0x6A, 0x83)
+SW_DATA_NOT_FOUND = (0x6A, 0x88)
+SW_INS_NOT_SUPPORTED = (0x6D, 0x00)
+SW_CLA_NOT_SUPPORTED = (0x6E, 0x00)
+
+# Application data for the default application, from a Barclays debit card:
+# CDOL1, CDOL2, CVM list, IPB, IAF, PAN, PAN sequence number and app version.
+SAMPLE_RECORD = unformat_bytes(
+    """8C 15 9F 02 06 9F 03 06 9F 1A 02 95 05 5F 2A 02 9A 03 9C 01 9F 37 04 8D 17 8A
+       02 9F 02 06 9F 03 06 9F 1A 02 95 05 5F 2A 02 9A 03 9C 01 9F 37 04 8E 0A 00 00
+       00 00 00 00 00 00 01 00 9F 56 12 80 00 FF 00 00 00 00 00 01 FF FF 00 00 00 00
+       00 00 00 9F 55 01 A0 5A 08 46 58 12 34 56 78 90 09 5F 34 01 00 9F 08 02 00 01"""
+)
+
+
+class SimulatedApplication(object):
+    """An application on a SimulatedCard.
+
+    `records` is a dict of (SFI, record number) -> record contents, either as a TLV
+    or as the encoded elements (without the 0x70 record template). The AFL returned
+    by GET PROCESSING OPTIONS covers every record.
+
+    `errors` is a dict of (SFI, record number) -> status word, for records which
+    exist but can't be read. Reading a record in an SFI with neither records nor
+    errors returns 6A82 (file not found), and reading a missing record in an SFI
+    which exists returns 6A83 (record not found).
+    """
+
+    def __init__(self, aid, label, records, aip=(0x18, 0x00), priority=1, errors=None):
+        self.aid = bytes(aid)
+        self.label = label
+        self.aip = bytes(aip)
+        self.priority = priority
+        self.records = {
+            key: bytes(TLV([(Tag.RECORD, contents)]).marshal())
+            for key, contents in records.items()
+        }
+        self.errors = dict(errors or {})
+
+        # The AFL lists every record, grouped by SFI.
+        afl = bytearray()
+        for sfi in sorted({sfi for sfi, _ in self.records}):
+            numbers = sorted(n for s, n in self.records if s == sfi)
+            afl += bytes([sfi << 3, numbers[0], numbers[-1], 0x00])
+        self.afl = bytes(afl)
+
+        self.cdol1 = None
+        for record in self.records.values():
+            data = TLV.unmarshal(record)[Tag.RECORD]
+            if Tag.CDOL1 in data:
+                self.cdol1 = data[Tag.CDOL1]
+
+
+def sample_application():
+    """A Barclays-like debit application, as used by SimulatedCard by default."""
+    return SimulatedApplication(
+        [0xA0, 0x00, 0x00, 0x00, 0x03, 0x80, 0x02],
+        "BARCLAYS",
+        {(1, 1): SAMPLE_RECORD},
+    )
+
+
+class SimulatedCard(object):
+    """A simulated EMV card.
+
+    - `applications`: a list of SimulatedApplications (by default, one sample app).
+    - `pin`, `pin_tries`: the PIN and the number of attempts remaining.
+    - `atc`, `last_online_atc`: the application transaction counters.
+    - `response_format`: 1 or 2, the format of GENERATE AC responses.
+    - `latency`: time in seconds to wait before responding to each command.
+    - `get_response`: if True, respond with SW1 0x61 and return data in response to
+      GET RESPONSE, as T=0 cards do.
+    - `key`: the key used to generate cryptograms.
+
+    Commands are processed under a lock, so a card's connection may be used from
+    several threads. Each card should only have one connection, see
+    SimulatedConnection.
+    """
+
+    def __init__(
+        self,
+        applications=None,
+        pin="1234",
+        pin_tries=3,
+        atc=0,
+        last_online_atc=0,
+        response_format=2,
+        latency=0,
+        get_response=False,
+        key=b"python-emv simulated card",
+    ):
+        if applications is None:
+            applications = [sample_application()]
+        self.applications = applications
+        self.pin = str(pin)
+        self.pin_tries = pin_tries
+        self.max_pin_tries = pin_tries
+        self.atc = atc
+        self.last_online_atc = last_online_atc
+        self.response_format = response_format
+        self.latency = latency
+        self.get_response = get_response
+        self.key = key
+
+        # PSE directory: one application per record, in SFI 1.
+        self.directory = {
+            (1, i + 1): bytes(
+                TLV(
+                    [
+                        (
+                            Tag.RECORD,
+                            TLV(
+                                [
+                                    (
+                                        Tag.APP,
+                                        TLV(
+                                            [
+                                                (Tag.ADF_NAME, app.aid),
+                                                (Tag.APP_LABEL, app.label.encode()),
+                                                (Tag(0x87), [app.priority]),
+                                            ]
+                                        ),
+                                    )
+                                ]
+                            ),
+                        )
+                    ]
+                ).marshal()
+            )
+            for i, app in enumerate(applications)
+        }
+
+        self.lock = threading.Lock()
+        self.reset()
+
+        self.handlers = {
+            SelectCommand.HEADER[1]: self.select,
+            ReadCommand.HEADER[1]: self.read_record,
+            GetDataCommand.HEADER[1]: self.get_data,
+            GetProcessingOptions.HEADER[1]: self.get_processing_options,
+            VerifyCommand.HEADER[1]: self.verify,
+            GenerateApplicationCryptogramCommand.HEADER[1]: self.generate_ac,
+            GetResponseCommand.HEADER[1]: self.get_pending_response,
+        }
+
+    def reset(self):
+        """Reset the card's session state, as on power-up."""
+        # The selected file: PSE, a SimulatedApplication, or None
+        self.selected = None
+        self.transaction = False
+        self.verified = False
+        self.pending = b""
+
+    def process(self, apdu):
+        """Process a command APDU (as bytes), returning (data, sw1, sw2)."""
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            if apdu[0] & 0xF0 not in (0x00, 0x80):
+                return b"", SW_CLA_NOT_SUPPORTED[0], SW_CLA_NOT_SUPPORTED[1]
+            handler = self.handlers.get(apdu[1])
+            if handler is None:
+                return b"", SW_INS_NOT_SUPPORTED[0], SW_INS_NOT_SUPPORTED[1]
+
+            data = apdu[5 : 5 + apdu[4]] if len(apdu) > 5 else b""
+            response, (sw1, sw2) = handler(apdu[2], apdu[3], bytes(data))
+            if (
+                self.get_response
+                and response
+                and apdu[1] != GetResponseCommand.HEADER[1]
+            ):
+                self.pending = response
+                return b"", 0x61, len(response) & 0xFF
+            return response, sw1, sw2
+
+    def get_pending_response(self, p1, p2, data):
+        response = self.pending
+        self.pending = b""
+        return response, SW_OK
+
+    def select(self, p1, p2, name):
+        self.transaction = False
+        self.verified = False
+        if name == PSE:
+            self.selected = PSE
+            fci = TLV(
+                [
+                    (Tag.DF, name),
+                    (Tag.FCI_PROP, TLV([(Tag.SFI, [0x01])])),
+                ]
+            )
+            return bytes(TLV([(Tag.FCI, fci)]).marshal()), SW_OK
+
+        for app in self.applications:
+            if app.aid == name:
+                self.selected = app
+                fci = TLV(
+                    [
+                        (Tag.DF, app.aid),
+                        (
+                            Tag.FCI_PROP,
+                            TLV(
+                                [
+                                    (Tag.APP_LABEL, app.label.encode()),
+                                    (Tag(0x87), [app.priority]),
+                                ]
+                            ),
+                        ),
+                    ]
+                )
+                return bytes(TLV([(Tag.FCI, fci)]).marshal()), SW_OK
+
+        self.selected = None
+        return b"", SW_FILE_NOT_FOUND
+
+    def read_record(self, number, p2, data):
+        key = (p2 >> 3, number)
+        errors = {}
+        if self.selected is PSE:
+            records = self.directory
+        elif self.selected is not None:
+            records = self.selected.records
+            errors = self.selected.errors
+        else:
+            return b"", SW_CONDITIONS_NOT_SATISFIED
+
+        if key in errors:
+            return b"", tuple(errors[key])
+        if key not in records:
+            if any(sfi == key[0] for sfi, _ in chain(records, errors)):
+                return b"", SW_RECORD_NOT_FOUND
+            return b"", SW_FILE_NOT_FOUND
+        return records[key], SW_OK
+
+    def get_data(self, p1, p2, data):
+        tag = Tag((p1, p2))
+        if tag == Tag.ATC:
+            value = self.atc.to_bytes(2, "big")
+        elif tag == GetDataCommand.LAST_ONLINE_ATC:
+            value = self.last_online_atc.to_bytes(2, "big")
+        elif tag == GetDataCommand.PIN_TRY_COUNT:
+            value = bytes([self.pin_tries])
+        else:
+            return b"", SW_DATA_NOT_FOUND
+        return bytes(TLV([(tag, value)]).marshal()), SW_OK
+
+    def get_processing_options(self, p1, p2, data):
+        if not isinstance(self.selected, SimulatedApplication):
+            return b"", SW_CONDITIONS_NOT_SATISFIED
+        if len(data) < 2 or data[0] != 0x83:
+            return b"", SW_WRONG_LENGTH
+
+        self.atc = (self.atc + 1) & 0xFFFF
+        self.transaction = True
+        self.verified = False
+        app = self.selected
+        return bytes(TLV([(Tag.RMTF1, app.aip + app.afl)]).marshal()), SW_OK
+
+    def verify(self, p1, p2, data):
+        if p2 != VerifyCommand.PIN_PLAINTEXT or len(data) != 8:
+            return b"", SW_DATA_NOT_FOUND
+        if self.pin_tries == 0:
+            return b"", SW_PIN_BLOCKED
+
+        # PIN block: 0x2N, followed by N digits, padded with F
+        pin = data.hex()[2 : 2 + (data[0] & 0x0F)]
+        if pin != self.pin:
+            self.pin_tries -= 1
+            return b"", (0x63, 0xC0 | self.pin_tries)
+
+        self.pin_tries = self.max_pin_tries
+        self.verified = True
+        return b"", SW_OK
+
+    def generate_ac(self, p1, p2, data):
+        if not self.transaction:
+            return b"", SW_CONDITIONS_NOT_SATISFIED
+        app = self.selected
+        if app.cdol1 is not None and len(data) != app.cdol1.size():
+            return b"", SW_WRONG_LENGTH
+
+        crypto_type = p1 & 0xC0
+        # The card never approves offline: a request for a TC (or an ARQC) is
+        # answered with an ARQC, asking to go online, and a request for an AAC
+        # with an AAC.
+        cid = GenerateApplicationCryptogramCommand.ARQC
+        if crypto_type == GenerateApplicationCryptogramCommand.AAC:
+            cid = GenerateApplicationCryptogramCommand.AAC
+        atc = self.atc.to_bytes(2, "big")
+        cryptogram = hmac.new(self.key, atc + data, hashlib.sha256).digest()[:8]
+        # Issuer application data: length, key index, cryptogram version, CVR
+        iad = bytes(
+            [0x06, 0x01, 0x0A, 0x03, 0xA4 if self.verified else 0xA0, 0x00, 0x00]
+        )
+        self.transaction = False
+
+        if self.response_format == 1:
+            value = bytes([cid]) + atc + cryptogram + iad
+            return bytes(TLV([(Tag.RMTF1, value)]).marshal()), SW_OK
+
+        template = TLV(
+            [
+                (Tag((0x9F, 0x27)), [cid]),
+                (Tag.ATC, atc),
+                (Tag((0x9F, 0x26)), cryptogram),
+                (Tag((0x9F, 0x10)), iad),
+            ]
+        )
+        return bytes(TLV([(Tag.RMTF2, template)]).marshal()), SW_OK
+
+
+class SimulatedConnection(object):
+    """A pyscard-style connection to a SimulatedCard.
+
+    The connection owns its card, as a reader holds a physical card: connecting
+    resets the card's session state (the selected file and any transaction in
+    progress), as powering it up would. Don't share a SimulatedCard between
+    connections, as connecting one would end the others' transactions.
+    """
+
+    T0_protocol = 1
+
+    def __init__(self, card=None):
+        if card is None:
+            card = SimulatedCard()
+        self.card = card
+
+    def connect(self, protocol=None):
+        self.card.reset()
+
+    def disconnect(self):
+        pass
+
+    def getProtocol(self):
+        return self.T0_protocol
+
+    def transmit(self, apdu):
+        data, sw1, sw2 = self.card.process(bytes(apdu))
+        return list(data), sw1, sw2
@@ -1,3 +1,5 @@
+import threading
+from emv.simulator import SimulatedConnection
 from emv.util import unformat_bytes
 
 APP_DATA = unformat_bytes(
@@ -8,3 +10,31 @@ APP_DATA = unformat_bytes(
                                  55 01 A0 5A 08 46 58 12 34 56 78 90 09 5F 34 01 00 9F 08 02 00
                                  01"""
 )
+
+
+class GatedConnection(SimulatedConnection):
+    """A SimulatedConnection which lets tests control when commands run.
+
+    Each transmit sets `started`, then waits for `gate` (if given) before the card
+    processes the command. `gate` can be a threading.Event, or a threading.Barrier
+    shared between connections, which only lets them through once they are all
+    transmitting at the same time. `gate` is only waited for once, unless `every` is
+    set.
+    """
+
+    def __init__(self, card=None, gate=None, every=False):
+        super().__init__(card)
+        self.gate = gate
+        self.every = every
+        self.started = threading.Event()
+
+    def transmit(self, apdu):
+        self.started.set()
+        if self.gate is not None:
+            gate = self.gate
+            if not self.every:
+                self.gate = None
+            # The timeout only stops a broken test from hanging
+            if gate.wait(timeout=10) is False:
+                raise AssertionError("Timed out waiting for the gate")
+        return super().transmit(apdu)
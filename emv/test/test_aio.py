@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import pytest
+from emv.aio import AsyncCard
+from emv.card import Card
+from emv.exc import InvalidPINException
+from emv.protocol.data import Tag
+from emv.protocol.command import SelectCommand
+from emv.simulator import SimulatedCard, SimulatedConnection
+from emv.test.fixtures import GatedConnection
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_cap():
+    async def go():
+        async with AsyncCard(SimulatedConnection()) as card:
+            apps = await card.list_applications()
+            value = await card.generate_cap_value("1234")
+            metadata = await card.get_metadata()
+        return apps, value, metadata
+
+    apps, value, metadata = run(go())
+    card = Card(SimulatedConnection())
+    assert apps == card.list_applications()
+    assert value == card.generate_cap_value("1234")
+    assert metadata == {"pin_retries": 3, "atc": 1, "last_online_atc": 0}
+
+
+def test_invalid_pin():
+    async def go():
+        async with AsyncCard(SimulatedConnection()) as card:
+            await card.generate_cap_value("0000")
+
+    with pytest.raises(InvalidPINException):
+        run(go())
+
+
+def test_concurrent():
+    # Each card has its own executor, so these run in parallel: every card's first
+    # command waits until all of them are transmitting.
+    sims = [SimulatedCard() for _ in range(10)]
+    barrier = threading.Barrier(len(sims))
+
+    async def go():
+        cards = [AsyncCard(GatedConnection(sim, gate=barrier)) for sim in sims]
+        values = await asyncio.gather(*[c.generate_cap_value("1234") for c in cards])
+        for card in cards:
+            card.close()
+        return values
+
+    values = run(go())
+    assert len(set(values)) == 1
+    assert all(sim.atc == 1 for sim in sims)
+
+
+def test_timeout():
+    gate = threading.Event()
+    conn = GatedConnection(gate=gate)
+
+    async def go():
+        async with AsyncCard(conn, timeout=0.05) as card:
+            # The card doesn't answer until the gate is opened
+            with pytest.raises(asyncio.TimeoutError):
+                await card.get_pse()
+            gate.set()
+            # The next exchange waits for the abandoned one to finish
+            return await card.tp.exchange(SelectCommand("1PAY.SYS.DDF01"), timeout=10)
+
+    assert Tag.FCI in run(go()).data
+
+
+def test_cancel():
+    gate = threading.Event()
+    conn = GatedConnection(gate=gate)
+
+    async def go():
+        async with AsyncCard(conn) as card:
+            task = asyncio.ensure_future(card.generate_cap_value("1234"))
+            await asyncio.get_running_loop().run_in_executor(None, conn.started.wait)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            gate.set()
+            return await card.get_metadata()
+
+    # Cancelled while reading the PSE, before the transaction started
+    assert run(go())["atc"] == 0
+
+
+def test_connect_once():
+    class CountingConnection(SimulatedConnection):
+        connects = 0
+
+        def connect(self, protocol=None):
+            self.connects += 1
+            super().connect(protocol)
+
+    conn = CountingConnection()
+
+    async def go():
+        card = AsyncCard(conn)
+        # Both exchanges need to connect first
+        await asyncio.gather(card.get_pse(), card.get_metadata())
+        card.close()
+
+    run(go())
+    assert conn.connects == 1
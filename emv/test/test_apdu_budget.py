@@ -0,0 +1,143 @@
+""" APDU budgets for Card methods and emvtool commands.
+
+    The time taken to talk to a card is dominated by the number of exchanges, so
+    each flow is run against the simulated card and the number of APDUs (and bytes
+    in each direction) is checked against the budget in apdu_budgets.json.
+
+    After a change which intentionally alters the number of exchanges, update the
+    budgets with:
+
+        EMV_UPDATE_APDU_BUDGETS=1 python -m pytest emv/test/test_apdu_budget.py
+"""
+import json
+import os
+import pytest
+from click.testing import CliRunner
+from emv.card import Card
+from emv.command import client
+from emv.simulator import SimulatedConnection, sample_application
+
+BUDGET_FILE = os.path.join(os.path.dirname(__file__), "apdu_budgets.json")
+UPDATE = os.environ.get("EMV_UPDATE_APDU_BUDGETS") == "1"
+
+AID = list(sample_application().aid)
+PIN = "1234"
+
+
+class CountingConnection(object):
+    """Wraps a connection, counting exchanges and bytes in each direction."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.apdus = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def transmit(self, apdu):
+        data, sw1, sw2 = self.connection.transmit(apdu)
+        self.apdus += 1
+        self.bytes_sent += len(apdu)
+        self.bytes_received += len(data) + 2
+        return data, sw1, sw2
+
+    def counts(self):
+        return {
+            "apdus": self.apdus,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+        }
+
+
+def prepare_transaction(card):
+    card.select_application(AID)
+    return card.get_processing_options()
+
+
+# Card methods, each preceded by the setup it needs (which is not counted)
+CARD_FLOWS = {
+    "get_pse": (None, lambda card: card.get_pse()),
+    "list_applications": (None, lambda card: card.list_applications()),
+    "select_application": (None, lambda card: card.select_application(AID)),
+    "read_record": (
+        lambda card: card.select_application(AID),
+        lambda card: card.read_record(1, sfi=1),
+    ),
+    "get_metadata": (None, lambda card: card.get_metadata()),
+    "get_processing_options": (
+        lambda card: card.select_application(AID),
+        lambda card: card.get_processing_options(),
+    ),
+    "get_application_data": (
+        prepare_transaction,
+        lambda card: card.get_application_data([0x08, 0x01, 0x01, 0x00]),
+    ),
+    "verify_pin": (prepare_transaction, lambda card: card.verify_pin(PIN)),
+    "generate_cap_value": (None, lambda card: card.generate_cap_value(PIN)),
+}
+
+CLI_FLOWS = {
+    "emvtool info": ["info"],
+    "emvtool listapps": ["listapps"],
+    "emvtool appdata": ["appdata", "0"],
+    "emvtool cap": ["--pin", PIN, "cap"],
+    "emvtool verifypin": ["--pin", PIN, "verifypin", "0"],
+}
+
+
+@pytest.fixture(scope="module")
+def budgets():
+    with open(BUDGET_FILE) as f:
+        budgets = json.load(f)
+    yield budgets
+    if UPDATE:
+        with open(BUDGET_FILE, "w") as f:
+            json.dump(budgets, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+
+def check_budget(budgets, name, counts):
+    if UPDATE:
+        budgets[name] = counts
+        return
+    assert name in budgets, "No APDU budget for %s, see %s" % (name, __doc__)
+    for key, value in counts.items():
+        assert value <= budgets[name][key], "%s exceeded its %s budget: %s > %s" % (
+            name,
+            key,
+            value,
+            budgets[name][key],
+        )
+
+
+@pytest.mark.parametrize("name", sorted(CARD_FLOWS))
+def test_card_budget(budgets, name):
+    setup, flow = CARD_FLOWS[name]
+    connection = CountingConnection(SimulatedConnection())
+    card = Card(connection)
+    if setup is not None:
+        setup(card)
+    connection.apdus = connection.bytes_sent = connection.bytes_received = 0
+
+    flow(card)
+    check_budget(budgets, name, connection.counts())
+
+
+@pytest.mark.parametrize("name", sorted(CLI_FLOWS))
+def test_cli_budget(budgets, monkeypatch, name):
+    connection = CountingConnection(SimulatedConnection())
+    monkeypatch.setattr(client, "get_card", lambda ctx: Card(connection))
+
+    result = CliRunner().invoke(client.cli, CLI_FLOWS[name], obj={})
+    assert result.exit_code == 0, result.output
+    check_budget(budgets, name, connection.counts())
+
+
+def test_counting():
+    connection = CountingConnection(SimulatedConnection())
+    connection.transmit([0x00, 0xB2, 0x01, 0x0C, 0x00])
+    connection.transmit([0x80, 0xCA, 0x9F, 0x36, 0x00])
+    # 69 85 (no file selected), then 9F 36 02 00 00 90 00
+    assert connection.counts() == {"apdus": 2, "bytes_sent": 10, "bytes_received": 9}
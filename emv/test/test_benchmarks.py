@@ -0,0 +1,21 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_benchmarks_without_numpy():
+    # NumPy isn't a dependency, so the default suite must run without it
+    code = (
+        "import sys\n"
+        "sys.modules['numpy'] = None\n"
+        "from benchmarks.__main__ import main\n"
+        "sys.exit(main(['-k', 'batch', '--repeat', '1']))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, check=True, stdout=subprocess.PIPE
+    ).stdout.decode()
+    assert "Skipping bulk benchmarks" in output
+    assert "cap.batch.10k.loop" in output
+    assert "cap.batch.10k " not in output
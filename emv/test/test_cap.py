@@ -1,7 +1,16 @@
+import random
+import pytest
 from emv.protocol.response import RAPDU
 from emv.protocol.structures import TLV
 from emv.util import unformat_bytes
-from emv.cap import get_cap_value, get_arqc_req
+from emv.exc import CAPError
+from emv.cap import (
+    get_cap_value,
+    get_cap_values,
+    get_arqc_req,
+    compile_ipb,
+    VISA_STATIC_IPB,
+)
 
 from emv.test.fixtures import APP_DATA
 
@@ -17,7 +26,7 @@ def test_arqc_req():
         """80 AE 80 00 1D 00 00 00 00 00 00 00 00 00 00 00 00 00 00 80 00
                              00 00 00 00 00 01 01 01 00 00 00 00 00 00"""
     )
-    assert req.marshal() == data
+    assert req.marshal() == bytes(data)
 
 
 def test_arqc_req_payment():
@@ -27,7 +36,7 @@ def test_arqc_req_payment():
         """80 AE 80 00 1D 00 00 00 12 34 56 00 00 00 00 00 00 00 00 80 00
                              00 00 00 00 00 01 01 01 00 78 90 12 34 00"""
     )
-    assert req.marshal() == data
+    assert req.marshal() == bytes(data)
 
     # Payment of £15.00, account number of 78901234
     req = get_arqc_req(TLV.unmarshal(APP_DATA)[0x70], value=15.00, challenge=78901234)
@@ -35,7 +44,7 @@ def test_arqc_req_payment():
         """80 AE 80 00 1D 00 00 00 00 15 00 00 00 00 00 00 00 00 00 80 00
                              00 00 00 00 00 01 01 01 00 78 90 12 34 00"""
     )
-    assert req.marshal() == data
+    assert req.marshal() == bytes(data)
 
 
 def test_arqc_req_challenge():
@@ -45,7 +54,7 @@ def test_arqc_req_challenge():
         """80 AE 80 00 1D 00 00 00 00 00 00 00 00 00 00 00 00 00 00 80 00
                              00 00 00 00 00 01 01 01 00 78 90 12 34 00"""
     )
-    assert req.marshal() == data
+    assert req.marshal() == bytes(data)
 
 
 def test_real_response_rmtf1():
@@ -66,3 +75,128 @@ def test_real_response_rmtf2():
     )
     res = RAPDU.unmarshal(data)
     assert get_cap_value(res, ipb=BARCLAYS_IPB, psn=None) == 36554800
+
+
+def reference_cap_value(resp_data, ipb):
+    """The original string-based IPB extraction, to check compile_ipb against."""
+    binary_string = ""
+    for i in reversed(range(0, min(len(ipb), len(resp_data)))):
+        data_number = resp_data[i]
+        ipb_number = ipb[i]
+        while ipb_number > 0:
+            if ipb_number & 1:
+                binary_string = str(data_number & 1) + binary_string
+            ipb_number >>= 1
+            data_number >>= 1
+    return int(binary_string, 2)
+
+
+def rmtf2_data(cid, atc, ac, iad):
+    return (
+        [0x77, 13 + len(ac) + 3 + len(iad), 0x9F, 0x27, 1, cid, 0x9F, 0x36, 2]
+        + atc
+        + [0x9F, 0x26, len(ac)]
+        + ac
+        + [0x9F, 0x10, len(iad)]
+        + iad
+    )
+
+
+def rmtf2_response(cid, atc, ac, iad):
+    return RAPDU.unmarshal(rmtf2_data(cid, atc, ac, iad) + [0x90, 0x00])
+
+
+def test_cap_value_equivalence():
+    rng = random.Random(1234)
+    ipbs = [
+        BARCLAYS_IPB,
+        VISA_STATIC_IPB,
+        [0xFF] * 18,
+        [0x01],
+        [0x80] + [0x00] * 17,
+        # Longer than the response
+        [0x55] * 40,
+    ]
+    ipbs += [
+        [rng.randrange(256) for _ in range(rng.randrange(1, 24))] for _ in range(50)
+    ]
+
+    for ipb in ipbs:
+        for _ in range(10):
+            atc = [rng.randrange(256) for _ in range(2)]
+            ac = [rng.randrange(256) for _ in range(8)]
+            iad = [rng.randrange(256) for _ in range(rng.randrange(1, 32))]
+            res = rmtf2_response(0x80, atc, ac, iad)
+            resp_data = [0x80] + atc + ac + iad
+            psn = [rng.randrange(256)]
+
+            for psn, data in ((None, resp_data), (psn, psn + resp_data)):
+                size = min(len(ipb), len(data))
+                if not any(ipb[:size]):
+                    with pytest.raises(CAPError):
+                        get_cap_value(res, ipb=ipb, psn=psn)
+                    continue
+                assert get_cap_value(res, ipb=ipb, psn=psn) == reference_cap_value(
+                    data, ipb
+                )
+
+
+def test_compile_ipb():
+    assert compile_ipb(bytes([0x00, 0x00])) == ()
+    assert compile_ipb(bytes([0x80, 0x01])) == ((0, 1, 0), (15, 1, 1))
+    assert compile_ipb(bytes([0x0F, 0xF0])) == ((4, 0xFF, 0),)
+    assert compile_ipb(bytes(BARCLAYS_IPB)) is compile_ipb(bytes(BARCLAYS_IPB))
+
+
+def test_degenerate_ipb():
+    res = rmtf2_response(0x80, [0, 1], [0] * 8, [1, 2, 3])
+    with pytest.raises(CAPError):
+        get_cap_value(res, ipb=[0x00] * 18, psn=None)
+    with pytest.raises(CAPError):
+        get_cap_value(res, ipb=[], psn=None)
+
+
+def test_get_cap_values():
+    pytest.importorskip("numpy")
+    rng = random.Random(5678)
+    responses = [
+        unformat_bytes("80 12 80 09 5F 0F 9D 37 98 E9 3F 12 9A 06 0A 0A 03 A4 90 00")
+    ]
+    ipbs = [BARCLAYS_IPB]
+    psns = [None]
+    for _ in range(200):
+        atc = [rng.randrange(256) for _ in range(2)]
+        ac = [rng.randrange(256) for _ in range(8)]
+        iad = [rng.randrange(256) for _ in range(rng.randrange(1, 32))]
+        responses.append(rmtf2_data(0x80, atc, ac, iad))
+        ipbs.append(
+            rng.choice(
+                [
+                    BARCLAYS_IPB,
+                    VISA_STATIC_IPB,
+                    # Wider than 64 bits
+                    [0xFF] * 12,
+                    [rng.randrange(1, 256) for _ in range(rng.randrange(1, 24))],
+                ]
+            )
+        )
+        psns.append(rng.choice([None, [rng.randrange(256)]]))
+
+    expected = [
+        get_cap_value(RAPDU.unmarshal(response + [0x90, 0x00]), ipb, psn)
+        for response, ipb, psn in zip(responses, ipbs, psns)
+    ]
+    assert get_cap_values(responses, ipbs, psns) == expected
+    assert get_cap_values(responses, ipbs, psns, chunk_size=7) == expected
+    assert get_cap_values(responses[:1], BARCLAYS_IPB) == [46076570]
+    assert get_cap_values([], BARCLAYS_IPB) == []
+
+
+def test_get_cap_values_errors():
+    pytest.importorskip("numpy")
+    with pytest.raises(CAPError):
+        get_cap_values([[0x80, 0x02, 0x00, 0x00]], BARCLAYS_IPB)
+    with pytest.raises(CAPError):
+        get_cap_values([[0x5A, 0x01, 0x00]], BARCLAYS_IPB)
+    with pytest.raises(CAPError):
+        get_cap_values([[0x77, 0x04, 0x9F, 0x27, 0x01, 0x80]], [0x00, 0x00, 0x00])
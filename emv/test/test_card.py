@@ -0,0 +1,88 @@
+from emv.card import Card
+from emv.protocol.command import GetDataCommand
+from emv.protocol.data import Tag
+from emv.simulator import SimulatedCard, SimulatedConnection
+from emv.test.test_apdu_budget import CountingConnection
+
+
+def counting_card(**kwargs):
+    connection = CountingConnection(SimulatedConnection(SimulatedCard()))
+    return Card(connection, **kwargs), connection
+
+
+def test_cached_list_applications():
+    card, connection = counting_card()
+    apps = card.list_applications()
+    assert connection.apdus == 3
+    # SELECT PSE, and both READ RECORDs (including the error) are cached
+    assert card.list_applications() == apps
+    assert connection.apdus == 3
+
+    card.select_application(apps[0][Tag.ADF_NAME])
+    card.select_application(apps[0][Tag.ADF_NAME])
+    assert connection.apdus == 4
+    # Selecting the PSE again must be sent, but its records are cached
+    assert card.list_applications() == apps
+    assert connection.apdus == 5
+
+
+def test_invalidation():
+    card, connection = counting_card()
+    aid = card.list_applications()[0][Tag.ADF_NAME]
+    card.select_application(aid)
+    card.read_record(1, sfi=1)
+    assert connection.apdus == 5
+
+    # GPO changes the card's state, so records must be read again, and a SELECT
+    # after it must be sent to end the transaction
+    card.get_processing_options()
+    card.read_record(1, sfi=1)
+    card.select_application(aid)
+    assert connection.apdus == 8
+
+    card.reset()
+    card.select_application(aid)
+    assert connection.apdus == 9
+
+    # Raw commands could change the card's state too
+    card.read_record(1, sfi=1)
+    card.tp.transmit(GetDataCommand(GetDataCommand.ATC).marshal())
+    card.select_application(aid)
+    card.read_record(1, sfi=1)
+    assert connection.apdus == 13
+
+
+def test_cached_get_data():
+    card, connection = counting_card()
+    card.select_application(card.list_applications()[0][Tag.ADF_NAME])
+    assert connection.apdus == 4
+
+    # Counters are always read from the card, without clearing the cache
+    assert card.get_metadata()["atc"] == 0
+    card.get_processing_options()
+    assert card.get_metadata()["atc"] == 1
+    card.read_record(1, sfi=1)
+    assert card.get_metadata()["atc"] == 1
+    card.read_record(1, sfi=1)
+    assert connection.apdus == 15
+
+    # Static items are cached
+    assert card.get_data_item(GetDataCommand.LOG_FORMAT, Tag((0x9F, 0x4F))) is None
+    assert card.get_data_item(GetDataCommand.LOG_FORMAT, Tag((0x9F, 0x4F))) is None
+    assert connection.apdus == 16
+
+
+def test_cached_cap():
+    card, connection = counting_card()
+    value = card.generate_cap_value("1234")
+    assert connection.apdus == 8
+    assert card.generate_cap_value("1234") != value
+    assert connection.apdus == 16
+    assert card.get_data_item(GetDataCommand.ATC, Tag.ATC) == [0x00, 0x02]
+
+
+def test_uncached():
+    card, connection = counting_card(cache=False)
+    card.list_applications()
+    card.list_applications()
+    assert connection.apdus == 6
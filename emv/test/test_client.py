@@ -0,0 +1,82 @@
+import subprocess
+import sys
+from click.testing import CliRunner
+import emv
+from emv.card import Card
+from emv.command import client
+from emv.command.client import cli
+from emv.simulator import (
+    SimulatedCard,
+    SimulatedConnection,
+    SimulatedApplication,
+    SAMPLE_RECORD,
+)
+from emv.trace import TraceWriter
+from emv.test.test_trace import cap_session
+
+
+def test_version():
+    result = CliRunner().invoke(cli, ["version"], obj={})
+    assert result.exit_code == 0
+    assert result.output == emv.__version__ + "\n"
+
+
+def test_startup_is_lazy():
+    # Commands which don't talk to a card shouldn't load the protocol modules
+    # or the smartcard library.
+    code = (
+        "import sys\n"
+        "from emv.command.client import cli\n"
+        "try:\n"
+        "    cli(['version'], obj={})\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print(' '.join(sorted(sys.modules)))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, stdout=subprocess.PIPE
+    ).stdout.decode()
+    modules = output.split("\n")[-2].split()
+    for module in (
+        "emv.card",
+        "emv.protocol",
+        "smartcard",
+        "terminaltables",
+        "pycountry",
+    ):
+        assert module not in modules
+
+
+def test_replay(tmp_path):
+    path = str(tmp_path / "trace.bin")
+    with TraceWriter(path) as writer:
+        for command, response in cap_session():
+            writer.write_command(command)
+            writer.write_response(response[:-2], response[-2], response[-1])
+
+    result = CliRunner().invoke(cli, ["--replay", path, "--pin", "1234", "cap"], obj={})
+    assert result.exit_code == 0
+    assert result.output == "46076570\n"
+
+
+def test_info_discovery(monkeypatch):
+    app = SimulatedApplication(
+        [0xA0, 0x00, 0x00, 0x00, 0x03, 0x80, 0x02],
+        "BARCLAYS",
+        {
+            (1, 1): SAMPLE_RECORD,
+            (1, 2): [0x5F, 0x20, 0x01, 0x41],
+            (3, 1): [0x5F, 0x28, 0x02, 0x08, 0x26],
+            (11, 1): [0x9F, 0x4A, 0x01, 0x82],
+        },
+    )
+    outputs = []
+    for args in (["info"], ["info", "--exhaustive"]):
+        connection = SimulatedConnection(SimulatedCard([app]))
+        monkeypatch.setattr(client, "get_card", lambda ctx: Card(connection))
+        result = CliRunner().invoke(cli, args, obj={})
+        assert result.exit_code == 0, result.output
+        outputs.append(result.output)
+
+    assert "File: 11,1" in outputs[0]
+    assert outputs[0] == outputs[1]
@@ -0,0 +1,51 @@
+import threading
+from emv.card import Card
+from emv.exc import InvalidPINException
+from emv.pool import ReaderPool
+from emv.simulator import SimulatedCard, SimulatedConnection
+from emv.test.fixtures import GatedConnection
+
+
+class EmptyReader(object):
+    T0_protocol = 1
+
+    def connect(self, protocol=None):
+        raise IOError("No card in reader")
+
+
+def test_pool():
+    sims = [SimulatedCard(pin_tries=i + 1) for i in range(8)]
+    # The cards run in parallel: each card's first command waits until all of
+    # them are transmitting.
+    barrier = threading.Barrier(len(sims))
+    connections = {
+        "reader %s" % i: GatedConnection(sim, gate=barrier)
+        for i, sim in enumerate(sims)
+    }
+    connections["empty"] = EmptyReader()
+    pool = ReaderPool(connections)
+
+    report = pool.run(Card.get_metadata)
+
+    assert len(report) == 9
+    assert [r.result["pin_retries"] for r in report.succeeded] == list(range(1, 9))
+    assert [r.reader for r in report.failed] == ["empty"]
+    assert isinstance(report.failed[0].error, IOError)
+    assert report.throughput > 0
+
+    # Cards are kept between runs
+    card = pool.card("reader 0")
+    report = pool.run(Card.generate_cap_value, "1234", readers=["reader 0", "reader 1"])
+    assert len(report.succeeded) == 2
+    assert pool.card("reader 0") is card
+    assert sims[0].atc == 1
+
+
+def test_pool_errors():
+    connections = {
+        "good": SimulatedConnection(),
+        "bad": SimulatedConnection(SimulatedCard(pin="0000")),
+    }
+    report = ReaderPool(connections).run(lambda card: card.generate_cap_value("1234"))
+    assert [r.reader for r in report.succeeded] == ["good"]
+    assert isinstance(report.failed[0].error, InvalidPINException)
@@ -0,0 +1,97 @@
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from emv.card import Card
+from emv.protocol.command import GetDataCommand
+from emv.protocol.data import Tag
+from emv.session import ReaderSession, HIGH, LOW
+from emv.simulator import SimulatedCard, SimulatedConnection
+
+
+def test_concurrent_transactions():
+    # With T=0 GET RESPONSE chaining, interleaved exchanges would corrupt responses
+    sim = SimulatedCard(get_response=True)
+    expected = set()
+    reference = Card(SimulatedConnection(SimulatedCard()))
+    for _ in range(40):
+        expected.add(reference.generate_cap_value("1234"))
+
+    with ReaderSession(SimulatedConnection(sim)) as session:
+
+        def producer(i):
+            if i % 2:
+                return session.exchange(GetDataCommand(GetDataCommand.ATC))
+            return session.submit(lambda card: card.generate_cap_value("1234")).result()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(producer, range(80)))
+
+    assert sim.atc == 40
+    values = results[::2]
+    assert set(values) == expected
+    assert all(Tag.ATC in res.data for res in results[1::2])
+
+
+def test_priority():
+    order = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def block(card):
+        started.set()
+        release.wait()
+
+    with ReaderSession(SimulatedConnection()) as session:
+        session.submit(block)
+        started.wait()
+        futures = [
+            session.submit(lambda card: order.append("low"), priority=LOW),
+            session.submit(lambda card: order.append("normal 1")),
+            session.submit(lambda card: order.append("high"), priority=HIGH),
+            session.submit(lambda card: order.append("normal 2")),
+        ]
+        release.set()
+        for future in futures:
+            future.result()
+    assert order == ["high", "normal 1", "normal 2", "low"]
+
+
+def test_errors_and_close():
+    session = ReaderSession(SimulatedConnection())
+    with pytest.raises(ZeroDivisionError):
+        session.submit(lambda card: 1 / 0).result()
+    # The session carries on after a failed job
+    assert session.submit(lambda card: card.get_metadata()).result()["atc"] == 0
+
+    started = threading.Event()
+    release = threading.Event()
+
+    def block(card):
+        started.set()
+        release.wait()
+
+    session.submit(block)
+    started.wait()
+    pending = session.submit(lambda card: card.get_metadata())
+    session.close(cancel_pending=True, wait=False)
+    assert pending.cancelled()
+    # The running job is only released once close() has returned
+    release.set()
+    session.thread.join()
+    with pytest.raises(RuntimeError):
+        session.submit(lambda card: None)
+
+
+def test_exchange_from_job():
+    with ReaderSession(SimulatedConnection()) as session:
+        # Waiting for another job from a job would deadlock
+        job = session.submit(
+            lambda card: session.exchange(GetDataCommand(GetDataCommand.ATC))
+        )
+        with pytest.raises(RuntimeError):
+            job.result()
+        # The job's card can be used instead
+        res = session.submit(
+            lambda card: card.tp.exchange(GetDataCommand(GetDataCommand.ATC))
+        ).result()
+        assert Tag.ATC in res.data
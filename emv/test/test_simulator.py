@@ -0,0 +1,190 @@
+import pytest
+from emv.card import Card
+from emv.exc import InvalidPINException
+from emv.protocol.data import Tag
+from emv.cap import get_arqc_req
+from emv.protocol.command import (
+    GetDataCommand,
+    VerifyCommand,
+    GenerateApplicationCryptogramCommand,
+)
+from emv.protocol.response import ErrorResponse
+from emv.simulator import (
+    SimulatedCard,
+    SimulatedConnection,
+    SimulatedApplication,
+    SAMPLE_RECORD,
+)
+
+
+def test_list_applications():
+    card = Card(SimulatedConnection())
+    apps = card.list_applications()
+    assert len(apps) == 1
+    assert apps[0][Tag.APP_LABEL] == list(b"BARCLAYS")
+
+    res = card.select_application(apps[0][Tag.ADF_NAME])
+    assert res.data[Tag.FCI][Tag.FCI_PROP][Tag.APP_LABEL] == list(b"BARCLAYS")
+
+
+def test_application_data():
+    card = Card(SimulatedConnection())
+    card.select_application(card.list_applications()[0][Tag.ADF_NAME])
+    opts = card.get_processing_options()
+    assert opts["AIP"] == [0x18, 0x00]
+    assert opts["AFL"] == [0x08, 0x01, 0x01, 0x00]
+
+    data = card.get_application_data(opts["AFL"])
+    assert data[Tag.IAF] == [0xA0]
+    with pytest.raises(ErrorResponse):
+        card.read_record(2, sfi=1)
+
+
+def test_metadata():
+    sim = SimulatedCard(atc=0x10, last_online_atc=0x0C, pin_tries=2)
+    card = Card(SimulatedConnection(sim))
+    assert card.get_metadata() == {"pin_retries": 2, "atc": 16, "last_online_atc": 12}
+    assert card.get_data_item((0x9F, 0x4F), (0x9F, 0x4F)) is None
+
+
+def test_cap():
+    sim = SimulatedCard()
+    card = Card(SimulatedConnection(sim))
+    value = card.generate_cap_value("1234")
+    assert sim.atc == 1
+    # Cryptograms are deterministic
+    assert value == Card(SimulatedConnection(SimulatedCard())).generate_cap_value(
+        "1234"
+    )
+    assert card.generate_cap_value("1234") != value
+    assert card.generate_cap_value("1234", challenge=1234, value=10) != value
+    assert sim.atc == 3
+
+
+def test_cap_rmtf1():
+    sim = SimulatedCard(response_format=1, get_response=True)
+    card = Card(SimulatedConnection(sim))
+    value = card.generate_cap_value("1234")
+    assert value == Card(SimulatedConnection(SimulatedCard())).generate_cap_value(
+        "1234"
+    )
+
+
+def test_pin():
+    sim = SimulatedCard(pin="4321", pin_tries=2)
+    card = Card(SimulatedConnection(sim))
+    with pytest.raises(InvalidPINException):
+        card.generate_cap_value("1234")
+    assert card.get_metadata()["pin_retries"] == 1
+
+    card.generate_cap_value("4321")
+    assert sim.pin_tries == 2
+
+    for _ in range(2):
+        with pytest.raises(InvalidPINException):
+            card.verify_pin("0000")
+    with pytest.raises(ErrorResponse) as exc:
+        card.tp.exchange(VerifyCommand("4321"))
+    assert (exc.value.sw1, exc.value.sw2) == (0x69, 0x83)
+
+
+def test_errors():
+    conn = SimulatedConnection()
+    # GPO without a selected application
+    assert conn.transmit([0x80, 0xA8, 0x00, 0x00, 0x02, 0x83, 0x00, 0x00]) == (
+        [],
+        0x69,
+        0x85,
+    )
+    # GENERATE AC without GPO
+    assert conn.transmit([0x80, 0xAE, 0x80, 0x00, 0x01, 0x00, 0x00])[1:] == (0x69, 0x85)
+    assert conn.transmit([0x00, 0x00, 0x00, 0x00, 0x00])[1:] == (0x6D, 0x00)
+    assert conn.transmit([0x40, 0xA4, 0x04, 0x00, 0x00])[1:] == (0x6E, 0x00)
+
+    card = Card(conn)
+    card.select_application(card.list_applications()[0][Tag.ADF_NAME])
+    card.get_processing_options()
+    # Data doesn't match CDOL1
+    assert conn.transmit([0x80, 0xAE, 0x80, 0x00, 0x01, 0x00, 0x00])[1:] == (0x67, 0x00)
+
+
+def test_cryptogram_types():
+    GenerateAC = GenerateApplicationCryptogramCommand
+    card = Card(SimulatedConnection())
+    card.select_application(card.list_applications()[0][Tag.ADF_NAME])
+    app_data = card.get_application_data(card.get_processing_options()["AFL"])
+    data = get_arqc_req(app_data).data
+
+    # TC and ARQC requests both get an ARQC: the card always goes online
+    for requested, cid in (
+        (GenerateAC.TC, GenerateAC.ARQC),
+        (GenerateAC.ARQC, GenerateAC.ARQC),
+        (GenerateAC.AAC, GenerateAC.AAC),
+    ):
+        card.get_processing_options()
+        res = card.tp.exchange(GenerateAC(requested, data))
+        assert res.data[Tag.RMTF2][(0x9F, 0x27)] == [cid]
+
+
+def test_connect_resets():
+    conn = SimulatedConnection()
+    card = Card(conn)
+    card.select_application(card.list_applications()[0][Tag.ADF_NAME])
+    card.get_processing_options()
+    assert conn.card.transaction
+    card.reset()
+    assert not conn.card.transaction and conn.card.selected is None
+
+
+def test_applications():
+    apps = [
+        SimulatedApplication([0xA0, 0x00, 0x00, 0x00, 0x03, 0x10, 0x10], "VISA", {}),
+        SimulatedApplication(
+            [0xA0, 0x00, 0x00, 0x00, 0x03, 0x80, 0x02],
+            "CAP",
+            {(1, 1): SAMPLE_RECORD, (2, 1): [0x5F, 0x20, 0x01, 0x41]},
+        ),
+    ]
+    card = Card(SimulatedConnection(SimulatedCard(apps)))
+    found = card.list_applications()
+    assert [app[Tag.APP_LABEL] for app in found] == [list(b"VISA"), list(b"CAP")]
+
+    card.select_application(found[1][Tag.ADF_NAME])
+    assert apps[1].afl == bytes([0x08, 0x01, 0x01, 0x00, 0x10, 0x01, 0x01, 0x00])
+    assert card.get_data_item(GetDataCommand.ATC, Tag.ATC) == [0x00, 0x00]
+    assert card.generate_cap_value("1234") > 0
+
+
+def test_discover_records():
+    app = SimulatedApplication(
+        [0xA0, 0x00, 0x00, 0x00, 0x03, 0x80, 0x02],
+        "CAP",
+        {
+            (1, 1): SAMPLE_RECORD,
+            (2, 1): [0x5F, 0x20, 0x01, 0x41],
+            (2, 3): [0x5F, 0x20, 0x01, 0x42],
+            (3, 1): [0x5F, 0x20, 0x01, 0x43],
+            (3, 3): [0x5F, 0x20, 0x01, 0x44],
+        },
+        # Record 2 of SFI 3 exists, but can't be read
+        errors={(3, 2): (0x69, 0x82)},
+    )
+    card = Card(SimulatedConnection(SimulatedCard([app])))
+    card.select_application(list(app.aid))
+
+    def status(record, sfi):
+        with pytest.raises(ErrorResponse) as exc:
+            card.read_record(record, sfi=sfi)
+        return exc.value.sw1, exc.value.sw2
+
+    assert status(2, 2) == (0x6A, 0x83)
+    assert status(1, 4) == (0x6A, 0x82)
+
+    def found(**kwargs):
+        return [(sfi, record) for sfi, record, _ in card.discover_records(**kwargs)]
+
+    # Stops at the gap in SFI 2 (record not found), but not at the unreadable
+    # record in SFI 3.
+    assert found() == [(1, 1), (2, 1), (3, 1), (3, 3)]
+    assert found(exhaustive=True) == [(1, 1), (2, 1), (2, 3), (3, 1), (3, 3)]
+    assert found(afl=[0x10, 0x01, 0x03, 0x00]) == [(2, 1), (2, 3)]
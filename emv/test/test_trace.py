@@ -0,0 +1,225 @@
+import io
+import mmap
+import pytest
+from emv.card import Card
+from emv.cap import get_arqc_req
+from emv.exc import EMVProtocolError, ReplayError, MissingAppException
+from emv.protocol.command import (
+    SelectCommand,
+    ReadCommand,
+    UnknownCommand,
+    GetProcessingOptions,
+    VerifyCommand,
+)
+from emv.protocol.structures import TLV
+from emv.protocol.response import SuccessResponse, ErrorResponse
+from emv.protocol.data import Tag
+from emv.transmission import TransmissionProtocol
+from emv.simulator import SimulatedConnection
+from emv.util import unformat_bytes
+from emv.trace import (
+    decode_trace,
+    decode_exchange,
+    TraceWriter,
+    TraceReader,
+    RecordingConnection,
+    ReplayConnection,
+    mask_pin,
+    COMMAND,
+    RESPONSE,
+)
+from emv.test.fixtures import APP_DATA
+from emv.test.test_transmission import MockConnection
+
+FCI = unformat_bytes(
+    """6F 1D 84 07 A0 00 00 00 03 80 02 A5 12 50 08 42 41 52 43 4C
+                         41 59 53 87 01 00 5F 2D 02 65 6E"""
+)
+
+
+def test_decode_trace():
+    trace = [
+        (
+            SelectCommand([0xA0, 0, 0, 0, 3, 0x80, 2]).marshal(),
+            bytes(FCI + [0x90, 0x00]),
+        ),
+        (ReadCommand(1, sfi=1).marshal(), b"\x6a\x83"),
+        (bytes([0x00, 0x84, 0x00, 0x00, 0x08]), bytes(range(8)) + b"\x90\x00"),
+    ]
+    decoded = decode_trace(trace)
+
+    assert [type(c) for c, _ in decoded] == [SelectCommand, ReadCommand, UnknownCommand]
+    assert [type(r) for _, r in decoded] == [
+        SuccessResponse,
+        ErrorResponse,
+        SuccessResponse,
+    ]
+    assert decoded[0][1].data[Tag.FCI][Tag.FCI_PROP][Tag.APP_LABEL] == b"BARCLAYS"
+    assert decoded[1][1].get_status() == "Wrong parameter(s) P1 P2; record not found"
+
+    command, response = decode_exchange(*trace[0])
+    assert command.data == bytes([0xA0, 0, 0, 0, 3, 0x80, 2])
+    assert (response.sw1, response.sw2) == (0x90, 0x00)
+
+
+def test_record_and_read(tmp_path):
+    path = tmp_path / "trace.bin"
+    responses = [
+        (FCI, 0x90, 0x00),
+        ([], 0x6A, 0x83),
+        ([], 0x61, 0x02),
+        ([1, 2], 0x90, 0x00),
+    ]
+    with TraceWriter(path) as writer:
+        tp = TransmissionProtocol(
+            RecordingConnection(MockConnection(responses), writer)
+        )
+        tp.exchange(SelectCommand([0xA0, 0, 0, 0, 3, 0x80, 2]))
+        with pytest.raises(ErrorResponse):
+            tp.exchange(ReadCommand(1, sfi=1))
+        tp.exchange(ReadCommand(1, sfi=2))
+
+    with TraceReader(path) as reader:
+        records = list(reader.records())
+        assert [r.direction for r in records] == [COMMAND, RESPONSE] * 4
+        assert (
+            records[0].payload == SelectCommand([0xA0, 0, 0, 0, 3, 0x80, 2]).marshal()
+        )
+        assert records[1].payload == bytes(FCI)
+        assert (records[3].sw1, records[3].sw2) == (0x6A, 0x83)
+
+        exchanges = list(reader.exchanges())
+        assert len(exchanges) == 4
+        assert exchanges[1].command == ReadCommand(1, sfi=1).marshal()
+        assert exchanges[1].response == b"\x6a\x83"
+        assert exchanges[0].duration >= 0
+
+        assert [e.command[1] for e in reader.exchanges(ins=0xB2)] == [0xB2, 0xB2]
+        assert len(list(reader.exchanges(sw=(0x90, 0x00)))) == 2
+        assert list(reader.exchanges(start=exchanges[3].timestamp + 1)) == []
+
+        decoded = decode_trace(reader)
+        assert [type(r) for _, r in decoded] == [
+            SuccessResponse,
+            ErrorResponse,
+            ErrorResponse,
+            SuccessResponse,
+        ]
+
+
+def test_invalid_trace(tmp_path):
+    path = tmp_path / "trace.bin"
+    path.write_bytes(b"NOTATRACE!")
+    with pytest.raises(EMVProtocolError):
+        TraceReader(path)
+
+    buf = io.BytesIO()
+    writer = TraceWriter(buf)
+    writer.write_command(b"\x00\xb2\x01\x0c\x00")
+    path.write_bytes(buf.getvalue()[:-1])
+    with TraceReader(path) as reader:
+        with pytest.raises(EMVProtocolError):
+            list(reader.records())
+
+
+def cap_session():
+    """The exchanges of a CAP transaction (as Card.generate_cap_value performs)."""
+    ok = [0x90, 0x00]
+    app = [0xA0, 0x00, 0x00, 0x00, 0x03, 0x80, 0x02]
+    pse_fci = unformat_bytes(
+        "6F 15 84 0E 31 50 41 59 2E 53 59 53 2E 44 44 46 30 31 A5 03 88 01 01"
+    )
+    directory = (
+        [0x70, 0x15, 0x61, 0x13, 0x4F, 0x07] + app + [0x50, 0x08] + list(b"BARCLAYS")
+    )
+    rmtf1 = unformat_bytes(
+        "80 12 80 09 5F 0F 9D 37 98 E9 3F 12 9A 06 0A 0A 03 A4 90 00"
+    )
+    return [
+        (SelectCommand("1PAY.SYS.DDF01").marshal(), pse_fci + ok),
+        (ReadCommand(1, sfi=1).marshal(), directory + ok),
+        (ReadCommand(2, sfi=1).marshal(), [0x6A, 0x83]),
+        (SelectCommand(app).marshal(), FCI + ok),
+        (
+            GetProcessingOptions().marshal(),
+            [0x80, 0x06, 0x18, 0x00, 0x08, 0x01, 0x01, 0x00] + ok,
+        ),
+        (ReadCommand(1, sfi=1).marshal(), APP_DATA + ok),
+        (VerifyCommand("1234").marshal(), ok),
+        (get_arqc_req(TLV.unmarshal(APP_DATA)[Tag.RECORD]).marshal(), rmtf1 + ok),
+    ]
+
+
+def test_replay():
+    card = Card(ReplayConnection(cap_session()))
+    assert card.generate_cap_value("1234") == 46076570
+
+    # Responses are matched on the command, rather than the order of the trace
+    card = Card(ReplayConnection(cap_session()))
+    with pytest.raises(ReplayError):
+        card.get_processing_options([0x01])
+    fci = card.select_application([0xA0, 0x00, 0x00, 0x00, 0x03, 0x80, 0x02]).data
+    assert fci[Tag.FCI][Tag.FCI_PROP][Tag.APP_LABEL] == list(b"BARCLAYS")
+    apps = card.list_applications()
+    assert [app[Tag.APP_LABEL] for app in apps] == [list(b"BARCLAYS")]
+
+    # Resetting reconnects, and the trace carries on being served
+    card = Card(ReplayConnection(cap_session()))
+    card.reset()
+    assert card.generate_cap_value("1234") == 46076570
+
+
+def test_replay_not_strict():
+    card = Card(ReplayConnection(cap_session(), strict=False))
+    assert card.get_metadata() == {}
+    with pytest.raises(MissingAppException):
+        card.select_application("2PAY.SYS.DDF01")
+
+
+def test_replay_file(tmp_path):
+    path = tmp_path / "trace.bin"
+    with TraceWriter(path) as writer:
+        for command, response in cap_session():
+            writer.write_command(command)
+            writer.write_response(response[:-2], response[-2], response[-1])
+
+    card = Card(ReplayConnection.from_file(path))
+    assert card.generate_cap_value("1234") == 46076570
+
+
+def test_record_redacted(tmp_path):
+    path = tmp_path / "trace.bin"
+    pin_block = VerifyCommand("1234").data
+    for redact in (False, True):
+        with TraceWriter(path) as writer:
+            connection = RecordingConnection(
+                SimulatedConnection(), writer, redact=redact
+            )
+            Card(connection).generate_cap_value("1234")
+        assert (pin_block in path.read_bytes()) is not redact
+
+    # The masked VERIFY is still replayed
+    card = Card(ReplayConnection.from_file(path))
+    assert card.generate_cap_value("1234") == Card(
+        SimulatedConnection()
+    ).generate_cap_value("1234")
+    assert mask_pin(VerifyCommand("1234").marshal()) == bytes(
+        unformat_bytes("00 20 00 80 08 FF FF FF FF FF FF FF FF")
+    )
+
+
+def test_invalid_trace_closed(tmp_path, monkeypatch):
+    mapped = []
+    original = mmap.mmap
+
+    def tracking_mmap(*args, **kwargs):
+        mapped.append(original(*args, **kwargs))
+        return mapped[-1]
+
+    monkeypatch.setattr(mmap, "mmap", tracking_mmap)
+    path = tmp_path / "trace.bin"
+    for data in (b"EMV", b"NOTATRACE!", b"EMVTRACE\x02\x00"):
+        path.write_bytes(data)
+        with pytest.raises(EMVProtocolError):
+            TraceReader(path)
+    assert len(mapped) == 3 and all(m.closed for m in mapped)
@@ -1,5 +1,5 @@
 from emv.util import unformat_bytes
-from emv.protocol.command import SelectCommand
+from emv.protocol.command import SelectCommand, ReadCommand
 from emv.protocol.response import SuccessResponse
 from emv.transmission import TransmissionProtocol
 
@@ -42,3 +42,16 @@ def test_retry():
     tp = TransmissionProtocol(conn)
     res = tp.exchange(SelectCommand([0xA0, 0x00, 0x00, 0x00, 0x03, 0x80, 0x02]))
     assert type(res) is SuccessResponse
+
+
+def test_wrong_length():
+    responses = [([], 0x6C, 0x10), ([0x01] * 0x10, 0x90, 0x00)]
+
+    conn = MockConnection(responses)
+    tp = TransmissionProtocol(conn)
+    res = tp.exchange(ReadCommand(1, sfi=1))
+    assert type(res) is SuccessResponse
+    assert conn.requests == [
+        [0x00, 0xB2, 0x01, 0x0C, 0x00],
+        [0x00, 0xB2, 0x01, 0x0C, 0x10],
+    ]
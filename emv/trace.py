@@ -0,0 +1,282 @@
+""" Recording, reading and decoding APDU traces.
+
+    A trace is a sequence of (command, response) exchanges, each as bytes (or lists
+    of bytes), where the response includes the SW1 and SW2 status bytes.
+
+    Traces can be recorded to a compact binary file by wrapping a connection in a
+    RecordingConnection. The file starts with a header (MAGIC and a version number),
+    followed by a record for each command sent and response received:
+
+        timestamp   uint64  nanoseconds since the epoch
+        direction   uint8   COMMAND or RESPONSE
+        sw1, sw2    uint8   status bytes (zero for commands)
+        length      uint32  length of the payload
+        payload             the command APDU, or the response data
+
+    All integers are little-endian. TraceReader memory-maps trace files, so they
+    can be scanned without reading them into memory.
+"""
+import mmap
+import struct
+import time
+from collections import namedtuple, deque
+from .exc import EMVProtocolError, ReplayError
+from .protocol.command import CAPDU, VerifyCommand
+from .protocol.response import RAPDU
+from .util import format_bytes
+
+MAGIC = b"EMVTRACE"
+VERSION = 1
+FILE_HEADER = struct.Struct("<8sH")
+RECORD_HEADER = struct.Struct("<QBBBI")
+
+COMMAND = 0
+RESPONSE = 1
+
+TraceRecord = namedtuple(
+    "TraceRecord", ["timestamp", "direction", "sw1", "sw2", "payload"]
+)
+
+# command: the command APDU, as bytes
+# response: the response data followed by SW1 and SW2, as bytes
+# timestamp: time the command was sent, in nanoseconds since the epoch
+# duration: time taken for the card to respond, in nanoseconds
+Exchange = namedtuple("Exchange", ["command", "response", "timestamp", "duration"])
+
+
+class TraceWriter(object):
+    """Write a binary trace file. `output` is a path, or a binary file object."""
+
+    def __init__(self, output):
+        if isinstance(output, (str, bytes)) or hasattr(output, "__fspath__"):
+            self.fp = open(output, "wb")
+            self._close_fp = True
+        else:
+            self.fp = output
+            self._close_fp = False
+        self.fp.write(FILE_HEADER.pack(MAGIC, VERSION))
+
+    def write(self, direction, payload, sw1=0, sw2=0, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time_ns()
+        payload = bytes(payload)
+        self.fp.write(
+            RECORD_HEADER.pack(timestamp, direction, sw1, sw2, len(payload)) + payload
+        )
+
+    def write_command(self, command, timestamp=None):
+        self.write(COMMAND, command, timestamp=timestamp)
+
+    def write_response(self, data, sw1, sw2, timestamp=None):
+        self.write(RESPONSE, data, sw1, sw2, timestamp=timestamp)
+
+    def flush(self):
+        self.fp.flush()
+
+    def close(self):
+        if self._close_fp:
+            self.fp.close()
+        else:
+            self.fp.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TraceReader(object):
+    """Read a binary trace file, by memory-mapping it."""
+
+    def __init__(self, path):
+        with open(path, "rb") as fp:
+            try:
+                self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files can't be mapped
+                raise EMVProtocolError("Invalid trace file: %s" % path)
+        try:
+            if len(self._mmap) < FILE_HEADER.size:
+                raise EMVProtocolError("Invalid trace file: %s" % path)
+            magic, version = FILE_HEADER.unpack_from(self._mmap)
+            if magic != MAGIC:
+                raise EMVProtocolError("Invalid trace file: %s" % path)
+            if version != VERSION:
+                raise EMVProtocolError("Unsupported trace file version: %s" % version)
+        except EMVProtocolError:
+            self._mmap.close()
+            raise
+
+    def _headers(self):
+        """Yield (offset of payload, header fields) for each record."""
+        buf = self._mmap
+        end = len(buf)
+        unpack = RECORD_HEADER.unpack_from
+        size = RECORD_HEADER.size
+        offset = FILE_HEADER.size
+        while offset < end:
+            if offset + size > end:
+                raise EMVProtocolError("Trace truncated at offset %s" % offset)
+            header = unpack(buf, offset)
+            offset += size
+            if offset + header[4] > end:
+                raise EMVProtocolError("Trace truncated at offset %s" % offset)
+            yield offset, header
+            offset += header[4]
+
+    def records(self):
+        """Yield a TraceRecord for each command and response in the trace."""
+        buf = self._mmap
+        for offset, (timestamp, direction, sw1, sw2, length) in self._headers():
+            yield TraceRecord(
+                timestamp, direction, sw1, sw2, buf[offset : offset + length]
+            )
+
+    def exchanges(self, ins=None, sw=None, start=None, end=None):
+        """Yield an Exchange for each command and its response.
+
+        Exchanges can be filtered by instruction byte (`ins`), by status bytes
+        (`sw`, a (SW1, SW2) tuple), and by timestamp (`start` <= timestamp < `end`).
+        Filtering happens before payloads are copied out of the file.
+        """
+        buf = self._mmap
+        command = None
+        for offset, (timestamp, direction, sw1, sw2, length) in self._headers():
+            if direction == COMMAND:
+                if (
+                    (ins is None or (length > 1 and buf[offset + 1] == ins))
+                    and (start is None or timestamp >= start)
+                    and (end is None or timestamp < end)
+                ):
+                    command = (offset, length, timestamp)
+                else:
+                    command = None
+            elif command is not None:
+                if sw is None or (sw1, sw2) == tuple(sw):
+                    cmd_offset, cmd_length, cmd_timestamp = command
+                    yield Exchange(
+                        buf[cmd_offset : cmd_offset + cmd_length],
+                        buf[offset : offset + length] + bytes((sw1, sw2)),
+                        cmd_timestamp,
+                        timestamp - cmd_timestamp,
+                    )
+                command = None
+
+    def __iter__(self):
+        return self.exchanges()
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def mask_pin(command):
+    """Return a command APDU (as bytes) with the data of a VERIFY command, which
+    holds the PIN block, replaced with 0xFF bytes. Other commands are unchanged."""
+    command = bytes(command)
+    if CAPDU.get_class(command) is not VerifyCommand or len(command) < 5:
+        return command
+    length = command[4]
+    return command[:5] + b"\xff" * length + command[5 + length :]
+
+
+class RecordingConnection(object):
+    """Wraps a pyscard-style connection, recording every exchange to a TraceWriter.
+
+    If `redact` is True, PIN blocks are masked in the trace, see `mask_pin`."""
+
+    def __init__(self, connection, writer, redact=False):
+        self.connection = connection
+        self.writer = writer
+        self.redact = redact
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def transmit(self, command):
+        self.writer.write_command(mask_pin(command) if self.redact else command)
+        data, sw1, sw2 = self.connection.transmit(command)
+        self.writer.write_response(data, sw1, sw2)
+        return data, sw1, sw2
+
+
+class ReplayConnection(object):
+    """A pyscard-style connection which serves responses from a recorded trace,
+    so that card operations can be run without a reader.
+
+    Responses are matched on the bytes of the command sent, not on the order of
+    the trace. If the same command was recorded more than once, its responses are
+    returned in the order they were recorded, and the last one is repeated once
+    they run out.
+
+    If `strict` is True, sending a command which isn't in the trace raises a
+    ReplayError, otherwise the card responds with `missing_status`.
+
+    A VERIFY command recorded with its PIN masked matches any PIN of the same length.
+    """
+
+    T0_protocol = 1
+
+    def __init__(self, exchanges, strict=True, missing_status=(0x6A, 0x82)):
+        self.strict = strict
+        self.missing_status = tuple(missing_status)
+        self.responses = {}
+        for exchange in exchanges:
+            command, response = bytes(exchange[0]), bytes(exchange[1])
+            self.responses.setdefault(command, deque()).append(
+                (list(response[:-2]), response[-2], response[-1])
+            )
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """Construct a ReplayConnection from a binary trace file."""
+        with TraceReader(path) as reader:
+            return cls(reader.exchanges(), **kwargs)
+
+    def connect(self, protocol=None):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def getProtocol(self):
+        return self.T0_protocol
+
+    def transmit(self, command):
+        responses = self.responses.get(bytes(command))
+        if responses is None:
+            responses = self.responses.get(mask_pin(command))
+        if responses is None:
+            if self.strict:
+                raise ReplayError(
+                    "Command not found in trace: %s" % format_bytes(command)
+                )
+            return [], self.missing_status[0], self.missing_status[1]
+        if len(responses) > 1:
+            data, sw1, sw2 = responses.popleft()
+        else:
+            data, sw1, sw2 = responses[0]
+        return list(data), sw1, sw2
+
+
+def decode_exchange(command, response):
+    """Decode a single exchange, returning a (CAPDU, RAPDU) pair."""
+    return CAPDU.unmarshal(command), RAPDU.build(response)
+
+
+def decode_trace(exchanges):
+    """Decode every exchange in a trace, returning a list of (CAPDU, RAPDU) pairs.
+    `exchanges` may be a list of (command, response) pairs, or a TraceReader.
+
+    Unknown commands are decoded as UnknownCommand objects, and error responses
+    are returned rather than raised.
+    """
+    unmarshal = CAPDU.unmarshal
+    build = RAPDU.build
+    return [(unmarshal(e[0]), build(e[1])) for e in exchanges]
@@ -1,5 +1,11 @@
 import logging
-from .protocol.response import RAPDU
+from .protocol.command import (
+    GetResponseCommand,
+    SelectCommand,
+    ReadCommand,
+    GetDataCommand,
+)
+from .protocol.response import RAPDU, ErrorResponse
 from .util import format_bytes
 
 
@@ -18,16 +24,25 @@ class TransmissionProtocol(object):
         assert connection.getProtocol() == connection.T0_protocol
         self.log.info("Connected to reader")
 
+    def reset(self):
+        """Reset the card by reconnecting to it."""
+        self.connection.disconnect()
+        self.connection.connect(self.connection.T0_protocol)
+        self.log.info("Reconnected to reader")
+
     def transmit(self, tx_data):
         """Send raw data to the card, and receive the reply.
 
-        tx_data should be a list of bytes.
+        tx_data should be bytes, or a list of bytes.
 
         Returns a tuple of (data, sw1, sw2) where sw1 and sw2
         are the protocol status bytes.
         """
+        return self._transmit(tx_data)
+
+    def _transmit(self, tx_data):
         self.log.debug("Tx: %s", format_bytes(tx_data))
-        data, sw1, sw2 = self.connection.transmit(tx_data)
+        data, sw1, sw2 = self.connection.transmit(list(tx_data))
         self.log.debug("Rx: %s, SW1: %02x, SW2: %02x", format_bytes(data), sw1, sw2)
         return data, sw1, sw2
 
@@ -37,17 +52,98 @@ class TransmissionProtocol(object):
         Accepts a CAPDU object and returns a RAPDU.
         """
         send_data = capdu.marshal()
-        data, sw1, sw2 = self.transmit(send_data)
+        data, sw1, sw2 = self._transmit(send_data)
 
         if sw1 == 0x6C:
             # ICC asks to reduce data size requested
+            send_data = bytearray(send_data)
             send_data[4] = sw2
-            data, sw1, sw2 = self.transmit(send_data)
+            data, sw1, sw2 = self._transmit(send_data)
 
         while sw1 == 0x61:
             # ICC has continuation data
-            d, sw1, sw2 = self.transmit([0x00, 0xC0, 0x00, 0x00, sw2])
+            d, sw1, sw2 = self._transmit(GetResponseCommand(sw2).marshal())
             data = data[:-2] + d
 
         res = RAPDU.unmarshal(data + [sw1, sw2])
         return res
+
+
+class CachingTransmissionProtocol(TransmissionProtocol):
+    """Transport layer which caches the responses to commands which don't
+    change the card's state.
+
+    - SELECT is skipped if the same file is already selected.
+    - READ RECORD responses, and GET DATA responses for the items in STATIC_DATA,
+      are cached (including errors) for each selected file. Other GET DATA items,
+      such as the ATC and PIN try counter, are counters which change during a
+      session, so they are always sent to the card.
+
+    Any other command (such as GET PROCESSING OPTIONS, VERIFY or GENERATE AC) may
+    change the card's state, so it clears the cache, as do `reset` and raw commands
+    sent with `transmit`. After a transaction has started, the next SELECT is
+    therefore always sent to the card.
+
+    Cached responses are shared, so they shouldn't be modified.
+    """
+
+    # GET DATA items which don't change during a session
+    STATIC_DATA = {GetDataCommand.LOG_FORMAT}
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self.clear_cache()
+
+    def clear_cache(self):
+        # The encoded SELECT command for the currently-selected file, and its response
+        self.selected = None
+        self.selected_response = None
+        # (selected file, command) -> response or ErrorResponse
+        self.cache = {}
+
+    def reset(self):
+        super().reset()
+        self.clear_cache()
+
+    def transmit(self, tx_data):
+        # The command is unknown, so it may change the card's state.
+        self.clear_cache()
+        return super().transmit(tx_data)
+
+    def exchange(self, capdu):
+        if isinstance(capdu, SelectCommand):
+            return self._select(capdu)
+        if isinstance(capdu, GetDataCommand):
+            if (capdu.p1, capdu.p2) not in self.STATIC_DATA:
+                # Always read from the card, but reading doesn't change its state
+                return super().exchange(capdu)
+        elif not isinstance(capdu, ReadCommand):
+            self.clear_cache()
+            return super().exchange(capdu)
+
+        key = (self.selected, capdu.marshal())
+        if key not in self.cache:
+            try:
+                self.cache[key] = super().exchange(capdu)
+            except ErrorResponse as e:
+                self.cache[key] = e
+        else:
+            self.log.debug("Cached response for %r", capdu)
+
+        res = self.cache[key]
+        if isinstance(res, ErrorResponse):
+            raise res
+        return res
+
+    def _select(self, capdu):
+        command = capdu.marshal()
+        if command == self.selected:
+            self.log.debug("Already selected: %r", capdu)
+            return self.selected_response
+
+        # If the selection fails, the selected file is unknown
+        self.selected = None
+        res = super().exchange(capdu)
+        self.selected = command
+        self.selected_response = res
+        return res
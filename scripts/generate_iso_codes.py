@@ -0,0 +1,48 @@
+""" Generate emv/protocol/iso_codes.py from pycountry's ISO 3166 and ISO 4217 data.
+
+    Run from the repository root after upgrading pycountry, with the version pinned
+    in setup.py installed:
+
+        python scripts/generate_iso_codes.py
+"""
+from os import path
+from importlib.metadata import version as package_version
+import pycountry
+
+OUTPUT = path.join(path.dirname(__file__), "..", "emv", "protocol", "iso_codes.py")
+
+HEADER = '''""" ISO 3166-1 country and ISO 4217 currency codes, keyed by their numeric code.
+
+    This file is generated by scripts/generate_iso_codes.py from pycountry %s,
+    do not edit it by hand.
+"""
+'''
+
+
+def table(name, entries):
+    lines = ["%s = {" % name]
+    for numeric, alpha in sorted(entries):
+        lines.append('    %d: "%s",' % (numeric, alpha))
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def generate():
+    countries = [(int(c.numeric), c.alpha_2) for c in pycountry.countries]
+    currencies = [(int(c.numeric), c.alpha_3) for c in pycountry.currencies]
+    # Older releases of pycountry don't have __version__
+    version = getattr(pycountry, "__version__", None) or package_version("pycountry")
+    return "\n".join(
+        [
+            HEADER % version,
+            "# Numeric code -> alpha-2 code",
+            table("COUNTRIES", countries),
+            "# Numeric code -> alpha-3 code",
+            table("CURRENCIES", currencies),
+        ]
+    )
+
+
+if __name__ == "__main__":
+    with open(OUTPUT, "w") as f:
+        f.write(generate())
@@ -27,7 +27,7 @@ setup(
         "Programming Language :: Python :: 3",
     ],
     keywords="smartcard emv payment",
-    python_requires=">=3.4",
+    python_requires=">=3.7",
     packages=["emv", "emv.protocol", "emv.command"],
     install_requires=[
         "pyscard==2.0.0",
@@ -35,5 +35,6 @@ setup(
         "terminaltables==3.1.0",
         "click==7.1.2",
     ],
+    extras_require={"numpy": ["numpy"]},
     entry_points={"console_scripts": {"emvtool=emv.command.client:run"}},
 )